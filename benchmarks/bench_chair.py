@@ -0,0 +1,110 @@
+"""
+Benchmark: a whole chair without hardware (scene transition latency, throughput and CPU per service).
+
+Starts the fake broker, VLC and Novastar endpoints and the five services (videoplayer, i2c with
+fake MCP23017s, wled, novastar, webui) as separate processes on a generated config. Then it
+presses the "next" button of the fake input expander repeatedly and reports:
+
+* the time from the button press until the traced control message arrives on the broker,
+* the p50/p95/p99 latency of every traced hop (control_sent ... outputs_applied),
+* the MQTT messages per second through the broker and the CPU usage of each service.
+
+Exits with an error if the p95 of an outputs_applied hop exceeds --budget-ms.
+
+Usage: python benchmarks/bench_chair.py [--presses 20] [--interval 1.0] [--budget-ms 100]
+"""
+
+import argparse
+import os
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from fake_broker import FakeBroker  # noqa: E402
+from sim_chair import SERVICES, Observer, SimulatedChair  # noqa: E402
+from tracing import format_report, percentile  # noqa: E402
+
+BASE_TOPIC = "exchair"
+# Address and pin of the "next" button in the generated config and the GPIO its interrupt line is wired to
+NEXT_BUTTON = (0x27, 2)
+INTERRUPT_GPIO = 17
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--presses', type=int, default=20, help="Number of 'next' button presses")
+    parser.add_argument('--interval', type=float, default=1.0, help="Seconds between two presses")
+    parser.add_argument('--keyframes', type=int, default=5, help="Profiles per scene")
+    parser.add_argument('--step', type=float, default=0.2, help="Seconds between two profiles of a scene")
+    parser.add_argument('--budget-ms', type=float, default=0,
+                        help="Fail if the p95 of an outputs_applied hop exceeds this (0: no budget)")
+    parser.add_argument('--interrupts', action='store_true',
+                        help="Wire the interrupt line of the button expander instead of polling it")
+    parser.add_argument('--keep', action='store_true', help="Keep the working directory with the service logs")
+    args = parser.parse_args()
+
+    broker = FakeBroker().start()
+    observer = Observer("127.0.0.1", broker.port)
+    chair = SimulatedChair("127.0.0.1", broker.port, BASE_TOPIC, keyframes=args.keyframes, step=args.step,
+                           interrupts={NEXT_BUTTON[0]: INTERRUPT_GPIO} if args.interrupts else None).start()
+    try:
+        if not observer.wait_online([BASE_TOPIC]):
+            print(f"Services did not come online (online: {', '.join(sorted(observer.online.get(BASE_TOPIC, ())))}), "
+                  f"see the logs in {chair.directory}")
+            args.keep = True
+            return 1
+        # Let the output nodes sync their scene clock, traces of unsynced nodes are dropped
+        time.sleep(2)
+
+        start = time.monotonic()
+        start_cpu = chair.cpu_seconds()
+        start_messages = broker.stats["messages"]
+
+        presses = []
+        for _ in range(args.presses):
+            presses.append(time.monotonic())
+            chair.press(*NEXT_BUTTON)
+            time.sleep(args.interval)
+
+        elapsed = time.monotonic() - start
+        cpu = {service: seconds - start_cpu[service] for service, seconds in chair.cpu_seconds().items()}
+        messages = broker.stats["messages"] - start_messages
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{chair.webui_port}/metrics", timeout=5) as response:
+            metric_lines = sum(1 for line in response.read().decode().splitlines() if not line.startswith("#"))
+    finally:
+        chair.stop(observer, keep=args.keep)
+        observer.stop()
+        broker.stop()
+
+    # Presses and control messages happen in order, one at a time
+    control_times = [received for received, _ in observer.controls.get(BASE_TOPIC, [])]
+    press_latencies = [received - pressed for pressed, received in zip(presses, control_times) if received > pressed]
+    print(f"{len(presses)} presses, {len(control_times)} control messages")
+    if press_latencies:
+        print(f"button press -> control message: p50 {percentile(press_latencies, 0.5) * 1000:.1f} ms, "
+              f"p95 {percentile(press_latencies, 0.95) * 1000:.1f} ms")
+    print()
+    rows = observer.traces.report()
+    budget = args.budget_ms / 1000 if args.budget_ms else float('inf')
+    print(format_report(rows, budget))
+    print()
+    print(f"broker: {messages / elapsed:.1f} messages/s, webui /metrics: {metric_lines} samples")
+    print(f"fake devices: {len(chair.vlc.received)} VLC commands, {len(chair.novastar.received)} Novastar frames "
+          f"({chair.novastar.invalid} invalid)")
+    for service in SERVICES:
+        print(f"{service:12s} CPU {cpu[service] / elapsed * 100:5.1f}%")
+    if args.keep:
+        print(f"Service logs: {chair.directory}")
+
+    over_budget = [row['hop'] for row in rows if row['hop'].endswith(":outputs_applied") and row['p95'] > budget]
+    if over_budget:
+        print(f"Over the {args.budget_ms:.0f} ms budget: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Benchmark: /get_current_scene request latency with and without the config cache.
+
+Serves the webui through Flask's test client against a generated config, with a
+node stand-in that only carries the MQTT message history the route reads.
+
+Usage: python benchmarks/bench_config_cache.py [--scenes 50] [--requests 200]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from configs import generate_config, write_config  # noqa: E402
+
+
+def measure(client, requests):
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get('/get_current_scene')
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    latencies.sort()
+    return statistics.mean(latencies), latencies[int(len(latencies) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenes', type=int, default=50, help="scenes in the generated config")
+    parser.add_argument('--requests', type=int, default=200, help="requests per run")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="piexpchair_bench_")
+    write_config(directory, generate_config(scenes=args.scenes))
+    os.chdir(directory)
+
+    import logging
+    import piexpchair
+    import webui
+    from message_history import MessageHistory
+
+    last_messages = MessageHistory()
+    last_messages.add("exchair/videoplayer/scene", b"3")
+    webui.pxc = types.SimpleNamespace(
+        logger=logging,
+        mqtt_config={'base_topic': "exchair"},
+        last_messages=last_messages,
+    )
+    client = webui.app.test_client()
+
+    print(f"{'cache':>8} {'mean ms':>9} {'p95 ms':>9}")
+    for enabled in (False, True):
+        piexpchair.config_cache.enabled = enabled
+        mean, p95 = measure(client, args.requests)
+        print(f"{'on' if enabled else 'off':>8} {mean * 1000:>9.3f} {p95 * 1000:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark: config load time at service startup.
+
+Times YAML parsing (pure Python vs. libyaml loader) and config validation
+(schema library vs. compiled schema) for generated configs of growing size.
+
+Usage: python benchmarks/bench_config_validation.py [--sizes 10,100,1000] [--keyframes 10]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import yaml  # noqa: E402
+
+from configs import generate_config, write_config  # noqa: E402
+from piexpchair import YamlLoader, config_schema  # noqa: E402
+from schema_compiler import CompiledSchema  # noqa: E402
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def load_yaml(path, loader):
+    with open(path, 'r') as file:
+        return yaml.load(file, Loader=loader)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default="10,100,1000", help="comma separated scene counts")
+    parser.add_argument('--keyframes', type=int, default=10, help="profiles per scene")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="piexpchair_bench_")
+    path = os.path.join(directory, "config", "config.yaml")
+
+    compile_time, compiled_schema = timed(CompiledSchema, config_schema)
+    print(f"Compiling config_schema took {compile_time * 1000:.2f} ms")
+    print(f"{'scenes':>7} {'yaml ms':>9} {'libyaml ms':>11} {'schema ms':>10} {'compiled ms':>12} {'speedup':>8}")
+    for scenes in (int(size) for size in args.sizes.split(",")):
+        write_config(directory, generate_config(scenes=scenes, keyframes=args.keyframes))
+
+        yaml_time, config_data = timed(load_yaml, path, yaml.SafeLoader)
+        libyaml_time, _ = timed(load_yaml, path, YamlLoader)
+        schema_time, _ = timed(config_schema.validate, config_data)
+        compiled_time, _ = timed(compiled_schema.validate, config_data)
+
+        print(f"{scenes:>7} {yaml_time * 1000:>9.1f} {libyaml_time * 1000:>11.1f} {schema_time * 1000:>10.1f} "
+              f"{compiled_time * 1000:>12.2f} {schema_time / compiled_time:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
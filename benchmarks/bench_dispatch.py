@@ -0,0 +1,128 @@
+"""
+Benchmark: per-message cost of the MQTT topic dispatch.
+
+Pushes synthetic messages through a replica of the former on_message if/elif chains
+(base class plus output node override) and through the TopicDispatcher.
+
+Usage: python benchmarks/bench_dispatch.py [--messages 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter, namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from dispatch import TopicDispatcher  # noqa: E402
+
+
+Message = namedtuple('Message', ['topic', 'payload'])
+
+MQTT_CONFIG = {'base_topic': "exchair"}
+OUTPUT_SET_TOPIC = "output/set/i2c"
+
+
+class Handlers:
+    def __init__(self):
+        self.calls = Counter()
+
+    def command(self, name):
+        self.calls[name] += 1
+
+    def output_set(self, name, value):
+        self.calls["output_set"] += 1
+
+    def scene(self, index):
+        self.calls["scene"] += 1
+
+    def idle(self):
+        self.calls["idle"] += 1
+
+
+def legacy_on_message(handlers, msg):
+    """Replica of PiExpChair.on_message plus the I2cController.on_message override."""
+    if msg.topic == f"{MQTT_CONFIG['base_topic']}/control":
+        payload = msg.payload.decode()
+        if payload in ("quit", "play", "stop", "next", "prev", "shutdown"):
+            handlers.command(payload)
+        elif "play_single_" in payload:
+            handlers.command("play_single")
+    elif msg.topic.startswith(f"{MQTT_CONFIG['base_topic']}/{OUTPUT_SET_TOPIC}/"):
+        output_name = msg.topic[len(f"{MQTT_CONFIG['base_topic']}/{OUTPUT_SET_TOPIC}/"):]
+        handlers.output_set(output_name, msg.payload.decode())
+
+    if msg.topic == f"{MQTT_CONFIG['base_topic']}/videoplayer/scene":
+        payload = msg.payload.decode()
+        if payload != "":
+            handlers.scene(int(payload))
+    elif msg.topic == f"{MQTT_CONFIG['base_topic']}/videoplayer/idle":
+        handlers.idle()
+
+
+def build_dispatcher(handlers):
+    base_topic = MQTT_CONFIG['base_topic']
+    commands = {name: name for name in ("quit", "play", "stop", "next", "prev", "shutdown")}
+
+    def on_control(payload, msg):
+        command = commands.get(payload)
+        if command:
+            handlers.command(command)
+        elif payload.startswith("play_single_"):
+            handlers.command("play_single")
+
+    dispatcher = TopicDispatcher()
+    dispatcher.add(f"{base_topic}/control", on_control)
+    dispatcher.add_prefix(f"{base_topic}/{OUTPUT_SET_TOPIC}", lambda name, payload, msg: handlers.output_set(name, payload))
+    dispatcher.add(f"{base_topic}/videoplayer/scene", lambda payload, msg: payload and handlers.scene(int(payload)))
+    dispatcher.add(f"{base_topic}/videoplayer/idle", lambda payload, msg: handlers.idle())
+    return dispatcher
+
+
+def dispatch_on_message(dispatcher, msg):
+    handler = dispatcher.resolve(msg.topic)
+    if handler:
+        handler(msg.payload.decode(), msg)
+
+
+def synthetic_messages(count):
+    mix = [Message("exchair/control", b"next"), Message("exchair/control", b"play_single_3"),
+           Message("exchair/videoplayer/scene", b"2"), Message("exchair/videoplayer/idle", b"True"),
+           Message("exchair/videoplayer/scene_remaining", b"12"), Message("exchair/i2c/profile", b"1"),
+           Message("exchair/output/notify/i2c/fan1", b"True")]
+    mix += [Message(f"exchair/output/set/i2c/output{i}", b"1") for i in range(5)]
+    return [mix[i % len(mix)] for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100000, help="synthetic messages per run")
+    args = parser.parse_args()
+
+    messages = synthetic_messages(args.messages)
+
+    legacy_handlers = Handlers()
+    start = time.perf_counter()
+    for msg in messages:
+        legacy_on_message(legacy_handlers, msg)
+    legacy = time.perf_counter() - start
+
+    handlers = Handlers()
+    dispatcher = build_dispatcher(handlers)
+    start = time.perf_counter()
+    for msg in messages:
+        dispatch_on_message(dispatcher, msg)
+    dispatched = time.perf_counter() - start
+
+    if legacy_handlers.calls != handlers.calls:
+        print(f"Handler calls differ: {legacy_handlers.calls} != {handlers.calls}")
+        sys.exit(1)
+
+    print(f"{'path':>10} {'total ms':>10} {'us/msg':>8}")
+    print(f"{'legacy':>10} {legacy * 1000:>10.1f} {legacy / len(messages) * 1e6:>8.3f}")
+    print(f"{'dispatch':>10} {dispatched * 1000:>10.1f} {dispatched / len(messages) * 1e6:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+"""
+Benchmark: I2C bus transactions and time of the i2c node on the fake hardware.
+
+Runs the I2cController in process on the fake MCP23017s of fake_hardware.py (every register
+access takes SIM_I2C_LATENCY seconds) and counts the bus transactions of its hot paths:
+
+* input scan: one pin.value read per input (former scan) vs. one GPIOA/GPIOB read per chip
+* keyframe outputs: one read-modify-write per output pin (former writes) vs. one port write
+  per chip, for the I2C outputs of the profiles of a generated scene
+* Arduino outputs: one legacy two byte frame per channel vs. one batch frame per Arduino
+* output/set burst: a webui slider spamming output/set for an Arduino channel and an I2C output
+  (from a second thread, like the MQTT thread) while the main loop scans the inputs: bus writes
+  per message, as pending writes to the same port or Arduino coalesce in the bus worker queue,
+  and the mean queue wait per priority
+* input modes: the main loop with polled inputs vs. interrupt driven inputs (INTA/INTB wired to
+  a fake GPIO) while the "next" button is pressed repeatedly: bus transactions and wakeups per
+  second, latency from the press until the node handles it and missed presses
+* gestures: bouncing presses (without and with debounce), long presses and double presses of
+  the "next" button in interrupt mode: commands sent per gesture and the latency from the
+  decisive edge (or the end of the long press time) until the command is sent; a single press
+  of a button with a double press waits for the double press window
+* offline Arduino: the main loop with polled inputs while a second thread changes all Arduino
+  channels every 100 ms and one Arduino is dropped off the bus, with and without quarantine:
+  input scans per second, longest gap between two scans and the time until the quarantine ends
+  once the Arduino is back
+* scan modes: the adaptive scan rate of the polled inputs right after activity, during a scene
+  and after a long idle period: input scans and CPU seconds per second while nothing happens and
+  the worst latency of a press arriving in that mode (the former scan ran at 100 Hz all the time)
+* bus monitor: the main loop with polled inputs while a second thread applies a profile every
+  100 ms: transactions, bytes and busy time per address as reported by the node's bus monitor
+  (transactions cross-checked against the fake bus) and the utilisation at 100 and 400 kHz
+
+Usage: python benchmarks/bench_i2c_bus.py [--scans 1000] [--keyframes 1000] [--arduinos 2] [--channels 8]
+                                          [--messages 1000] [--seconds 3] [--press-ms 50] [--gestures 5]
+                                          [--offline-seconds 3] [--mode-presses 10]
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import fake_hardware  # noqa: E402
+from bus_worker import BACKGROUND, PRIORITY_NAMES  # noqa: E402
+from configs import generate_config, write_config  # noqa: E402
+from fake_broker import FakeBroker  # noqa: E402
+from metrics import registry as metrics  # noqa: E402
+from tracing import percentile  # noqa: E402
+
+# Address and pin of the "next" button in the generated config and the GPIO its interrupt line is wired to
+NEXT_BUTTON = (0x27, 2)
+INTERRUPT_GPIO = 17
+
+
+def start_controller(config):
+    """I2cController on the fake hardware, in a working directory with the given config."""
+    broker = FakeBroker().start()
+    directory = tempfile.mkdtemp(prefix="bench_i2c_bus_")
+    write_config(directory, config, host="127.0.0.1", port=broker.port)
+    os.chdir(directory)
+    fake_hardware.install(config['i2c'].get('interrupts'),
+                          {device['address']: True for device in config['i2c']['arduino_devices'].values()})
+
+    from i2c import I2cController, get_i2c_bus
+    controller = I2cController()
+    if controller.terminate:
+        sys.exit("I2cController failed to start")
+    return controller, get_i2c_bus()
+
+
+def transactions(bus):
+    return sum(count for key, count in bus.stats.items() if isinstance(key, tuple))
+
+
+def transactions_per_address(bus):
+    counted = Counter()
+    for key, count in bus.stats.items():
+        if isinstance(key, tuple):
+            counted[key[0]] += count
+    return counted
+
+
+def measure(bus, function, repeats):
+    """Bus transactions and seconds per call of function."""
+    before = transactions(bus)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    elapsed = time.perf_counter() - start
+    return (transactions(bus) - before) / repeats, elapsed / repeats
+
+
+def legacy_pins(controller, kind):
+    """Pin objects of the former per pin access, {name: pin} of the "input" or "output" config."""
+    return {name: controller.mcp[pin['address']].get_pin(pin['pin'])
+            for name, pin in controller.config['i2c'][kind].items()}
+
+
+def legacy_scan(controller, pins):
+    """Replica of the former input scan: one register read per input."""
+    for input_name, pin in pins.items():
+        current_value = pin.value
+        if current_value != controller.input_states[input_name]:
+            controller.input_states[input_name] = current_value
+
+
+def legacy_outputs(pins, shadow, states):
+    """Replica of the former output writes: pin.value per changed output (register read and write)."""
+    for output_name, state in states.items():
+        if shadow.get(output_name) != state:
+            pins[output_name].value = state
+            shadow[output_name] = state
+
+
+def queue_waits():
+    """(Sum of the waits, number of requests) in the bus worker queue per priority name."""
+    with metrics.lock:
+        return {name: tuple(metrics.histograms.get(("i2c_queue_seconds", (("priority", name),)), (None, 0.0, 0))[1:])
+                for name in PRIORITY_NAMES}
+
+
+def run_burst(controller, bus, messages):
+    """
+    Send output/set messages for an Arduino channel and an I2C output from a second thread while
+    the main loop scans the inputs.
+
+    Returns:
+        Bus writes and the (sum of the waits, number of requests) per priority during the burst
+    """
+    arduino_name, output_name = next(iter(controller.arduino_devices)), next(iter(controller.output_pins))
+
+    def slider():
+        for index in range(messages):
+            controller.output_set(arduino_name, index % 256)
+            controller.output_set(output_name, index % 2)
+
+    waits = queue_waits()
+    writes = sum(count for key, count in bus.stats.items() if isinstance(key, tuple) and key[1] == "write")
+    sender = threading.Thread(target=slider)
+    sender.start()
+    while sender.is_alive():
+        controller.module_run()
+    # Runs after the queued writes
+    controller.bus.submit(BACKGROUND, lambda: None).result()
+    controller.module_run()
+    writes = sum(count for key, count in bus.stats.items() if isinstance(key, tuple) and key[1] == "write") - writes
+    return writes, {name: (total - waits[name][0], count - waits[name][1])
+                    for name, (total, count) in queue_waits().items()}
+
+
+def run_presses(controller, bus, seconds, interval, press_time):
+    """
+    Run the main loop while pressing the "next" button every interval seconds.
+
+    Returns:
+        Bus transactions per second, loop wakeups per second and the press latencies (None for missed presses)
+    """
+    mcp = bus.devices[NEXT_BUTTON[0]]
+    handled = []
+    # Only record the press, do not send control commands
+    controller.handle_button_press = lambda input_name: handled.append(time.monotonic())
+    loop = threading.Thread(target=controller.run)
+    loop.start()
+    time.sleep(0.5)
+
+    start = time.monotonic()
+    start_transactions, start_wakeups = transactions(bus), controller.scheduler.wakeups
+    pressed = []
+    while time.monotonic() - start < seconds:
+        pressed.append(time.monotonic())
+        handled_before = len(handled)
+        mcp.set_input(NEXT_BUTTON[1], False)
+        time.sleep(press_time)
+        mcp.set_input(NEXT_BUTTON[1], None)
+        time.sleep(interval - press_time)
+        if len(handled) == handled_before:
+            handled.append(None)
+    elapsed = time.monotonic() - start
+    rates = ((transactions(bus) - start_transactions) / elapsed, (controller.scheduler.wakeups - start_wakeups) / elapsed)
+
+    controller.quit()
+    controller.scheduler.wake()
+    loop.join()
+    return rates, [done - press if done else None for press, done in zip(pressed, handled)]
+
+
+def bouncy_press(mcp, pin, hold, bounces=3, bounce_time=0.001):
+    """Press a button whose contact bounces before it settles, returns the time of the first edge."""
+    pressed = time.monotonic()
+    for _ in range(bounces):
+        mcp.set_input(pin, False)
+        time.sleep(bounce_time)
+        mcp.set_input(pin, None)
+        time.sleep(bounce_time)
+    mcp.set_input(pin, False)
+    time.sleep(hold)
+    mcp.set_input(pin, None)
+    return pressed
+
+
+def run_gestures(controller, bus, repeats, kinds):
+    """
+    Run the main loop and perform each of the gestures kinds on the "next" button repeats times.
+
+    Returns:
+        {gesture: (commands sent per gesture, latencies)}
+    """
+    mcp = bus.devices[NEXT_BUTTON[0]]
+    pin = NEXT_BUTTON[1]
+    handled = []
+    controller.handle_button_press = lambda command: handled.append((command, time.monotonic()))
+    loop = threading.Thread(target=controller.run)
+    loop.start()
+    time.sleep(0.5)
+
+    gestures = controller.input_gestures["next"]
+    results = {}
+    for gesture in kinds:
+        commands, latencies = [], []
+        for _ in range(repeats):
+            before = len(handled)
+            if gesture == "press":
+                decisive = bouncy_press(mcp, pin, 0.05)
+            elif gesture == "long_press":
+                decisive = bouncy_press(mcp, pin, gestures.long_press + 0.1) + gestures.long_press
+            else:
+                bouncy_press(mcp, pin, 0.05)
+                time.sleep(0.05)
+                decisive = bouncy_press(mcp, pin, 0.05)
+            # Past the double press window of the last press
+            time.sleep((gestures.double_press or 0) + 0.3)
+            commands += [command for command, _ in handled[before:]]
+            if len(handled) > before:
+                latencies.append(handled[before][1] - decisive)
+        results[gesture] = (commands, latencies)
+
+    controller.quit()
+    controller.scheduler.wake()
+    loop.join()
+    return results
+
+
+def run_offline(controller, bus, seconds, channels):
+    """
+    Run the main loop with polled inputs, take the first Arduino off the bus for seconds and bring it back.
+
+    Returns:
+        Input scans per second and the longest gap between two scans while it was offline, seconds from
+        coming back until the quarantine ended (None if it was not quarantined)
+    """
+    address = min(bus.arduinos())
+    scans = []
+    read_port = controller._read_port
+
+    def timed_read_port(address):
+        scans.append(time.monotonic())
+        return read_port(address)
+
+    controller._read_port = timed_read_port
+    loop = threading.Thread(target=controller.run)
+    loop.start()
+    stop = threading.Event()
+
+    def profiles():
+        for keyframe in itertools.count():
+            if stop.wait(0.1):
+                return
+            controller.apply_scene_outputs({'arduino_outputs': {name: (keyframe + index) % 256
+                                                                for index, name in enumerate(channels)}})
+
+    writer = threading.Thread(target=profiles)
+    writer.start()
+    time.sleep(0.5)
+
+    bus.offline.add(address)
+    start = time.monotonic()
+    time.sleep(seconds)
+    offline = [scan for scan in scans if scan >= start]
+    gaps = [after - before for before, after in zip(offline, offline[1:])]
+    bus.offline.discard(address)
+    back = time.monotonic()
+    recovered = None
+    if not controller.device_health.available(address):
+        while not controller.device_health.available(address) and time.monotonic() - back < 60:
+            time.sleep(0.01)
+        recovered = time.monotonic() - back
+
+    stop.set()
+    writer.join()
+    controller.quit()
+    controller.scheduler.wake()
+    loop.join()
+    return len(offline) / seconds, max(gaps), recovered
+
+
+def enter_scan_mode(controller, mode):
+    """Put the chair into the state of a scan mode: recent activity, a scene playing or a long idle period."""
+    from i2c import SCAN_ACTIVE_HOLD, SCAN_IDLE_BACKOFF
+    now = time.monotonic()
+    controller.in_scene = mode == "scene"
+    controller.last_activity = {"active": now, "scene": now - SCAN_ACTIVE_HOLD,
+                                "idle": now - SCAN_IDLE_BACKOFF}[mode]
+    controller.scheduler.wake()
+
+
+def run_scan_modes(controller, bus, seconds, presses, press_time):
+    """
+    Run the main loop with polled inputs in each scan mode.
+
+    Returns:
+        {mode: (input scans per second, CPU seconds per second, press latencies)}
+    """
+    mcp = bus.devices[NEXT_BUTTON[0]]
+    scans = []
+    read_port = controller._read_port
+
+    def counted_read_port(address):
+        scans.append(time.monotonic())
+        return read_port(address)
+
+    controller._read_port = counted_read_port
+    handled = []
+    controller.handle_button_press = lambda command: handled.append(time.monotonic())
+    loop = threading.Thread(target=controller.run)
+    loop.start()
+    time.sleep(0.5)
+
+    results = {}
+    for mode in ("active", "scene", "idle"):
+        enter_scan_mode(controller, mode)
+        time.sleep(0.2)
+        before, cpu = len(scans), time.process_time()
+        time.sleep(seconds)
+        rate, cpu_rate = (len(scans) - before) / seconds, (time.process_time() - cpu) / seconds
+
+        latencies = []
+        for press in range(presses):
+            enter_scan_mode(controller, mode)
+            # Presses land anywhere between two scans
+            time.sleep(0.2 + press * 0.0037)
+            handled_before = len(handled)
+            pressed = time.monotonic()
+            mcp.set_input(NEXT_BUTTON[1], False)
+            time.sleep(press_time)
+            mcp.set_input(NEXT_BUTTON[1], None)
+            time.sleep(0.1)
+            latencies.append(handled[handled_before] - pressed if len(handled) > handled_before else None)
+        results[mode] = (rate, cpu_rate, latencies)
+
+    controller.quit()
+    controller.scheduler.wake()
+    loop.join()
+    return results
+
+
+def run_monitor(controller, bus, seconds, profiles):
+    """
+    Run the main loop with polled inputs while a second thread applies the next profile every 100 ms.
+
+    Returns:
+        Bus monitor report of the run and the transactions per address counted by the fake bus
+    """
+    loop = threading.Thread(target=controller.run)
+    loop.start()
+    stop = threading.Event()
+
+    def apply_profiles():
+        for profile in profiles:
+            if stop.wait(0.1):
+                return
+            controller.apply_scene_outputs(profile)
+
+    writer = threading.Thread(target=apply_profiles)
+    writer.start()
+    time.sleep(0.5)
+
+    controller.bus_monitor.report()
+    before = transactions_per_address(bus)
+    time.sleep(seconds)
+    report = controller.bus_monitor.report()
+    counted = transactions_per_address(bus) - before
+    stop.set()
+    writer.join()
+    controller.quit()
+    controller.scheduler.wake()
+    loop.join()
+    return report, {hex(address): count / report['seconds'] for address, count in counted.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scans', type=int, default=1000, help="Input scans per variant")
+    parser.add_argument('--keyframes', type=int, default=1000, help="Keyframes per output variant")
+    parser.add_argument('--arduinos', type=int, default=2, help="Number of Arduino devices")
+    parser.add_argument('--channels', type=int, default=8, help="Output channels per Arduino")
+    parser.add_argument('--messages', type=int, default=1000, help="output/set messages per output in the burst")
+    parser.add_argument('--seconds', type=float, default=3, help="Main loop run time per input mode")
+    parser.add_argument('--press-ms', type=float, default=50, help="Duration of a button press")
+    parser.add_argument('--gestures', type=int, default=5, help="Repeats per gesture")
+    parser.add_argument('--mode-presses', type=int, default=10, help="Presses per scan mode")
+    parser.add_argument('--offline-seconds', type=float, default=3, help="Time the Arduino is off the bus")
+    args = parser.parse_args()
+
+    # The interrupt lines are driven by the fake expanders
+    os.environ['GPIO_BACKEND'] = "fake"
+    config = generate_config(scenes=1, keyframes=4)
+    channels = [f"arduino{device}_{pin}" for device in range(args.arduinos) for pin in range(args.channels)]
+    config['i2c']['arduino_devices'] = {name: {"address": 0x20 + index // args.channels, "pin": index % args.channels}
+                                        for index, name in enumerate(channels)}
+    config['idle']['arduino_outputs'] = {name: 0 for name in channels}
+    controller, bus = start_controller(config)
+
+    input_pins, output_pins = legacy_pins(controller, 'input'), legacy_pins(controller, 'output')
+    print(f"{len(input_pins)} inputs on {len(controller.input_groups)} MCP23017, "
+          f"{fake_hardware.I2C_LATENCY * 1e6:.0f} us per transaction")
+    print(f"{'input scan':24s} {'transactions':>12s} {'ms/scan':>9s}")
+    for name, function in (("per pin (former)", lambda: legacy_scan(controller, input_pins)),
+                           ("per chip", controller.module_run)):
+        count, seconds = measure(bus, function, args.scans)
+        print(f"{name:24s} {count:12.1f} {seconds * 1000:9.3f}")
+
+    # I2C outputs of the profiles only, the Arduino outputs have their own protocol
+    profiles = [{'i2c_outputs': profile['i2c_outputs']} for profile in config['scenes'][0]['timed_outputs']]
+    profiles.append({'i2c_outputs': config['idle']['i2c_outputs']})
+    changed = sum(sum(1 for name, state in profile['i2c_outputs'].items() if previous['i2c_outputs'][name] != state)
+                  for profile, previous in zip(profiles, profiles[-1:] + profiles[:-1])) / len(profiles)
+    legacy_shadow = {}
+    legacy_profiles = itertools.cycle(profiles)
+    batched_profiles = itertools.cycle(profiles)
+    print(f"\n{'keyframe outputs':24s} {'transactions':>12s} {'ms/keyframe':>11s}   ({changed:.1f} changed outputs per keyframe)")
+    for name, function in (("per pin (former)",
+                            lambda: legacy_outputs(output_pins, legacy_shadow, next(legacy_profiles)['i2c_outputs'])),
+                           ("per chip", lambda: controller.apply_scene_outputs(next(batched_profiles)))):
+        count, seconds = measure(bus, function, args.keyframes)
+        print(f"{name:24s} {count:12.1f} {seconds * 1000:11.3f}")
+
+    # Every channel changes on every keyframe
+    arduino_profiles = itertools.cycle([{'arduino_outputs': {name: (keyframe * 10 + index) % 256
+                                                              for index, name in enumerate(channels)}}
+                                        for keyframe in range(4)])
+    print(f"\n{'Arduino outputs':24s} {'transactions':>12s} {'ms/keyframe':>11s}   "
+          f"({args.arduinos} Arduinos with {args.channels} channels)")
+    receivers = bus.arduinos()
+    for name, batch in (("legacy frames", False), ("batch frames", True)):
+        for receiver in receivers.values():
+            receiver.batch = batch
+        # Probe the devices again
+        controller.arduino_protocols.clear()
+        controller.apply_scene_outputs(next(arduino_profiles))
+        count, seconds = measure(bus, lambda: controller.apply_scene_outputs(next(arduino_profiles)), args.keyframes)
+        invalid = sum(receiver.invalid for receiver in receivers.values())
+        print(f"{name:24s} {count:12.1f} {seconds * 1000:11.3f}" + (f"   {invalid} invalid frames" if invalid else ""))
+
+    writes, waits = run_burst(controller, bus, args.messages)
+    print(f"\n{'output/set burst':24s} {'messages':>8s} {'bus writes':>10s}   mean queue wait ms per priority")
+    print(f"{'slider':24s} {2 * args.messages:8d} {writes:10d}   " +
+          ", ".join(f"{name} {total / count * 1000:.3f}" for name, (total, count) in waits.items() if count))
+
+    print(f"\n{'input mode':24s} {'transactions/s':>14s} {'wakeups/s':>9s} {'p50 ms':>7s} {'max ms':>7s} {'missed':>6s}")
+    for mode in ("poll", "interrupt"):
+        if mode == "interrupt":
+            config['i2c']['interrupts'] = {NEXT_BUTTON[0]: INTERRUPT_GPIO}
+            controller, bus = start_controller(config)
+            if controller.interrupt_backend is None:
+                sys.exit("Interrupt mode did not start")
+        (transaction_rate, wakeup_rate), latencies = run_presses(controller, bus, args.seconds, 0.25,
+                                                                 args.press_ms / 1000)
+        handled = [latency for latency in latencies if latency is not None]
+        print(f"{mode:24s} {transaction_rate:14.1f} {wakeup_rate:9.1f} {percentile(handled, 0.5) * 1000:7.2f} "
+              f"{max(handled) * 1000:7.2f} {len(latencies) - len(handled):6d}")
+
+    print(f"\n{'button':12s} {'gesture':12s} {'expected':9s} {'commands sent':16s} {'p50 ms':>7s}")
+    for name, debounce, gestures in (("no debounce", 0, False), ("debounced", 20, False), ("gestures", 20, True)):
+        config['i2c']['input']['next'] = {"address": NEXT_BUTTON[0], "pin": NEXT_BUTTON[1], "debounce_ms": debounce}
+        if gestures:
+            config['i2c']['input']['next'].update(long_press="stop", double_press="prev")
+        controller, bus = start_controller(config)
+        kinds = ("press", "long_press", "double_press") if gestures else ("press",)
+        for gesture, (commands, latencies) in run_gestures(controller, bus, args.gestures, kinds).items():
+            expected = {"press": "next", "long_press": "stop", "double_press": "prev"}[gesture]
+            sent = ", ".join(f"{count}x {command}" for command, count in sorted(Counter(commands).items()))
+            print(f"{name:12s} {gesture.replace('_', ' '):12s} {f'{args.gestures}x {expected}':9s} {sent:16s} "
+                  f"{percentile(latencies, 0.5) * 1000:7.2f}")
+
+
+    print(f"\n{'offline Arduino':24s} {'scans/s':>7s} {'max gap ms':>10s} {'recovered after s':>17s}")
+    config['i2c'].pop('interrupts')
+    for name, failures in (("without quarantine", None), ("quarantine", 2)):
+        controller, bus = start_controller(config)
+        if failures is None:
+            controller.device_health.failures = float('inf')
+        rate, gap, recovered = run_offline(controller, bus, args.offline_seconds, channels)
+        print(f"{name:24s} {rate:7.1f} {gap * 1000:10.1f} {'-' if recovered is None else f'{recovered:.2f}':>17s}")
+
+
+    print(f"\n{'scan mode':24s} {'scans/s':>7s} {'CPU %':>6s} {'max press ms':>12s} {'missed':>6s}")
+    # Presses fire on their edge
+    config['i2c']['input']['next'] = {"address": NEXT_BUTTON[0], "pin": NEXT_BUTTON[1]}
+    controller, bus = start_controller(config)
+    for mode, (rate, cpu_rate, latencies) in run_scan_modes(controller, bus, args.seconds, args.mode_presses,
+                                                             args.press_ms / 1000).items():
+        handled = [latency for latency in latencies if latency is not None]
+        print(f"{mode:24s} {rate:7.1f} {cpu_rate * 100:6.1f} {max(handled, default=0) * 1000:12.2f} "
+              f"{len(latencies) - len(handled):6d}")
+
+
+    controller, bus = start_controller(config)
+    monitor_profiles = itertools.cycle([dict(profile, **arduino_profile) for profile, arduino_profile
+                                        in zip(profiles, [next(arduino_profiles) for _ in profiles])])
+    report, counted = run_monitor(controller, bus, args.seconds, monitor_profiles)
+    print(f"\n{'bus monitor':24s} {'tx/s':>7s} {'fake tx/s':>9s} {'bytes/s':>8s} {'errors':>6s} {'busy %':>7s}")
+    for address, usage in report['addresses'].items():
+        print(f"{address:24s} {usage['transactions_per_second']:7.1f} {counted.get(address, 0):9.1f} "
+              f"{usage['bytes_per_second']:8.0f} {usage['errors']:6d} {usage['utilisation'] * 100:7.2f}")
+    print(f"{'total at 100 kHz':24s} {'':35s} {report['utilisation'] * 100:7.2f}")
+    print(f"{'total at 400 kHz':24s} {'':35s} {report['utilisation'] * controller.bus_frequency / 400000 * 100:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Benchmark: several simulated chairs on one broker (broker rate, command latency and webui response times).
+
+For every chair count of --chairs it starts that many complete chair stacks (see sim_chair.py),
+each with its own base topic and webui, and drives them like an operator station: every chair
+gets play/next/stop commands through its webui at --rate commands per second, while its
+scene display is polled on /get_current_scene. Per chair count it reports:
+
+* the MQTT messages per second on the broker (counted by a subscriber to everything),
+* the command latency from the webui request until the last output node applied the outputs
+  (taken from the traces, commands without outputs_applied hops count as lost, a negative
+  latency means a command was matched with the wrong trace and fails the run),
+* the webui response times of the commands and of the scene polls,
+* the CPU usage of the services, summed over all chairs.
+
+All chairs share the CPU of this host, so the results are an upper bound for real chairs.
+By default the in-process fake broker is used, --broker host:port measures a real one
+(e.g. mosquitto) instead.
+
+Usage: python benchmarks/bench_load.py [--chairs 1,2,4,8] [--duration 20] [--rate 0.5] [--broker localhost:1883]
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import threading
+import time
+import urllib.request
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from fake_broker import FakeBroker  # noqa: E402
+from sim_chair import Observer, SimulatedChair  # noqa: E402
+from tracing import percentile  # noqa: E402
+
+
+def webui_request(chair, path):
+    """GET a webui path like the player page does, returns the response time in seconds or None on errors."""
+    request = urllib.request.Request(f"http://127.0.0.1:{chair.webui_port}/{path}",
+                                     headers={"X-Requested-With": "XMLHttpRequest"})
+    start = time.monotonic()
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            response.read()
+    except OSError:
+        return None
+    return time.monotonic() - start
+
+
+def drive(chair, commands, rate, poll_rate, offset, end, results):
+    """Send the commands of one chair at the given rate, poll its scene display in between."""
+    next_command = time.monotonic() + offset / rate
+    next_poll = time.monotonic()
+    command_cycle = itertools.cycle(commands)
+    while True:
+        now = time.monotonic()
+        if now >= end:
+            return
+        if now >= next_command:
+            command = next(command_cycle)
+            response_time = webui_request(chair, command)
+            results['commands'].append((chair.base_topic, now, response_time))
+            next_command += 1 / rate
+        elif poll_rate and now >= next_poll:
+            results['polls'].append(webui_request(chair, "get_current_scene"))
+            next_poll += 1 / poll_rate
+        else:
+            time.sleep(min(next_command, next_poll if poll_rate else end, end) - now)
+
+
+def command_latencies(observer, commands):
+    """Command latency until the last outputs_applied hop of its trace, None for lost commands."""
+    sent = {}
+    for base_topic, start, response_time in commands:
+        sent.setdefault(base_topic, []).append(start)
+
+    latencies = []
+    for base_topic, starts in sent.items():
+        # Controls the videoplayer sends itself at the end of a scene are no webui commands
+        controls = [(received, trace_id) for received, trace_id in sorted(observer.controls.get(base_topic, []))
+                    if "videoplayer:control_sent" not in observer.hops(trace_id)]
+        # The commands of one chair are sent one at a time, each is the first control arriving after it was sent
+        position = 0
+        for start in sorted(starts):
+            while position < len(controls) and controls[position][0] < start:
+                position += 1
+            trace_id = None
+            if position < len(controls):
+                trace_id = controls[position][1]
+                position += 1
+            applied = [t for hop, t in observer.hops(trace_id).items() if hop.endswith(":outputs_applied")]
+            latencies.append(max(applied) - start if applied else None)
+    return latencies
+
+
+def run(chair_count, args, broker_host, broker_port):
+    observer = Observer(broker_host, broker_port)
+    chairs = [SimulatedChair(broker_host, broker_port, f"chair{index}", keyframes=args.keyframes, step=args.step)
+              for index in range(chair_count)]
+    for chair in chairs:
+        chair.start()
+    try:
+        if not observer.wait_online([chair.base_topic for chair in chairs], timeout=30 + 2 * chair_count):
+            print(f"{chair_count:6d}  services did not come online, see the logs in "
+                  f"{', '.join(chair.directory for chair in chairs)}")
+            args.keep = True
+            return None
+        # Let the output nodes sync their scene clock, traces of unsynced nodes are dropped
+        time.sleep(2)
+
+        start = time.monotonic()
+        start_cpu = [chair.cpu_seconds() for chair in chairs]
+        start_messages = sum(observer.messages.values())
+        end = start + args.duration
+
+        results = {'commands': [], 'polls': []}
+        drivers = [threading.Thread(target=drive, args=(chair, args.commands, args.rate, args.poll_rate,
+                                                         index / chair_count, end, results))
+                   for index, chair in enumerate(chairs)]
+        for driver in drivers:
+            driver.start()
+        for driver in drivers:
+            driver.join()
+
+        elapsed = time.monotonic() - start
+        messages = sum(observer.messages.values()) - start_messages
+        cpu = Counter()
+        for chair, chair_start_cpu in zip(chairs, start_cpu):
+            for service, seconds in chair.cpu_seconds().items():
+                cpu[service] += seconds - chair_start_cpu[service]
+        # Traces of the last commands
+        time.sleep(1)
+        latencies = command_latencies(observer, results['commands'])
+    finally:
+        for chair in chairs:
+            chair.stop(observer, keep=args.keep)
+        observer.stop()
+
+    completed = [latency for latency in latencies if latency is not None]
+    command_times = [response_time for _, _, response_time in results['commands'] if response_time is not None]
+    poll_times = [response_time for response_time in results['polls'] if response_time is not None]
+    errors = len(results['commands']) + len(results['polls']) - len(command_times) - len(poll_times)
+
+    def ms(values, fraction):
+        return f"{percentile(values, fraction) * 1000:8.1f}" if values else f"{'-':>8s}"
+
+    print(f"{chair_count:6d} {messages / elapsed:10.1f} {len(latencies):8d} {len(latencies) - len(completed):5d} "
+          f"{ms(completed, 0.5)} {ms(completed, 0.95)} {ms(command_times, 0.95)} {ms(poll_times, 0.5)} "
+          f"{ms(poll_times, 0.95)} {errors:6d} {sum(cpu.values()) / elapsed * 100:7.1f}%")
+    negative = [latency for latency in completed if latency < 0]
+    if negative:
+        print(f"{chair_count:6d}  {len(negative)} commands were matched with an earlier trace "
+              f"(latency down to {min(negative) * 1000:.1f} ms)")
+        return None
+    return cpu, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chairs', default="1,2,4,8", help="Comma separated chair counts to measure")
+    parser.add_argument('--duration', type=float, default=20, help="Seconds of load per chair count")
+    parser.add_argument('--rate', type=float, default=0.5, help="Commands per second and chair")
+    parser.add_argument('--commands', default="play,next,next,stop",
+                        help="Comma separated webui commands sent in turn (play, next, prev, stop)")
+    parser.add_argument('--poll-rate', type=float, default=1.0,
+                        help="Scene display polls (/get_current_scene) per second and chair")
+    parser.add_argument('--keyframes', type=int, default=5, help="Profiles per scene")
+    parser.add_argument('--step', type=float, default=0.2, help="Seconds between two profiles of a scene")
+    parser.add_argument('--broker', help="host:port of the MQTT broker to measure (default: in-process fake broker)")
+    parser.add_argument('--keep', action='store_true', help="Keep the working directories with the service logs")
+    args = parser.parse_args()
+    args.commands = args.commands.split(",")
+
+    broker = None
+    if args.broker:
+        broker_host, broker_port = args.broker.rsplit(":", 1)
+        broker_port = int(broker_port)
+    else:
+        broker = FakeBroker().start()
+        broker_host, broker_port = "127.0.0.1", broker.port
+
+    print(f"{args.rate} commands/s and {args.poll_rate} polls/s per chair for {args.duration:.0f} s, "
+          f"broker {broker_host}:{broker_port}")
+    print(f"{'chairs':>6s} {'msg/s':>10s} {'commands':>8s} {'lost':>5s} {'e2e p50':>8s} {'e2e p95':>8s} "
+          f"{'cmd p95':>8s} {'poll p50':>8s} {'poll p95':>8s} {'errors':>6s} {'CPU':>8s}")
+    cpu_per_service = {}
+    try:
+        for chair_count in (int(count) for count in args.chairs.split(",")):
+            result = run(chair_count, args, broker_host, broker_port)
+            if result is None:
+                return 1
+            cpu, elapsed = result
+            cpu_per_service[chair_count] = {service: seconds / elapsed / chair_count for service, seconds in cpu.items()}
+    finally:
+        if broker:
+            broker.stop()
+
+    print("\nCPU per chair and service")
+    services = list(next(iter(cpu_per_service.values())))
+    print(f"{'chairs':>6s} " + " ".join(f"{service:>11s}" for service in services))
+    for chair_count, cpu in cpu_per_service.items():
+        print(f"{chair_count:6d} " + " ".join(f"{cpu[service] * 100:10.1f}%" for service in services))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Benchmark: MQTT message history throughput.
+
+Feeds the message mix a webui (subscribe_to_everything=True) receives into the former
+dict-per-topic history and into the MessageHistory ring buffers, once as fast as possible
+and once paced at a fixed rate, and compares the cost of the latest-scene lookup.
+
+Usage: python benchmarks/bench_message_history.py [--messages 100000] [--rate 1000] [--seconds 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from message_history import MessageHistory  # noqa: E402
+
+
+class LegacyHistory:
+    """The former PiExpChair.log_mqtt_message() and webui lookup."""
+
+    def __init__(self):
+        self.last_messages = {}
+
+    def add(self, topic, payload):
+        if topic not in self.last_messages.keys():
+            self.last_messages[topic] = {}
+        self.last_messages[topic][time.time()] = payload
+        if len(self.last_messages[topic]) > 10:
+            self.last_messages[topic].pop(list(self.last_messages[topic].keys())[0], None)
+
+    def latest(self, topic):
+        last_date = 0.0
+        last_payload = None
+        for date in self.last_messages.get(topic, {}):
+            if date > last_date:
+                last_date = date
+                last_payload = self.last_messages[topic][date]
+        return last_payload
+
+
+class RingHistory:
+    def __init__(self):
+        self.history = MessageHistory(depth=10)
+
+    def add(self, topic, payload):
+        self.history.add(topic, payload)
+
+    def latest(self, topic):
+        record = self.history.latest(topic)
+        return record.payload if record else None
+
+
+def message_mix():
+    topics = ["exchair/videoplayer/scene", "exchair/videoplayer/idle", "exchair/videoplayer/scene_remaining",
+              "exchair/i2c/profile", "exchair/wled/profile", "exchair/novastar/profile"]
+    topics += [f"exchair/output/notify/i2c/output{i}" for i in range(10)]
+    topics += [f"exchair/output/notify/wled/chair/{i}/bri" for i in range(4)]
+    return [(topic, str(i).encode()) for i, topic in enumerate(topics)]
+
+
+def run_burst(history, mix, messages):
+    start = time.perf_counter()
+    for i in range(messages):
+        topic, payload = mix[i % len(mix)]
+        history.add(topic, payload)
+    return messages / (time.perf_counter() - start)
+
+
+def run_paced(history, mix, rate, seconds):
+    interval = 1.0 / rate
+    cpu_start = time.process_time()
+    start = time.monotonic()
+    sent = 0
+    while time.monotonic() - start < seconds:
+        topic, payload = mix[sent % len(mix)]
+        history.add(topic, payload)
+        sent += 1
+        sleep_time = start + sent * interval - time.monotonic()
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+    return (time.process_time() - cpu_start) / seconds * 100
+
+
+def lost_messages(history_class, topic, trials=1000):
+    """Messages overwritten because they arrived within the same clock tick."""
+    lost = 0
+    for _ in range(trials):
+        history = history_class()
+        for i in range(10):
+            history.add(topic, str(i).encode())
+        stored = history.last_messages[topic] if isinstance(history, LegacyHistory) else history.history.history(topic)
+        lost += 10 - len(stored)
+    return lost
+
+
+def time_lookup(history, topic, lookups=10000):
+    start = time.perf_counter()
+    for _ in range(lookups):
+        history.latest(topic)
+    return (time.perf_counter() - start) / lookups * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100000, help="messages for the burst run")
+    parser.add_argument('--rate', type=int, default=1000, help="messages per second for the paced run")
+    parser.add_argument('--seconds', type=float, default=3.0, help="duration of the paced run")
+    args = parser.parse_args()
+
+    mix = message_mix()
+    print(f"{'history':>8} {'burst msg/s':>12} {f'cpu % @ {args.rate}/s':>14} {'lookup us':>10} {'lost':>6}")
+    for name, history_class in (("legacy", LegacyHistory), ("ring", RingHistory)):
+        burst = run_burst(history_class(), mix, args.messages)
+        cpu = run_paced(history_class(), mix, args.rate, args.seconds)
+        history = history_class()
+        run_burst(history, mix, 1000)
+        lookup = time_lookup(history, mix[0][0])
+        lost = lost_messages(history_class, mix[0][0])
+        print(f"{name:>8} {burst:>12.0f} {cpu:>14.2f} {lookup:>10.3f} {lost:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: output notify messages per scene (one message per output vs. snapshots).
+
+Plays all scenes of a config (from idle, back to idle) through a replica of the output nodes'
+notify rules, including the shadow state that skips unchanged outputs, and counts the QoS 1
+messages per scene. With --live it instead counts the messages a running chair publishes on
+output/notify/# and output/snapshot/# (start the services with OUTPUT_NOTIFY=topics,
+snapshot or both to compare).
+
+Usage: python benchmarks/bench_notify_traffic.py [--config config/config.yaml] [--live 60]
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import yaml  # noqa: E402
+
+from configs import generate_config  # noqa: E402
+
+
+def notified_outputs(node, outputs, config):
+    """Output names a node notifies for a profile, as (shadow name, value) pairs."""
+    if node == "i2c":
+        for name, state in outputs.get('i2c_outputs', {}).items():
+            yield name, bool(state)
+        for name, value in outputs.get('arduino_outputs', {}).items():
+            yield name, max(0, min(255, int(value)))
+    elif node == "wled":
+        for device in config['wled']['devices']:
+            for strip, macro in outputs.get('wled_outputs', {}).items():
+                yield f"{device}/{strip}", macro
+    elif node == "novastar" and 'novastar_output' in outputs:
+        yield "video_index", outputs['novastar_output']
+
+
+def count_offline(config):
+    profiles = [config['idle']]
+    for scene in config['scenes']:
+        profiles.extend(sorted(scene['timed_outputs'], key=lambda timed_output: timed_output['start_time']))
+    profiles.append(config['idle'])
+
+    per_output, snapshots = Counter(), Counter()
+    for node in ("i2c", "wled", "novastar"):
+        shadow = {}
+        for outputs in profiles:
+            changed = 0
+            for name, value in notified_outputs(node, outputs, config):
+                if shadow.get(name, object()) != value:
+                    shadow[name] = value
+                    changed += 1
+            per_output[node] += changed
+            snapshots[node] += 1 if changed else 0
+    return per_output, snapshots
+
+
+def count_live(broker_config, seconds):
+    import paho.mqtt.client as mqtt
+
+    with open(broker_config, 'r') as file:
+        broker = yaml.safe_load(file)
+    base_topic = broker['base_topic']
+    counts = Counter()
+
+    def on_message(client, userdata, msg):
+        if msg.topic == f"{base_topic}/videoplayer/scene":
+            counts[("scenes", "videoplayer")] += 1
+            return
+        kind, node = msg.topic[len(base_topic) + 1:].split('/')[1:3]
+        counts[(kind, node)] += 1
+
+    client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                         protocol=mqtt.MQTTProtocolVersion.MQTTv5)
+    if 'user' in broker and 'password' in broker:
+        client.username_pw_set(broker['user'], broker['password'])
+    client.on_message = on_message
+    client.connect(broker['host'], broker['port'])
+    client.subscribe(f"{base_topic}/output/notify/#")
+    client.subscribe(f"{base_topic}/output/snapshot/#")
+    client.subscribe(f"{base_topic}/videoplayer/scene")
+    client.loop_start()
+    time.sleep(seconds)
+    client.loop_stop()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--config', help="config.yaml to play (default: generated config)")
+    parser.add_argument('--live', type=float, help="count the messages of a running chair for n seconds")
+    parser.add_argument('--broker-config', default="config/broker.yaml", help="broker.yaml of the chair (--live)")
+    args = parser.parse_args()
+
+    if args.live:
+        counts = count_live(args.broker_config, args.live)
+        scenes = max(counts.pop(("scenes", "videoplayer"), 0), 1)
+        print(f"{scenes} scenes in {args.live:.0f}s")
+        for (kind, node), count in sorted(counts.items()):
+            print(f"{kind:9s} {node:9s} {count:6d} messages ({count / scenes:.1f} per scene)")
+        return
+
+    if args.config:
+        with open(args.config, 'r') as file:
+            config = yaml.safe_load(file)
+    else:
+        config = generate_config(scenes=10, keyframes=10, outputs=8)
+    scenes = len(config['scenes'])
+
+    per_output, snapshots = count_offline(config)
+    print(f"{'node':9s} {'per output':>14s} {'snapshot':>14s}   (messages per scene)")
+    for node in per_output:
+        print(f"{node:9s} {per_output[node] / scenes:14.1f} {snapshots[node] / scenes:14.1f}")
+    print(f"{'total':9s} {sum(per_output.values()) / scenes:14.1f} {sum(snapshots.values()) / scenes:14.1f}")
+
+
+if __name__ == "__main__":
+    main()
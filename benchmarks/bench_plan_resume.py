@@ -0,0 +1,118 @@
+"""
+Benchmark: resume of an output node restarted mid-scene.
+
+Starts the videoplayer and the wled node of a simulated chair, plays a scene and restarts the
+wled node in the middle of it. The restarted node receives the retained plan of the scene before
+its scene clock is synced, and has to start at the keyframe active at that time, not at the first
+one. Reports the profile the node started with and how long after its restart, and exits with an
+error if it did not resume at the active keyframe.
+
+Usage: python benchmarks/bench_plan_resume.py [--restarts 3] [--step 1.0]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from fake_broker import FakeBroker  # noqa: E402
+from sim_chair import Observer, SimulatedChair  # noqa: E402
+
+BASE_TOPIC = "exchair"
+NODE = "wled"
+
+
+def active_index(plan, now):
+    """Output index of the keyframe of plan active at shared time now (-1 before the first one)."""
+    index = -1
+    for output_index, deadline, _ in plan['keyframes']:
+        if deadline < now:
+            index = output_index
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--restarts', type=int, default=3, help="restarts of the node, each in a new scene")
+    parser.add_argument('--keyframes', type=int, default=8, help="profiles per scene")
+    parser.add_argument('--step', type=float, default=1.0, help="seconds between two profiles of a scene")
+    parser.add_argument('--keep', action='store_true', help="keep the working directory with the service logs")
+    args = parser.parse_args()
+
+    broker = FakeBroker().start()
+    observer = Observer("127.0.0.1", broker.port)
+    lock = threading.Lock()
+    plans, profiles = [], []
+
+    # The benchmark runs on the same host, time.monotonic() is the shared scene clock
+    def on_plan(client, userdata, msg):
+        if msg.payload:
+            with lock:
+                plans.append(json.loads(msg.payload))
+
+    def on_profile(client, userdata, msg):
+        with lock:
+            profiles.append((time.monotonic(), int(msg.payload)))
+
+    observer.client.message_callback_add(f"{BASE_TOPIC}/videoplayer/plan/{NODE}", on_plan)
+    observer.client.message_callback_add(f"{BASE_TOPIC}/{NODE}/profile", on_profile)
+
+    chair = SimulatedChair("127.0.0.1", broker.port, BASE_TOPIC, keyframes=args.keyframes,
+                           step=args.step).start(("videoplayer", NODE))
+    results = []
+    try:
+        if not observer.wait_online([BASE_TOPIC], count=2):
+            print(f"Services did not come online, see the logs in {chair.directory}")
+            args.keep = True
+            return 1
+        time.sleep(2)
+
+        for restart in range(args.restarts):
+            observer.client.publish(f"{BASE_TOPIC}/control", "play" if restart == 0 else "next", qos=1)
+            time.sleep(args.step * (args.keyframes / 2 + 0.5))
+            with lock:
+                plan = plans[-1]
+
+            chair.processes[NODE].terminate()
+            chair.processes[NODE].wait(5)
+            with lock:
+                seen = len(profiles)
+            restarted = time.monotonic()
+            chair.start((NODE,))
+
+            deadline = restarted + 10
+            while time.monotonic() < deadline:
+                with lock:
+                    if len(profiles) > seen:
+                        received, index = profiles[seen]
+                        break
+                time.sleep(0.01)
+            else:
+                received, index = None, None
+            expected = active_index(plan, received if received is not None else time.monotonic())
+            results.append((plan['scene'], expected, index, None if received is None else received - restarted))
+    finally:
+        chair.stop(observer, keep=args.keep)
+        observer.stop()
+        broker.stop()
+
+    print("scene  active profile  first profile  after restart s")
+    failed = False
+    for scene, expected, index, delay in results:
+        print(f"{scene:5d}  {expected:14d}  {'-' if index is None else index:>13}  "
+              f"{'-' if delay is None else f'{delay:.2f}':>15}")
+        failed |= index != expected
+    if args.keep:
+        print(f"Service logs: {chair.directory}")
+    if failed:
+        print("The restarted node did not resume at the active keyframe")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
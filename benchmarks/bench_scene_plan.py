@@ -0,0 +1,76 @@
+"""
+Micro-benchmark: per-tick cost and message size of scene plans.
+
+Compares the per-tick work of a node following the config timeline (window check, bisect and
+profile lookup in the full config) with executing a published scene plan (pointer advance), and
+prints the plan size per node against the size of the full config.
+
+Usage: python benchmarks/bench_scene_plan.py [--keyframes 200] [--tick 0.01]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from configs import generate_config  # noqa: E402
+from scene_plan import OUTPUT_OWNERS, PlanCursor, build_scene_plan  # noqa: E402
+from timeline import SceneTimeline  # noqa: E402
+
+
+def run_timeline(timed_outputs, timeline, ticks):
+    current_output_index = -1
+    lower, upper = float('inf'), float('-inf')
+    applied = 0
+    for delta in ticks:
+        if lower < delta <= upper:
+            continue
+        index, lower, upper = timeline.locate(delta)
+        if index != current_output_index:
+            current_output_index = index
+            applied += len(timed_outputs[index])
+    return applied
+
+
+def run_plan(cursor, ticks):
+    applied = 0
+    for delta in ticks:
+        keyframe = cursor.advance(delta)
+        if keyframe is not None:
+            applied += len(keyframe[2])
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--keyframes', type=int, default=200, help="profiles of the benchmarked scene")
+    parser.add_argument('--tick', type=float, default=0.01, help="main loop tick in seconds")
+    args = parser.parse_args()
+
+    config = generate_config(scenes=10, keyframes=args.keyframes)
+    ticks = [i * args.tick for i in range(int(args.keyframes / args.tick))]
+    config_bytes = len(json.dumps(config, default=str))
+
+    timed_outputs = config['scenes'][0]['timed_outputs']
+    timeline = SceneTimeline(timed_outputs)
+    start = time.perf_counter()
+    run_timeline(timed_outputs, timeline, ticks)
+    timeline_time = time.perf_counter() - start
+    print(f"config timeline: {timeline_time / len(ticks) * 1e9:8.0f} ns/tick")
+
+    print(f"full config: {config_bytes} bytes")
+    for node, output_keys in OUTPUT_OWNERS.items():
+        plan = json.loads(json.dumps(build_scene_plan(config, 0, 0.0, output_keys)))
+        cursor = PlanCursor(plan)
+        start = time.perf_counter()
+        run_plan(cursor, ticks)
+        plan_time = time.perf_counter() - start
+        print(f"plan of {node:8s}: {plan_time / len(ticks) * 1e9:8.0f} ns/tick, "
+              f"{len(json.dumps(plan))} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: keyframe jitter between the output nodes of a chair.
+
+Needs a running broker and chair services started with CLOCK_JITTER_REPORT=1. Listens to the
+keyframe reports of all nodes (optionally starting playback itself) and prints how far apart the
+nodes applied the same profile, and how late each node was against the shared scene timeline.
+
+Usage: python benchmarks/bench_scene_sync.py [--seconds 60] [--play] (run from the repository root)
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import paho.mqtt.client as mqtt  # noqa: E402
+import yaml  # noqa: E402
+
+# Reports of the same scene run are at most this far apart
+GROUP_TOLERANCE = 0.5
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def describe(values):
+    if not values:
+        return "no samples"
+    return (f"p50 {percentile(values, 0.5) * 1000:.2f} ms, p95 {percentile(values, 0.95) * 1000:.2f} ms, "
+            f"max {max(values) * 1000:.2f} ms ({len(values)} samples)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--broker-config', default="config/broker.yaml", help="broker.yaml of the chair")
+    parser.add_argument('--seconds', type=float, default=60.0, help="how long to collect reports")
+    parser.add_argument('--play', action='store_true', help="send a play command after subscribing")
+    args = parser.parse_args()
+
+    with open(args.broker_config, 'r') as file:
+        broker = yaml.safe_load(file)
+    base_topic = broker['base_topic']
+
+    groups = []
+
+    def on_message(client, userdata, msg):
+        node = msg.topic.rsplit('/', 1)[1]
+        report = json.loads(msg.payload)
+        for group in groups:
+            if (group['scene'], group['profile']) == (report['scene'], report['profile']) \
+                    and abs(group['deadline'] - report['deadline']) < GROUP_TOLERANCE:
+                break
+        else:
+            group = {'scene': report['scene'], 'profile': report['profile'], 'deadline': report['deadline'],
+                     'applied': {}}
+            groups.append(group)
+        group['applied'][node] = (report['applied'], report['applied'] - report['deadline'])
+
+    client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                         protocol=mqtt.MQTTProtocolVersion.MQTTv5)
+    if 'user' in broker and 'password' in broker:
+        client.username_pw_set(broker['user'], broker['password'])
+    client.on_message = on_message
+    client.connect(broker['host'], broker['port'])
+    client.subscribe(f"{base_topic}/clock/keyframe/#")
+    client.loop_start()
+    if args.play:
+        client.publish(f"{base_topic}/control", "play", qos=1)
+
+    print(f"Collecting keyframe reports on {base_topic}/clock/keyframe/# for {args.seconds:.0f}s")
+    time.sleep(args.seconds)
+    client.loop_stop()
+
+    spreads = []
+    lateness = defaultdict(list)
+    for group in groups:
+        applied = [applied for applied, _ in group['applied'].values()]
+        if len(applied) > 1:
+            spreads.append(max(applied) - min(applied))
+        for node, (_, late) in group['applied'].items():
+            # The first profile starts with the scene, its lateness is the delivery latency
+            if group['profile'] != 0:
+                lateness[node].append(late)
+
+    print(f"Keyframes seen: {len(groups)}")
+    print(f"Jitter between nodes: {describe(spreads)}")
+    for node, values in sorted(lateness.items()):
+        print(f"Lateness of {node}: {describe(values)}")
+
+
+if __name__ == "__main__":
+    main()
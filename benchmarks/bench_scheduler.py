@@ -0,0 +1,61 @@
+"""
+Benchmark: main loop wakeups, CPU usage and keyframe lateness.
+
+Runs a simulated output node through one scene, once with the legacy fixed 10 ms
+sleep loop and once with the deadline scheduler, and reports the loop stats of both.
+
+Usage: python benchmarks/bench_scheduler.py [--duration 5] [--keyframes 20]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from scheduler import DeadlineScheduler  # noqa: E402
+from timeline import SceneTimeline  # noqa: E402
+
+
+def run_scene(scheduler, timeline, duration):
+    """Mimics PiExpChair.run() with check_for_output_change() as module_run()."""
+    start = time.monotonic()
+    window = (float('inf'), float('-inf'))
+    current_index = -1
+    lateness = []
+
+    scheduler.loop_stats()
+    while time.monotonic() - start < duration:
+        elapsed = time.monotonic() - start
+        if not window[0] < elapsed <= window[1]:
+            index, lower, upper = timeline.locate(elapsed)
+            window = (lower, upper)
+            scheduler.schedule(start + upper)
+            if index != current_index:
+                current_index = index
+                lateness.append(elapsed - timeline.start_times[timeline.output_indexes.index(index)])
+        scheduler.wait()
+    return scheduler.loop_stats(), lateness
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=5.0, help="simulated scene duration in seconds")
+    parser.add_argument('--keyframes', type=int, default=20, help="profiles in the simulated scene")
+    args = parser.parse_args()
+
+    step = args.duration / args.keyframes
+    timeline = SceneTimeline([{"start_time": round(i * step, 3)} for i in range(args.keyframes)])
+
+    print(f"{'mode':>8} {'wakeups/s':>10} {'cpu %':>7} {'late avg ms':>12} {'late max ms':>12}")
+    for mode in ("legacy", "deadline"):
+        scheduler = DeadlineScheduler(legacy=mode == "legacy")
+        stats, lateness = run_scene(scheduler, timeline, args.duration)
+        print(f"{mode:>8} {stats['wakeups_per_second']:>10.1f} {stats['cpu_percent']:>7.2f} "
+              f"{statistics.mean(lateness) * 1000:>12.3f} {max(lateness) * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Regression benchmark: service startup time budget.
+
+Starts a fresh interpreter per service, imports its module and loads a generated config
+(the startup phases which do not need a broker or hardware) and fails if a service
+exceeds the budget.
+
+Usage: python benchmarks/bench_startup.py [--budget-ms 1500] [--scenes 20] [--runs 3]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from configs import generate_config, write_config
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+SERVICES = ["videoplayer", "i2c", "wled", "novastar", "webui"]
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+from piexpchair import read_config, config_schema, broker_schema, logging
+read_config('config/broker.yaml', logging, broker_schema)
+assert read_config('config/config.yaml', logging, config_schema)
+configured = time.perf_counter()
+print(json.dumps({{"imports": imported - start, "config": configured - imported}}))
+"""
+
+
+def probe(module, directory):
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(SRC_PATH))
+    output = subprocess.run([sys.executable, "-c", PROBE.format(module=module)], cwd=directory, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=1500.0, help="maximum imports + config time per service")
+    parser.add_argument('--scenes', type=int, default=20, help="scenes in the generated config")
+    parser.add_argument('--runs', type=int, default=3, help="runs per service, the fastest counts")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="piexpchair_bench_")
+    write_config(directory, generate_config(scenes=args.scenes))
+
+    failed = []
+    print(f"{'service':>12} {'imports ms':>11} {'config ms':>10} {'total ms':>9}")
+    for service in SERVICES:
+        results = [probe(service, directory) for _ in range(args.runs)]
+        best = min(results, key=lambda result: result["imports"] + result["config"])
+        total = (best["imports"] + best["config"]) * 1000
+        print(f"{service:>12} {best['imports'] * 1000:>11.1f} {best['config'] * 1000:>10.1f} {total:>9.1f}")
+        if total > args.budget_ms:
+            failed.append(service)
+
+    if failed:
+        print(f"Startup budget of {args.budget_ms:.0f} ms exceeded by: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"All services within the startup budget of {args.budget_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark: scene profile lookup per tick.
+
+Compares the former linear scan over ``timed_outputs`` with the compiled
+SceneTimeline (bisect + cached window) for scenes of growing length.
+
+Usage: python benchmarks/bench_timeline.py [--duration 60] [--tick 0.01]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from timeline import SceneTimeline  # noqa: E402
+
+
+def build_timed_outputs(keyframes, duration):
+    step = duration / keyframes
+    return [{"start_time": round(i * step, 3), "i2c_outputs": {"massage": bool(i % 2)}} for i in range(keyframes)]
+
+
+def linear_scan(timed_outputs, current_time_delta):
+    loop_output_index = -1
+    for timed_output in timed_outputs:
+        if current_time_delta <= timed_output['start_time']:
+            break
+        loop_output_index += 1
+    return loop_output_index
+
+
+def run_linear(timed_outputs, ticks):
+    current_output_index = -1
+    changes = 0
+    for delta in ticks:
+        index = linear_scan(timed_outputs, delta)
+        if index != current_output_index:
+            current_output_index = index
+            changes += 1
+    return changes
+
+
+def run_compiled(timeline, ticks):
+    current_output_index = -1
+    changes = 0
+    lower, upper = float('inf'), float('-inf')
+    for delta in ticks:
+        if lower < delta <= upper:
+            continue
+        index, lower, upper = timeline.locate(delta)
+        if index != current_output_index:
+            current_output_index = index
+            changes += 1
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=60.0, help="simulated scene duration in seconds")
+    parser.add_argument('--tick', type=float, default=0.01, help="main loop tick in seconds")
+    args = parser.parse_args()
+
+    ticks = [i * args.tick for i in range(int(args.duration / args.tick))]
+    print(f"{len(ticks)} ticks per scene")
+    print(f"{'keyframes':>10} {'linear us/tick':>15} {'compiled us/tick':>17} {'speedup':>8}")
+    for keyframes in (10, 100, 500, 1000):
+        timed_outputs = build_timed_outputs(keyframes, args.duration)
+        timeline = SceneTimeline(timed_outputs)
+
+        start = time.perf_counter()
+        linear_changes = run_linear(timed_outputs, ticks)
+        linear = (time.perf_counter() - start) / len(ticks) * 1e6
+
+        start = time.perf_counter()
+        compiled_changes = run_compiled(timeline, ticks)
+        compiled = (time.perf_counter() - start) / len(ticks) * 1e6
+
+        if linear_changes != compiled_changes:
+            print(f"Mismatch for {keyframes} keyframes: {linear_changes} != {compiled_changes}")
+            sys.exit(1)
+        print(f"{keyframes:>10} {linear:>15.3f} {compiled:>17.3f} {linear / compiled:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Generated configs for the benchmarks.
+
+Builds valid config.yaml/broker.yaml contents of arbitrary size, so the benchmarks
+do not depend on a deployed chair.
+"""
+
+import os
+
+import yaml
+
+
+def generate_config(scenes=10, keyframes=10, outputs=5, hostname="primary", step=1.0):
+    """
+    Returns a config dict matching config_schema with the given number of scenes and profiles per scene.
+    The videos are configured for hostname, the profiles of a scene are step seconds apart.
+    """
+    output_names = [f"output{i}" for i in range(outputs)]
+    arduino_names = [f"arduino{i}" for i in range(outputs)]
+    config = {
+        "videoplayer": {"media_path": "/tmp/media/", "rc_socket": "/tmp/vlc_rc.sock"},
+        "webui": {"user": "admin", "password": "super_secret"},
+        "i2c": {
+            "input": {name: {"address": 0x27, "pin": pin}
+                      for pin, name in enumerate(("play", "stop", "next", "prev", "shutdown"))},
+            "output": {name: {"address": 0x23, "pin": pin} for pin, name in enumerate(output_names)},
+            "arduino_devices": {name: {"address": 0x20 + pin // 2, "pin": pin % 2}
+                                for pin, name in enumerate(arduino_names)},
+        },
+        "wled": {
+            "settings": {"transition": 5},
+            "devices": ["chair"],
+            "colors": {"orange_warm": [[255, 140, 0], [0, 0, 0], [0, 0, 0]],
+                       "orange_dark": [[255, 50, 0], [0, 0, 0], [0, 0, 0]]},
+            "macros": {
+                "strip_off": {"strip_on": False, "brightness": 255, "color": "orange_warm",
+                              "effect_id": 0, "speed": 128, "intensity": 255},
+                "orange_warm": {"strip_on": True, "brightness": 255, "color": "orange_warm",
+                                "effect_id": 0, "speed": 128, "intensity": 255},
+                "orange_dark": {"strip_on": True, "brightness": 255, "color": "orange_dark",
+                                "effect_id": 5, "speed": 200, "intensity": 180},
+            },
+        },
+        "novastar": {"controller_ip": "127.0.0.1", "controller_port": 5200},
+        "idle": {
+            "files": {hostname: "idle.mp4"},
+            "i2c_outputs": {name: False for name in output_names},
+            "arduino_outputs": {name: 0 for name in arduino_names},
+            "wled_outputs": {0: "strip_off", 1: "strip_off"},
+            "novastar_output": 1,
+        },
+        "scenes": [],
+    }
+
+    for scene_index in range(scenes):
+        timed_outputs = []
+        for keyframe in range(keyframes):
+            timed_outputs.append({
+                "start_time": float(keyframe * step),
+                "i2c_outputs": {name: bool((keyframe + pin) % 2) for pin, name in enumerate(output_names)},
+                "arduino_outputs": {name: (keyframe * 10 + pin) % 256 for pin, name in enumerate(arduino_names)},
+                "wled_outputs": {0: "orange_warm", 1: "orange_dark" if keyframe % 2 else "strip_off"},
+                "novastar_output": keyframe % 8,
+            })
+        config["scenes"].append({
+            "name": f"scene{scene_index}",
+            "files": {hostname: f"scene{scene_index}.mp4"},
+            "image": f"scene{scene_index}_inactive.jpg",
+            "image_active": f"scene{scene_index}_active.jpg",
+            "duration": float((keyframes + 1) * step),
+            "webplayer_ordering": scene_index,
+            "timed_outputs": timed_outputs,
+        })
+    return config
+
+
+def write_config(directory, config, base_topic="exchair", host="localhost", port=1883):
+    """Writes config/config.yaml and config/broker.yaml below directory."""
+    os.makedirs(os.path.join(directory, "config"), exist_ok=True)
+    with open(os.path.join(directory, "config", "config.yaml"), "w") as file:
+        yaml.safe_dump(config, file)
+    with open(os.path.join(directory, "config", "broker.yaml"), "w") as file:
+        yaml.safe_dump({"host": host, "port": port, "base_topic": base_topic}, file)
@@ -0,0 +1,243 @@
+"""
+Minimal MQTT v5 broker for the hardware-free simulation.
+
+Speaks enough of MQTT v5 over TCP for the paho clients of the services: CONNECT, SUBSCRIBE,
+UNSUBSCRIBE, PUBLISH with QoS 0/1 (QoS 2 is downgraded to 1), retained messages, wildcard
+subscriptions, PINGREQ and DISCONNECT. Publish properties (message expiry, user properties)
+are forwarded unchanged. There are no sessions, no will messages and no redelivery.
+
+Usage: python benchmarks/fake_broker.py [--port 1883]
+"""
+
+import argparse
+import socket
+import socketserver
+import struct
+import threading
+from collections import Counter
+
+from paho.mqtt.client import topic_matches_sub
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def encode_varint(value):
+    encoded = bytearray()
+    while True:
+        byte, value = value % 128, value // 128
+        encoded.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(encoded)
+
+
+def decode_varint(data, offset):
+    value, shift = 0, 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value += (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def decode_string(data, offset):
+    length = struct.unpack_from("!H", data, offset)[0]
+    return data[offset + 2:offset + 2 + length].decode(), offset + 2 + length
+
+
+def encode_string(value):
+    encoded = value.encode()
+    return struct.pack("!H", len(encoded)) + encoded
+
+
+def packet(packet_type, body, flags=0):
+    return bytes([packet_type << 4 | flags]) + encode_varint(len(body)) + body
+
+
+class Session:
+    def __init__(self, broker, connection):
+        self.broker = broker
+        self.connection = connection
+        self.send_lock = threading.Lock()
+        self.subscriptions = {}
+        self.next_packet_id = 0
+        self.client_id = None
+
+    def send(self, data):
+        with self.send_lock:
+            try:
+                self.connection.sendall(data)
+            except OSError:
+                pass
+
+    def deliver(self, topic, properties, payload, qos, retain=False):
+        body = encode_string(topic)
+        if qos:
+            self.next_packet_id = self.next_packet_id % 65535 + 1
+            body += struct.pack("!H", self.next_packet_id)
+        body += encode_varint(len(properties)) + properties + payload
+        self.send(packet(PUBLISH, body, flags=(qos << 1) | int(retain)))
+
+
+class FakeBroker:
+    """
+    Broker state and TCP server.
+
+    Args:
+        port: TCP port to listen on (0 picks a free one, see self.port)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.retained = {}
+        self.stats = Counter()
+
+        broker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                broker.serve(self.request)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve(self, connection):
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = Session(self, connection)
+        reader = connection.makefile('rb')
+        try:
+            while True:
+                header = reader.read(1)
+                if not header:
+                    break
+                length, multiplier = 0, 1
+                while True:
+                    byte = reader.read(1)[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = reader.read(length)
+                if not self.handle_packet(session, header[0] >> 4, header[0] & 0x0F, body):
+                    break
+        except (OSError, IndexError):
+            pass
+        finally:
+            with self.lock:
+                self.sessions.discard(session)
+            connection.close()
+
+    def handle_packet(self, session, packet_type, flags, body):
+        self.stats[packet_type] += 1
+        if packet_type == CONNECT:
+            session.client_id = self.parse_client_id(body)
+            with self.lock:
+                self.sessions.add(session)
+            session.send(packet(CONNACK, b"\x00\x00\x00"))
+        elif packet_type == PUBLISH:
+            self.handle_publish(session, flags, body)
+        elif packet_type == SUBSCRIBE:
+            self.handle_subscribe(session, body)
+        elif packet_type == UNSUBSCRIBE:
+            packet_id = body[:2]
+            offset = 2
+            properties_length, offset = decode_varint(body, offset)
+            offset += properties_length
+            reason_codes = bytearray()
+            while offset < len(body):
+                topic_filter, offset = decode_string(body, offset)
+                with self.lock:
+                    session.subscriptions.pop(topic_filter, None)
+                reason_codes.append(0)
+            session.send(packet(UNSUBACK, packet_id + b"\x00" + bytes(reason_codes)))
+        elif packet_type == PINGREQ:
+            session.send(packet(PINGRESP, b""))
+        elif packet_type == DISCONNECT:
+            return False
+        return True
+
+    @staticmethod
+    def parse_client_id(body):
+        offset = len(encode_string("MQTT")) + 4
+        properties_length, offset = decode_varint(body, offset)
+        client_id, _ = decode_string(body, offset + properties_length)
+        return client_id
+
+    def handle_publish(self, session, flags, body):
+        qos, retain = min((flags >> 1) & 0x03, 1), flags & 0x01
+        topic, offset = decode_string(body, 0)
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            session.send(packet(PUBACK, packet_id))
+        properties_length, properties_start = decode_varint(body, offset)
+        properties = body[properties_start:properties_start + properties_length]
+        payload = body[properties_start + properties_length:]
+        self.stats["messages"] += 1
+
+        with self.lock:
+            if retain:
+                if payload:
+                    self.retained[topic] = (properties, payload, qos)
+                else:
+                    self.retained.pop(topic, None)
+            receivers = []
+            for receiver in self.sessions:
+                granted = [sub_qos for topic_filter, sub_qos in receiver.subscriptions.items()
+                           if topic_matches_sub(topic_filter, topic)]
+                if granted:
+                    receivers.append((receiver, min(qos, max(granted))))
+        for receiver, delivery_qos in receivers:
+            receiver.deliver(topic, properties, payload, delivery_qos)
+
+    def handle_subscribe(self, session, body):
+        packet_id = body[:2]
+        properties_length, offset = decode_varint(body, 2)
+        offset += properties_length
+        granted, filters = bytearray(), []
+        while offset < len(body):
+            topic_filter, offset = decode_string(body, offset)
+            qos = min(body[offset] & 0x03, 1)
+            offset += 1
+            with self.lock:
+                session.subscriptions[topic_filter] = qos
+            granted.append(qos)
+            filters.append((topic_filter, qos))
+        session.send(packet(SUBACK, packet_id + b"\x00" + bytes(granted)))
+
+        with self.lock:
+            retained = list(self.retained.items())
+        for topic_filter, sub_qos in filters:
+            for topic, (properties, payload, qos) in retained:
+                if topic_matches_sub(topic_filter, topic):
+                    session.deliver(topic, properties, payload, min(qos, sub_qos), retain=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=1883, help="TCP port to listen on")
+    args = parser.parse_args()
+    broker = FakeBroker(port=args.port)
+    print(f"Fake MQTT broker listening on 127.0.0.1:{broker.port}")
+    try:
+        broker.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Fake VLC and Novastar endpoints for the hardware-free simulation.
+
+FakeVlcServer accepts the ``oldrc`` commands of the videoplayer on a Unix socket,
+FakeNovastarServer answers the ``55AA...5E56`` frames of the novastar service over TCP. Both
+record what they received with a time.monotonic() timestamp.
+"""
+
+import os
+import socketserver
+import threading
+import time
+
+NOVASTAR_FRAME_START = bytes.fromhex("55AA")
+NOVASTAR_FRAME_END = bytes.fromhex("5E56")
+# Acknowledge frame sent back for every valid command
+NOVASTAR_ACK = bytes.fromhex("AA550001000000000000000000005E56")
+
+
+class _RecordingServer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.received = []
+
+    def record(self, value):
+        with self.lock:
+            self.received.append((time.monotonic(), value))
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeVlcServer(_RecordingServer):
+    """
+    Unix socket server taking one oldrc command per connection, like send_vlc_command() sends them.
+
+    Args:
+        path: Socket path (the rc_socket of the videoplayer config)
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        if os.path.exists(path):
+            os.unlink(path)
+        fake = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                data = b""
+                while True:
+                    chunk = self.request.recv(1024)
+                    if not chunk:
+                        break
+                    data += chunk
+                for command in data.decode().splitlines() or [""]:
+                    fake.record(command.strip())
+
+        self.server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        self.server.daemon_threads = True
+
+
+class FakeNovastarServer(_RecordingServer):
+    """
+    TCP endpoint of a Novastar controller: validates the frame, acknowledges it and closes the connection.
+
+    Args:
+        port: TCP port (0 picks a free one, see self.port)
+        response_delay: Processing time of the controller before it answers
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, response_delay=0.005):
+        super().__init__()
+        self.invalid = 0
+        fake = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                frame = self.request.recv(1024)
+                if not (frame.startswith(NOVASTAR_FRAME_START) and frame.endswith(NOVASTAR_FRAME_END)):
+                    fake.invalid += 1
+                    return
+                fake.record(frame.hex().upper())
+                time.sleep(response_delay)
+                self.request.sendall(NOVASTAR_ACK)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
@@ -0,0 +1,349 @@
+"""
+In-process fakes for the I2C hardware of the i2c service.
+
+install() registers stand-ins for the ``board``, ``busio``, ``digitalio`` and
+``adafruit_mcp230xx`` modules, so src/i2c.py runs unchanged on a plain Linux box. Every
+register access of the fake MCP23017s and every Arduino write is one transaction on the fake
+bus, which takes SIM_I2C_LATENCY seconds (default 0.0003, roughly a register access at 100 kHz).
+
+Buttons are pressed over UDP when SIM_BUTTON_PORT is set: "press <address> <pin> [seconds]"
+pulls the input low (it has a pull-up) for the given time (default 0.1).
+
+Arduinos registered with install(arduinos={address: batch}) are arduino_protocol.ArduinoReceiver
+instances, writes to other addresses are only recorded in FakeI2C.arduino_writes.
+
+The interrupt output of an expander drives a line of gpio_interrupts.fake_backend if it is
+wired with install(interrupts={address: gpio}), use GPIO_BACKEND=fake for the i2c node then.
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+import types
+from collections import Counter
+from enum import Enum
+
+
+I2C_LATENCY = float(os.getenv('SIM_I2C_LATENCY', 0.0003))
+
+# Pi GPIO wired to the interrupt output per expander address
+_interrupt_wiring = {}
+# Arduinos on the bus, True for devices speaking batch frames
+_arduinos = {}
+
+
+class Direction(Enum):
+    INPUT = 0
+    OUTPUT = 1
+
+
+class Pull(Enum):
+    UP = 0
+    DOWN = 1
+
+
+class FakeI2C:
+    """Stand-in for busio.I2C, shared by all devices of the process."""
+
+    def __init__(self, scl=None, sda=None, frequency=100000):
+        self.frequency = frequency
+        self.lock = threading.Lock()
+        self.locked = False
+        self.stats = Counter()
+        self.devices = {}
+        self.arduino_writes = []
+        # Addresses that do not acknowledge (device dropped off the bus) and the failed transactions per address
+        self.offline = set()
+        self.errors = Counter()
+
+    def transaction(self, address, kind, nbytes=1):
+        self.stats[(address, kind)] += 1
+        self.stats["bytes"] += nbytes + 1
+        if I2C_LATENCY:
+            time.sleep(I2C_LATENCY)
+        if address in self.offline:
+            self.errors[address] += 1
+            raise OSError(121, "Remote I/O error")
+
+    def try_lock(self):
+        with self.lock:
+            if self.locked:
+                return False
+            self.locked = True
+            return True
+
+    def unlock(self):
+        with self.lock:
+            self.locked = False
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def arduinos(self):
+        return {address: device for address, device in self.devices.items() if not isinstance(device, FakeMCP23017)}
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        data = bytes(buffer[start:end])
+        self.transaction(address, "write", len(data))
+        if address in self.devices:
+            self.devices[address].write_bytes(data)
+        else:
+            self.arduino_writes.append((time.monotonic(), address, data))
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        end = len(buffer) if end is None else end
+        self.transaction(address, "read", end - start)
+        device = self.devices.get(address)
+        data = device.read_bytes(end - start) if device else bytes(end - start)
+        buffer[start:end] = data
+
+    def writeto_then_readfrom(self, address, buffer_out, buffer_in, *, out_start=0, out_end=None, in_start=0,
+                              in_end=None):
+        self.writeto(address, buffer_out, start=out_start, end=out_end)
+        self.readfrom_into(address, buffer_in, start=in_start, end=in_end)
+
+
+class FakeDigitalInOut:
+    """Pin of a fake MCP23017 (adafruit_mcp230xx.digital_inout.DigitalInOut)."""
+
+    def __init__(self, pin, mcp):
+        self.pin = pin
+        self.mcp = mcp
+
+    @property
+    def direction(self):
+        return Direction.INPUT if self.mcp.iodir & (1 << self.pin) else Direction.OUTPUT
+
+    @direction.setter
+    def direction(self, direction):
+        if direction == Direction.INPUT:
+            self.mcp.iodir |= 1 << self.pin
+        else:
+            self.mcp.iodir &= ~(1 << self.pin)
+
+    @property
+    def pull(self):
+        return Pull.UP if self.mcp.gppu & (1 << self.pin) else None
+
+    @pull.setter
+    def pull(self, pull):
+        if pull == Pull.UP:
+            self.mcp.gppu |= 1 << self.pin
+        else:
+            self.mcp.gppu &= ~(1 << self.pin)
+
+    @property
+    def value(self):
+        return bool(self.mcp.gpio & (1 << self.pin))
+
+    @value.setter
+    def value(self, value):
+        gpio = self.mcp.gpio
+        self.mcp.gpio = gpio | (1 << self.pin) if value else gpio & ~(1 << self.pin)
+
+
+class FakeMCP23017:
+    """
+    Register level stand-in for adafruit_mcp230xx.mcp23017.MCP23017.
+
+    Each property access is one bus transaction, like on the real chip.
+    """
+
+    def __init__(self, i2c, address=0x20, reset=True):
+        self.i2c = i2c
+        self.address = address
+        i2c.devices[address] = self
+        self._iodir = 0xFFFF
+        self._gppu = 0
+        self._olat = 0
+        # Level applied from outside to the input pins (None: floating, read as pulled up if enabled)
+        self.external = {}
+        self._gpinten = 0
+        self._intcon = 0
+        self._defval = 0
+        self._intcap = 0
+        self._intf = 0
+        self._iocon = 0
+        self._ipol = 0
+        gpio = _interrupt_wiring.get(address)
+        self.int_output = None
+        if gpio is not None:
+            from gpio_interrupts import fake_backend
+            self.int_output = lambda level: fake_backend.set_level(gpio, level)
+
+    def _register(self, value, nbytes=2):
+        self.i2c.transaction(self.address, "read", nbytes)
+        return value
+
+    def _set_register(self, name, value, nbytes=2):
+        self.i2c.transaction(self.address, "write", nbytes)
+        setattr(self, name, value & 0xFFFF)
+
+    def _levels(self):
+        levels = self._olat & ~self._iodir
+        for pin in range(16):
+            if self._iodir & (1 << pin):
+                level = self.external.get(pin)
+                if level is None:
+                    level = bool(self._gppu & (1 << pin))
+                if level:
+                    levels |= 1 << pin
+        return levels
+
+    # Registers
+    iodir = property(lambda self: self._register(self._iodir),
+                     lambda self, value: self._set_register('_iodir', value))
+    gppu = property(lambda self: self._register(self._gppu),
+                    lambda self, value: self._set_register('_gppu', value))
+    olat = property(lambda self: self._register(self._olat),
+                    lambda self, value: self._set_register('_olat', value))
+    interrupt_enable = property(lambda self: self._register(self._gpinten),
+                                lambda self, value: self._set_register('_gpinten', value))
+    interrupt_configuration = property(lambda self: self._register(self._intcon),
+                                       lambda self, value: self._set_register('_intcon', value))
+    default_value = property(lambda self: self._register(self._defval),
+                             lambda self, value: self._set_register('_defval', value))
+    io_control = property(lambda self: self._register(self._iocon, 1),
+                          lambda self, value: self._set_register('_iocon', value, 1))
+    ipol = property(lambda self: self._register(self._ipol),
+                    lambda self, value: self._set_register('_ipol', value))
+
+    def _clear_interrupt(self):
+        if self._intf:
+            self._intf = 0
+            if self.int_output:
+                self.int_output(1)
+
+    @property
+    def gpio(self):
+        # Reading the port clears the interrupt
+        levels = self._register(self._levels())
+        self._clear_interrupt()
+        return levels
+
+    @gpio.setter
+    def gpio(self, value):
+        self._set_register('_olat', value)
+
+    @property
+    def gpioa(self):
+        return self._register(self._levels() & 0xFF, 1)
+
+    @gpioa.setter
+    def gpioa(self, value):
+        self._set_register('_olat', (self._olat & 0xFF00) | (value & 0xFF), 1)
+
+    @property
+    def gpiob(self):
+        return self._register(self._levels() >> 8, 1)
+
+    @gpiob.setter
+    def gpiob(self, value):
+        self._set_register('_olat', (self._olat & 0x00FF) | ((value & 0xFF) << 8), 1)
+
+    @property
+    def int_flag(self):
+        flags = self._register(self._intf)
+        return [pin for pin in range(16) if flags & (1 << pin)]
+
+    @property
+    def int_cap(self):
+        # List of the 16 captured levels like adafruit_mcp230xx
+        captured = self._register(self._intcap)
+        self._clear_interrupt()
+        return [(captured >> pin) & 1 for pin in range(16)]
+
+    def clear_ints(self):
+        self._register(self._intcap)
+        self._clear_interrupt()
+
+    def get_pin(self, pin):
+        return FakeDigitalInOut(pin, self)
+
+    def set_input(self, pin, level):
+        """Drive an input pin from outside (None releases it), latching interrupts like the chip."""
+        before = self._levels()
+        self.external[pin] = level
+        after = self._levels()
+        mask = 1 << pin
+        if self._gpinten & mask and (before ^ after) & mask and not self._intf:
+            self._intf |= mask
+            self._intcap = after
+            if self.int_output:
+                self.int_output(0)
+
+    def write_bytes(self, data):
+        pass
+
+    def read_bytes(self, nbytes):
+        return bytes(nbytes)
+
+
+_bus = None
+
+
+def _get_bus(*args, **kwargs):
+    global _bus
+    if _bus is None:
+        _bus = FakeI2C(*args, **kwargs)
+        from arduino_protocol import ArduinoReceiver
+        for address, batch in _arduinos.items():
+            _bus.devices[address] = ArduinoReceiver(batch=batch)
+    else:
+        _bus.frequency = kwargs.get('frequency', _bus.frequency)
+    return _bus
+
+
+def serve_buttons(port):
+    """Press buttons of the fake MCP23017s on UDP messages "press <address> <pin> [seconds]"."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", port))
+
+    def serve():
+        while True:
+            command = server.recv(256).decode().split()
+            if len(command) < 3 or command[0] != "press" or _bus is None:
+                continue
+            mcp = _bus.devices.get(int(command[1], 0))
+            if mcp is None:
+                continue
+            pin, duration = int(command[2]), float(command[3]) if len(command) > 3 else 0.1
+            mcp.set_input(pin, False)
+            threading.Timer(duration, mcp.set_input, (pin, None)).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+
+
+def install(interrupts=None, arduinos=None):
+    """
+    Register the fake hardware modules in sys.modules.
+
+    Args:
+        interrupts: Pi GPIO wired to the interrupt output, by expander address
+        arduinos: Arduino devices on the bus, by address True if they speak batch frames
+    """
+    _interrupt_wiring.update(interrupts or {})
+    _arduinos.update(arduinos or {})
+    board = types.ModuleType('board')
+    board.SCL, board.SDA = "SCL", "SDA"
+
+    busio = types.ModuleType('busio')
+    busio.I2C = _get_bus
+
+    digitalio = types.ModuleType('digitalio')
+    digitalio.Direction, digitalio.Pull = Direction, Pull
+
+    mcp230xx = types.ModuleType('adafruit_mcp230xx')
+    mcp23017 = types.ModuleType('adafruit_mcp230xx.mcp23017')
+    mcp23017.MCP23017 = FakeMCP23017
+    digital_inout = types.ModuleType('adafruit_mcp230xx.digital_inout')
+    digital_inout.DigitalInOut = FakeDigitalInOut
+    mcp230xx.mcp23017, mcp230xx.digital_inout = mcp23017, digital_inout
+
+    sys.modules.update({'board': board, 'busio': busio, 'digitalio': digitalio, 'adafruit_mcp230xx': mcp230xx,
+                        'adafruit_mcp230xx.mcp23017': mcp23017, 'adafruit_mcp230xx.digital_inout': digital_inout})
+
+    if os.getenv('SIM_BUTTON_PORT'):
+        serve_buttons(int(os.getenv('SIM_BUTTON_PORT')))
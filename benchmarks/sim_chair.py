@@ -0,0 +1,169 @@
+"""
+Simulated chair stacks for the benchmarks.
+
+SimulatedChair runs the services of one chair (see sim_service.py) as separate processes on a
+generated config with its own base topic, VLC socket and Novastar endpoint. Observer is the MQTT
+client of a benchmark: it waits for the services to come online and collects the traced control
+messages and hops of all chairs on a broker.
+
+All processes run on one host, so the shared scene clock of a chair (the videoplayer's
+time.monotonic()) is directly comparable to time.monotonic() of the benchmark.
+"""
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.client import MQTTProtocolVersion
+
+from configs import generate_config, write_config
+from fake_devices import FakeNovastarServer, FakeVlcServer
+from tracing import TraceCollector, trace_id_of
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+SERVICES = ("videoplayer", "i2c", "wled", "novastar", "webui")
+
+
+def free_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def cpu_seconds(pid):
+    """User and system CPU time of a process from /proc."""
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+class SimulatedChair:
+    """
+    The services of one chair with their fake hardware.
+
+    Args:
+        broker_host, broker_port: MQTT broker of the services
+        base_topic: Base topic of this chair
+        keyframes: Profiles per scene of the generated config
+        step: Seconds between two profiles of a scene
+        interrupts: Fake GPIO wired to the interrupt output per input expander address (None: polled inputs)
+    """
+
+    def __init__(self, broker_host, broker_port, base_topic="exchair", keyframes=5, step=0.2, interrupts=None):
+        self.base_topic = base_topic
+        self.directory = tempfile.mkdtemp(prefix=f"sim_{base_topic}_")
+        self.vlc = FakeVlcServer(os.path.join(self.directory, "vlc_rc.sock")).start()
+        self.novastar = FakeNovastarServer().start()
+        self.button_port, self.webui_port = free_port(socket.SOCK_DGRAM), free_port()
+        self.processes = {}
+
+        config = generate_config(scenes=10, keyframes=keyframes, outputs=5,
+                                 hostname=socket.gethostname().split('.', 1)[0], step=step)
+        config['videoplayer'].update(media_path=os.path.join(self.directory, "media"),
+                                     rc_socket=os.path.join(self.directory, "vlc_rc.sock"))
+        config['novastar']['controller_port'] = self.novastar.port
+        if interrupts:
+            config['i2c']['interrupts'] = interrupts
+        write_config(self.directory, config, base_topic=base_topic, host=broker_host, port=broker_port)
+
+    def start(self, services=SERVICES, **env):
+        """Start the services, env is added to their environment."""
+        env = dict(os.environ, SIM_BUTTON_PORT=str(self.button_port), SIM_WEBUI_PORT=str(self.webui_port),
+                   METRICS_INTERVAL="1", CLOCK_SYNC_INTERVAL="1", **env)
+        env.pop('DEBUG', None)
+        for service in services:
+            log = open(os.path.join(self.directory, f"{service}.log"), "w")
+            self.processes[service] = subprocess.Popen(
+                [sys.executable, os.path.join(BENCHMARKS_PATH, "sim_service.py"), service],
+                cwd=self.directory, env=env, stdout=log, stderr=subprocess.STDOUT)
+        return self
+
+    def press(self, address, pin, duration=0.05):
+        """Press a button of the fake input expanders."""
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as button:
+            button.sendto(f"press {address} {pin} {duration}".encode(), ("127.0.0.1", self.button_port))
+
+    def cpu_seconds(self):
+        return {service: cpu_seconds(process.pid) for service, process in self.processes.items()}
+
+    def stop(self, observer, keep=False):
+        """Quit the services (the webui is terminated) and remove the working directory unless keep is set."""
+        observer.client.publish(f"{self.base_topic}/control", "quit", qos=1)
+        deadline = time.monotonic() + 5
+        for process in self.processes.values():
+            try:
+                process.wait(max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                # The webui has no main loop to quit
+                process.terminate()
+                process.wait(5)
+        self.vlc.stop()
+        self.novastar.stop()
+        if not keep:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class Observer:
+    """
+    MQTT client of a benchmark, subscribed to everything on the broker.
+
+    Keeps the online services and the arrival times of the traced control messages per base
+    topic, the hops of all traces and the number of messages per base topic.
+    """
+
+    def __init__(self, host, port):
+        self.lock = threading.Lock()
+        self.online = {}
+        self.controls = {}
+        self.messages = Counter()
+        self.traces = TraceCollector(max_traces=100000)
+        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                                  client_id=f"bench-observer-{os.getpid()}", protocol=MQTTProtocolVersion.MQTTv5)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.client.connect(host, port)
+        self.client.loop_start()
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        client.subscribe("#")
+
+    def on_message(self, client, userdata, msg):
+        received = time.monotonic()
+        base_topic, _, topic = msg.topic.partition("/")
+        with self.lock:
+            self.messages[base_topic] += 1
+            if topic == "status" and msg.payload.endswith(b" online"):
+                self.online.setdefault(base_topic, set()).add(msg.payload.decode().split("-")[1])
+            elif topic == "control":
+                trace_id = trace_id_of(msg)
+                if trace_id:
+                    self.controls.setdefault(base_topic, []).append((received, trace_id))
+        if topic.startswith("trace/") and msg.payload:
+            self.traces.add(topic.split("/", 1)[1], json.loads(msg.payload))
+
+    def wait_online(self, base_topics, count=len(SERVICES), timeout=30):
+        """Wait until count services of every base topic are online."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if all(len(self.online.get(base_topic, ())) >= count for base_topic in base_topics):
+                    return True
+            time.sleep(0.05)
+        return False
+
+    def hops(self, trace_id):
+        """{node:hop: shared time} of a trace."""
+        with self.traces.lock:
+            return dict(self.traces.traces.get(trace_id, {}))
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
@@ -0,0 +1,49 @@
+"""
+Runs one service of src/ against the simulation fakes.
+
+The i2c service gets the fake I2C hardware (see fake_hardware.py), its Arduinos speak batch
+frames unless SIM_ARDUINO_PROTOCOL=legacy. The webui listens on SIM_WEBUI_PORT. Everything
+else talks to the fake broker, VLC and Novastar endpoints through the generated config in the
+working directory.
+
+Usage: python benchmarks/sim_service.py <videoplayer|i2c|wled|novastar|webui> (started by bench_chair.py)
+"""
+
+import os
+import runpy
+import sys
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+SRC_PATH = os.path.join(BENCHMARKS_PATH, '..', 'src')
+
+
+def main():
+    service = sys.argv[1]
+    sys.path.insert(0, SRC_PATH)
+
+    if service == "i2c":
+        import yaml
+        import fake_hardware
+        with open(os.path.join("config", "config.yaml")) as file:
+            i2c_config = yaml.safe_load(file)['i2c']
+        interrupts = i2c_config.get('interrupts', {})
+        if interrupts:
+            os.environ.setdefault('GPIO_BACKEND', "fake")
+        batch = os.getenv('SIM_ARDUINO_PROTOCOL', "batch") == "batch"
+        fake_hardware.install(interrupts, {device['address']: batch
+                                           for device in i2c_config.get('arduino_devices', {}).values()})
+    elif service == "webui":
+        import flask
+        run = flask.Flask.run
+
+        def run_on_sim_port(app, *args, **kwargs):
+            kwargs.update(port=int(os.getenv('SIM_WEBUI_PORT', 5000)), debug=False, use_reloader=False)
+            return run(app, *args, **kwargs)
+
+        flask.Flask.run = run_on_sim_port
+
+    runpy.run_path(os.path.join(SRC_PATH, f"{service}.py"), run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,71 @@
 
 #define I2C_ADDRESS 0x22
 
+// Batch frames (see src/arduino_protocol.py):
+// MAGIC, VERSION, count, pin_1, value_1, ..., pin_count, value_count, checksum
+// The checksum is the sum of all preceding bytes modulo 256.
+#define BATCH_MAGIC 0xA5
+#define BATCH_VERSION 1
+#define MAX_BATCH_PAIRS 14
+#define MAX_FRAME_LENGTH (3 + 2 * MAX_BATCH_PAIRS + 1)
+
 struct DataPacket {
   char val1;
   char val2;
 };
 
+void setOutput(uint8_t pin, uint8_t value) {
+  Serial.printf("Received values: %d, %d\n", pin, value);
+}
+
 void receiveEvent(int bytesReceived) {
-  if (bytesReceived < sizeof(DataPacket)) {
+  uint8_t frame[MAX_FRAME_LENGTH];
+  int length = 0;
+  while (Wire.available()) {
+    uint8_t data = Wire.read();
+    if (length < MAX_FRAME_LENGTH) {
+      frame[length] = data;
+    }
+    length++;
+  }
+
+  if (length < sizeof(DataPacket)) {
     return; // Ignore incomplete packets
   }
 
-  DataPacket packet;
-  packet.val1 = Wire.read();
-  packet.val2 = Wire.read();
+  // Legacy frame: one pin and value
+  if (length == sizeof(DataPacket)) {
+    setOutput(frame[0], frame[1]);
+    return;
+  }
+
+  // Batch frame
+  if (length > MAX_FRAME_LENGTH || frame[0] != BATCH_MAGIC || frame[1] != BATCH_VERSION) {
+    Serial.printf("Ignoring invalid frame of %d bytes\n", length);
+    return;
+  }
+  uint8_t count = frame[2];
+  if (length != 3 + 2 * count + 1) {
+    Serial.printf("Ignoring batch frame of %d bytes with %d pairs\n", length, count);
+    return;
+  }
+  uint8_t checksum = 0;
+  for (int i = 0; i < length - 1; i++) {
+    checksum += frame[i];
+  }
+  if (checksum != frame[length - 1]) {
+    Serial.printf("Ignoring batch frame with checksum mismatch\n");
+    return;
+  }
+  for (int i = 0; i < count; i++) {
+    setOutput(frame[3 + 2 * i], frame[4 + 2 * i]);
+  }
+}
 
-  Serial.printf("Received values: %d, %d\n", packet.val1, packet.val2);
+// Protocol probe of the i2c node: announce that batch frames are understood
+void requestEvent() {
+  uint8_t response[2] = {BATCH_MAGIC, BATCH_VERSION};
+  Wire.write(response, sizeof(response));
 }
 
 void setup() {
@@ -24,6 +74,7 @@ void setup() {
   Serial.printf("i2c monitor on 0x22 running...\n");
   Wire.begin(I2C_ADDRESS); // ESP8266 as an I2C slave
   Wire.onReceive(receiveEvent);
+  Wire.onRequest(requestEvent);
 }
 
 void loop() {
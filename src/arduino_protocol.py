@@ -0,0 +1,95 @@
+"""
+I2C protocol of the Arduino output devices.
+
+Legacy frames carry one (pin, value) pair in two bytes. Batch frames carry up to
+MAX_BATCH_PAIRS pairs of one device in a single write:
+
+    MAGIC, VERSION, count, pin_1, value_1, ..., pin_count, value_count, checksum
+
+The checksum is the sum of all preceding bytes modulo 256. A device that speaks batch frames
+answers a read with MAGIC and the highest VERSION it supports, legacy devices answer anything
+else. ArduinoReceiver is the Python counterpart of i2c_monitor/i2c_monitor.ino.
+"""
+
+from typing import Dict, List, Tuple
+
+BATCH_MAGIC = 0xA5
+BATCH_VERSION = 1
+# The Wire buffer of an Arduino holds 32 bytes: 3 header bytes, 14 pairs and the checksum
+MAX_BATCH_PAIRS = 14
+PROBE_LENGTH = 2
+
+Pairs = List[Tuple[int, int]]
+
+
+def checksum(data: bytes) -> int:
+    return sum(data) & 0xFF
+
+
+def encode_legacy(pin: int, value: int) -> bytes:
+    return bytes((pin, value))
+
+
+def encode_batch(pairs: Pairs) -> bytes:
+    """Batch frame of up to MAX_BATCH_PAIRS (pin, value) pairs."""
+    if not 0 < len(pairs) <= MAX_BATCH_PAIRS:
+        raise ValueError(f"A batch frame carries 1 to {MAX_BATCH_PAIRS} pairs, got {len(pairs)}")
+    frame = bytearray((BATCH_MAGIC, BATCH_VERSION, len(pairs)))
+    for pin, value in pairs:
+        frame += bytes((pin, value))
+    frame.append(checksum(frame))
+    return bytes(frame)
+
+
+def decode_frame(data: bytes) -> Pairs:
+    """(pin, value) pairs of a legacy or batch frame, raises ValueError for invalid frames."""
+    if len(data) == 2:
+        return [(data[0], data[1])]
+    if len(data) < 6 or data[0] != BATCH_MAGIC:
+        raise ValueError(f"Invalid frame of {len(data)} bytes")
+    if data[1] != BATCH_VERSION:
+        raise ValueError(f"Unsupported batch frame version {data[1]}")
+    count = data[2]
+    if len(data) != 3 + 2 * count + 1:
+        raise ValueError(f"Batch frame length {len(data)} does not match {count} pairs")
+    if checksum(data[:-1]) != data[-1]:
+        raise ValueError("Batch frame checksum mismatch")
+    return [(data[3 + 2 * index], data[4 + 2 * index]) for index in range(count)]
+
+
+def supports_batch(probe_response: bytes) -> bool:
+    """True if the answer of a device to a probe read announces batch frames."""
+    return len(probe_response) >= PROBE_LENGTH and probe_response[0] == BATCH_MAGIC \
+        and probe_response[1] >= BATCH_VERSION
+
+
+class ArduinoReceiver:
+    """
+    Stand-in for an Arduino output device (tests and the hardware-free simulation).
+
+    Args:
+        batch: Speak batch frames, otherwise behave like a legacy device
+    """
+
+    def __init__(self, batch: bool = True):
+        self.batch = batch
+        self.channels: Dict[int, int] = {}
+        self.frames = 0
+        self.invalid = 0
+
+    def write_bytes(self, data: bytes):
+        if not self.batch and len(data) != 2:
+            self.invalid += 1
+            return
+        try:
+            pairs = decode_frame(data)
+        except ValueError:
+            self.invalid += 1
+            return
+        self.frames += 1
+        for pin, value in pairs:
+            self.channels[pin] = value
+
+    def read_bytes(self, nbytes: int) -> bytes:
+        response = bytes((BATCH_MAGIC, BATCH_VERSION)) if self.batch else bytes(PROBE_LENGTH)
+        return response[:nbytes].ljust(nbytes, b"\x00")
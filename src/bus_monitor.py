@@ -0,0 +1,98 @@
+"""
+I2C bus utilisation.
+
+The i2c node reports every bus transaction with its size to the BusMonitor, which keeps
+transactions, bytes and errors per device address and estimates the share of time the bus is
+busy at its clock frequency: every byte takes 9 clock cycles (8 bits and the acknowledge),
+every segment of a transaction (a write, or the register write and the read after a repeated
+start) adds its address byte and about one cycle for its start condition, plus one for the stop.
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable
+
+from metrics import registry as metrics
+
+
+# Standard mode, the default of busio.I2C and of the Raspberry Pi kernel driver
+DEFAULT_BUS_FREQUENCY = 100000
+# Seconds between two utilisation reports (gauges and log) of the i2c node
+BUS_MONITOR_INTERVAL = float(os.getenv('BUS_MONITOR_INTERVAL', 10))
+# Utilisation above which the report is logged as a warning
+BUS_UTILISATION_WARNING = float(os.getenv('BUS_UTILISATION_WARNING', 0.5))
+
+
+def transaction_cycles(nbytes: int, segments: int = 1) -> int:
+    """Clock cycles of a transaction with nbytes data bytes (register address included) in segments."""
+    return 9 * (nbytes + segments) + segments + 1
+
+
+class BusMonitor:
+    """
+    Transactions, bytes and errors per device address (thread safe).
+
+    Args:
+        frequency: Clock frequency of the bus in Hz
+        clock: Time source of the rates
+    """
+
+    def __init__(self, frequency: int = DEFAULT_BUS_FREQUENCY, clock: Callable[[], float] = time.monotonic):
+        self.frequency = frequency
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.transactions = Counter()
+        self.bytes = Counter()
+        self.cycles = Counter()
+        self.errors = Counter()
+        self.last_report_time = clock()
+        self.last_report = (Counter(), Counter(), Counter(), Counter())
+
+    @contextmanager
+    def transfer(self, address: int, nbytes: int, segments: int = 1):
+        """Count the transaction of the with block, and an error if it raises."""
+        with self.lock:
+            self.transactions[address] += 1
+            self.bytes[address] += nbytes
+            self.cycles[address] += transaction_cycles(nbytes, segments)
+        try:
+            yield
+        except (OSError, IOError, RuntimeError):
+            with self.lock:
+                self.errors[address] += 1
+            raise
+
+    def report(self) -> dict:
+        """
+        Rates since the previous report, also set as gauges.
+
+        Returns:
+            {"seconds": length of the period, "utilisation": share of the period the bus was busy,
+             "addresses": {hex address: {"transactions_per_second", "bytes_per_second", "errors", "utilisation"}}}
+        """
+        now = self.clock()
+        seconds = max(now - self.last_report_time, 1e-9)
+        with self.lock:
+            current = (Counter(self.transactions), Counter(self.bytes), Counter(self.cycles), Counter(self.errors))
+        transactions, nbytes, cycles, errors = (counter - previous for counter, previous in zip(current, self.last_report))
+        self.last_report_time, self.last_report = now, current
+
+        addresses = {}
+        for address in sorted(set(current[0]) | set(current[3])):
+            label = hex(address)
+            addresses[label] = {
+                "transactions_per_second": transactions[address] / seconds,
+                "bytes_per_second": nbytes[address] / seconds,
+                "errors": errors[address],
+                "utilisation": cycles[address] / seconds / self.frequency,
+            }
+            metrics.set("i2c_bus_transactions_per_second", addresses[label]["transactions_per_second"], address=label)
+            metrics.set("i2c_bus_bytes_per_second", addresses[label]["bytes_per_second"], address=label)
+            if errors[address]:
+                metrics.inc("i2c_bus_errors_total", errors[address], address=label)
+        utilisation = sum(cycles.values()) / seconds / self.frequency
+        metrics.set("i2c_bus_utilisation", utilisation)
+        return {"seconds": seconds, "utilisation": utilisation, "addresses": addresses}
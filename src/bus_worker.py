@@ -0,0 +1,133 @@
+"""
+Single owner of the I2C bus.
+
+All bus transactions of the i2c node run on one worker thread, fed by a priority queue. The
+main loop (input scans, profiles) and the MQTT thread (output/set) submit requests instead of
+touching the bus themselves, so no bus locking is needed between them.
+
+Requests with a key coalesce while they wait: a second read of the same port shares the result
+of the pending one, a second write to the same port or device is merged into the pending write
+(last write wins per pin or channel). A burst of output/set messages from a webui slider thus
+costs one bus write per port instead of one per message.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Hashable, Optional
+
+from metrics import registry as metrics
+
+
+# Request priorities, lower values run first
+INPUT = 0
+OUTPUT = 1
+BACKGROUND = 2
+PRIORITY_NAMES = ("input", "output", "background")
+
+
+class _Request:
+    __slots__ = ("priority", "sequence", "key", "function", "args", "merge", "futures", "enqueued")
+
+    def __init__(self, priority, sequence, key, function, args, merge):
+        self.priority = priority
+        self.sequence = sequence
+        self.key = key
+        self.function = function
+        self.args = args
+        self.merge = merge
+        self.futures = []
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other):
+        # FIFO within a priority
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class BusWorker:
+    """
+    Worker thread running the submitted bus requests by priority.
+
+    Args:
+        name: Name of the worker thread
+    """
+
+    def __init__(self, name: str = "i2c-bus"):
+        self.condition = threading.Condition()
+        self.queue = []
+        # Waiting requests by key, for coalescing
+        self.pending = {}
+        self.sequence = itertools.count()
+        self.running = False
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop the worker once the queued requests are done."""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread.is_alive() and threading.current_thread() is not self.thread:
+            self.thread.join()
+
+    def submit(self, priority: int, function: Callable, *args, key: Optional[Hashable] = None,
+               merge: Optional[Callable[[tuple, tuple], tuple]] = None) -> Future:
+        """
+        Queue function(*args) and return a future of its result.
+
+        If a request with the same key is still waiting, no new request is queued: merge(pending
+        args, args) replaces the arguments of the pending request (without merge they are
+        expected to be equal) and the returned future completes with it.
+        """
+        future = Future()
+        with self.condition:
+            request = self.pending.get(key) if key is not None else None
+            if request is not None:
+                if merge is not None:
+                    request.args = merge(request.args, args)
+                request.futures.append(future)
+                metrics.inc("i2c_coalesced_total", priority=PRIORITY_NAMES[priority])
+                return future
+            request = _Request(priority, next(self.sequence), key, function, args, merge)
+            request.futures.append(future)
+            heapq.heappush(self.queue, request)
+            if key is not None:
+                self.pending[key] = request
+            self.condition.notify()
+        return future
+
+    def call(self, priority: int, function: Callable, *args, key: Optional[Hashable] = None,
+             merge: Optional[Callable[[tuple, tuple], tuple]] = None):
+        """Run function(*args) on the worker and wait for its result (directly if called on the worker)."""
+        if threading.current_thread() is self.thread or not self.running:
+            return function(*args)
+        return self.submit(priority, function, *args, key=key, merge=merge).result()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                request = heapq.heappop(self.queue)
+                if request.key is not None:
+                    del self.pending[request.key]
+                metrics.set("i2c_queue_depth", len(self.queue))
+
+            metrics.observe("i2c_queue_seconds", time.monotonic() - request.enqueued,
+                            priority=PRIORITY_NAMES[request.priority])
+            try:
+                result = request.function(*request.args)
+            except BaseException as e:
+                for future in request.futures:
+                    future.set_exception(e)
+                continue
+            for future in request.futures:
+                future.set_result(result)
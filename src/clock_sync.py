@@ -0,0 +1,115 @@
+"""
+Shared scene clock.
+
+The videoplayer's time.monotonic() is the shared timebase of a chair. The other nodes estimate
+the offset of their own monotonic clock to it with MQTT ping/pong round trips (NTP style: the
+sample with the smallest round trip time of a sliding window wins).
+
+Several videoplayers may share a base topic (multi-instance) and all of them answer the pings,
+each with its own clock. Pongs, scene starts and plans therefore carry the identity of the clock
+they are on (hostname and boot id, the monotonic clock restarts with every boot). The samples are
+kept per clock master, and those of a host are dropped once it answers with a new boot id.
+"""
+
+import socket
+import time
+import uuid
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+
+def master_identity() -> str:
+    """Identity of the local monotonic clock, as "hostname/boot id"."""
+    hostname = socket.gethostname().split('.', 1)[0]
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as file:
+            boot_id = file.read().strip()
+    except OSError:
+        # No boot id outside of Linux, a new identity per process only restarts the estimate more often
+        boot_id = uuid.uuid4().hex
+    return f"{hostname}/{boot_id}"
+
+
+class ClockOffsetEstimator:
+    """
+    Offset of the shared timebase relative to the local time.monotonic().
+
+    The estimate is the one of the followed clock master, the first master that answered until
+    follow() selects the master of a scene.
+
+    Args:
+        window: Number of recent ping/pong samples per master the estimate is based on
+    """
+
+    def __init__(self, window: int = 16):
+        self.window = window
+        # (rtt, offset) samples per master identity, None for masters that do not send one
+        self.masters: Dict[Optional[str], Deque[Tuple[float, float]]] = {}
+        self.master: Optional[str] = None
+
+    @property
+    def samples(self) -> Deque[Tuple[float, float]]:
+        """Samples of the followed master."""
+        return self.masters.get(self.master, deque())
+
+    def follow(self, master: Optional[str]):
+        """Base the estimate on the samples of master (e.g. the clock a received plan is on)."""
+        if master is not None:
+            self.master = master
+
+    def add_sample(self, t0: float, t1: float, t2: Optional[float] = None, master: Optional[str] = None):
+        """
+        Add a ping/pong round trip.
+
+        Args:
+            t0: Local time the ping was sent
+            t1: Shared time the ping was answered
+            t2: Local time the pong was received (defaults to now)
+            master: Identity of the clock that answered
+        """
+        if t2 is None:
+            t2 = time.monotonic()
+        rtt = t2 - t0
+        if rtt < 0:
+            return
+        if master not in self.masters:
+            if master is not None:
+                # The host rebooted, its samples are of a clock that no longer exists
+                host = master.partition('/')[0]
+                for previous in [previous for previous in self.masters
+                                 if previous is not None and previous.partition('/')[0] == host]:
+                    del self.masters[previous]
+                    if self.master == previous:
+                        self.master = master
+            self.masters[master] = deque(maxlen=self.window)
+            if self.master is None:
+                self.master = master
+        self.masters[master].append((rtt, t1 - (t0 + t2) / 2))
+
+    @property
+    def synced(self) -> bool:
+        return bool(self.samples)
+
+    @property
+    def offset(self) -> float:
+        """Shared time minus local time (0.0 as long as there are no samples)."""
+        if not self.samples:
+            return 0.0
+        return min(self.samples)[1]
+
+    @property
+    def rtt(self) -> Optional[float]:
+        """Round trip time of the sample the offset is based on."""
+        if not self.samples:
+            return None
+        return min(self.samples)[0]
+
+    def to_local(self, shared_time: float) -> float:
+        return shared_time - self.offset
+
+    def to_shared(self, local_time: float) -> float:
+        return local_time + self.offset
+
+    def now(self) -> float:
+        """Current shared time."""
+        return self.to_shared(time.monotonic())
@@ -0,0 +1,112 @@
+"""
+Health of the devices on the I2C bus.
+
+Every operation of the i2c node on a device (already retried by retry_utils) reports success or
+failure here. A device failing QUARANTINE_FAILURES operations in a row is quarantined: the node
+skips it, so a device dropped off the bus no longer stalls the bus worker with retries, and
+re-probes it after QUARANTINE_PROBE_DELAY seconds, doubling the delay after each failed probe up
+to QUARANTINE_PROBE_MAX_DELAY.
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+QUARANTINE_FAILURES = int(os.getenv('QUARANTINE_FAILURES', 2))
+QUARANTINE_PROBE_DELAY = float(os.getenv('QUARANTINE_PROBE_DELAY', 0.5))
+QUARANTINE_PROBE_MAX_DELAY = float(os.getenv('QUARANTINE_PROBE_MAX_DELAY', 30.0))
+
+
+class _Device:
+    __slots__ = ("failures", "quarantined", "probe_delay", "next_probe", "probing")
+
+    def __init__(self):
+        self.failures = 0
+        self.quarantined = False
+        self.probe_delay = QUARANTINE_PROBE_DELAY
+        self.next_probe = float('inf')
+        self.probing = False
+
+
+class DeviceHealth:
+    """
+    Consecutive failures and quarantine state per device address (thread safe).
+
+    Args:
+        failures: Failed operations in a row that quarantine a device
+        probe_delay: Seconds until the first re-probe of a quarantined device
+        max_probe_delay: Upper bound of the doubling re-probe delay
+        clock: Time source of the probe times
+    """
+
+    def __init__(self, failures: int = QUARANTINE_FAILURES, probe_delay: float = QUARANTINE_PROBE_DELAY,
+                 max_probe_delay: float = QUARANTINE_PROBE_MAX_DELAY, clock: Callable[[], float] = time.monotonic):
+        self.failures = failures
+        self.probe_delay = probe_delay
+        self.max_probe_delay = max_probe_delay
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.devices: Dict[int, _Device] = {}
+
+    def available(self, address: int) -> bool:
+        """False while the device is quarantined."""
+        device = self.devices.get(address)
+        return device is None or not device.quarantined
+
+    def success(self, address: int):
+        with self.lock:
+            device = self.devices.get(address)
+            if device is not None and not device.quarantined:
+                device.failures = 0
+
+    def failure(self, address: int) -> bool:
+        """Count a failed operation, returns True if it quarantined the device."""
+        with self.lock:
+            device = self.devices.setdefault(address, _Device())
+            device.failures += 1
+            if device.quarantined or device.failures < self.failures:
+                return False
+            device.quarantined = True
+            device.probe_delay = self.probe_delay
+            device.next_probe = self.clock() + device.probe_delay
+            return True
+
+    def due_probes(self) -> List[int]:
+        """Quarantined devices due for a re-probe, each is returned once until probe_done()."""
+        now = self.clock()
+        with self.lock:
+            due = [address for address, device in self.devices.items()
+                   if device.quarantined and not device.probing and device.next_probe <= now]
+            for address in due:
+                self.devices[address].probing = True
+        return due
+
+    def probe_done(self, address: int, ok: bool) -> Optional[float]:
+        """
+        Result of a re-probe. A successful probe ends the quarantine and returns None, otherwise
+        the delay until the next probe is returned.
+        """
+        with self.lock:
+            device = self.devices[address]
+            device.probing = False
+            if ok:
+                device.failures = 0
+                device.quarantined = False
+                device.next_probe = float('inf')
+                return None
+            device.failures += 1
+            device.probe_delay = min(device.probe_delay * 2, self.max_probe_delay)
+            device.next_probe = self.clock() + device.probe_delay
+            return device.probe_delay
+
+    def next_probe(self) -> float:
+        """Earliest re-probe time of all quarantined devices (inf if none is quarantined)."""
+        with self.lock:
+            return min((device.next_probe for device in self.devices.values()
+                        if device.quarantined and not device.probing), default=float('inf'))
+
+    def quarantined(self) -> List[int]:
+        with self.lock:
+            return [address for address, device in self.devices.items() if device.quarantined]
@@ -0,0 +1,68 @@
+"""
+Topic dispatch for incoming MQTT messages.
+
+Exact topics are looked up in a dict, topic prefixes (like ``output/set/<module>/``) in a trie
+of topic levels. Resolved topics are cached, so the per-message cost does not grow with the
+number of registered commands or outputs.
+"""
+
+from functools import partial
+from typing import Callable, Optional
+
+
+# Handlers are called with (payload, msg), prefix handlers with (suffix, payload, msg)
+Handler = Callable[..., None]
+
+_HANDLER = object()
+
+
+class TopicDispatcher:
+    def __init__(self, cache_size: int = 1024):
+        self.exact = {}
+        self.trie = {}
+        self.cache = {}
+        self.cache_size = cache_size
+
+    def add(self, topic: str, handler: Handler):
+        """Call handler(payload, msg) for messages on exactly this topic."""
+        self.exact[topic] = handler
+        self.cache.clear()
+
+    def add_prefix(self, prefix: str, handler: Handler):
+        """Call handler(suffix, payload, msg) for messages on topics below prefix (the longest prefix wins)."""
+        node = self.trie
+        for level in prefix.strip('/').split('/'):
+            node = node.setdefault(level, {})
+        node[_HANDLER] = handler
+        self.cache.clear()
+
+    def resolve(self, topic: str) -> Optional[Handler]:
+        """Returns a callable taking (payload, msg) for the topic, or None if nothing handles it."""
+        try:
+            return self.cache[topic]
+        except KeyError:
+            pass
+
+        handler = self.exact.get(topic)
+        if handler is None:
+            handler = self._resolve_prefix(topic)
+
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[topic] = handler
+        return handler
+
+    def _resolve_prefix(self, topic: str) -> Optional[Handler]:
+        levels = topic.split('/')
+        node = self.trie
+        match = None
+        for depth, level in enumerate(levels):
+            node = node.get(level)
+            if node is None:
+                break
+            if _HANDLER in node and depth + 1 < len(levels):
+                match = (node[_HANDLER], depth + 1)
+        if match is None:
+            return None
+        handler, depth = match
+        return partial(handler, '/'.join(levels[depth:]))
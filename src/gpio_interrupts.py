@@ -0,0 +1,85 @@
+"""
+GPIO edge detection for the interrupt outputs of the MCP23017 input expanders.
+
+The INTA/INTB output of an expander is wired to a GPIO of the Pi. LgpioBackend claims these
+GPIOs with lgpio and calls back on falling edges, FakeGpioBackend does the same for lines
+driven in memory (tests and the hardware-free simulation). GPIO_BACKEND selects the backend.
+"""
+
+import os
+import threading
+from typing import Callable, Dict
+
+
+GPIO_BACKEND = os.getenv('GPIO_BACKEND', "lgpio")
+# gpiochip of the Pi header GPIOs (4 on a Pi 5 with older kernels)
+GPIO_CHIP = int(os.getenv('GPIO_CHIP', 0))
+
+
+class LgpioBackend:
+    """
+    GPIO edges through lgpio.
+
+    Args:
+        chip: Number of the gpiochip device
+    """
+
+    def __init__(self, chip: int = GPIO_CHIP):
+        import lgpio
+        self.lgpio = lgpio
+        self.handle = lgpio.gpiochip_open(chip)
+        self.callbacks = []
+
+    def claim_alert(self, gpio: int, callback: Callable[[int], None]):
+        """Call callback(gpio) on every falling edge of the (pulled up, active low) GPIO."""
+        self.lgpio.gpio_claim_alert(self.handle, gpio, self.lgpio.FALLING_EDGE, self.lgpio.SET_PULL_UP)
+        self.callbacks.append(self.lgpio.callback(self.handle, gpio, self.lgpio.FALLING_EDGE,
+                                                  lambda chip, line, level, timestamp: callback(line)))
+
+    def read(self, gpio: int) -> int:
+        return self.lgpio.gpio_read(self.handle, gpio)
+
+    def close(self):
+        for callback in self.callbacks:
+            callback.cancel()
+        self.lgpio.gpiochip_close(self.handle)
+
+
+class FakeGpioBackend:
+    """In-memory GPIO lines, set_level() drives a line like the wired interrupt output of an expander."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.levels: Dict[int, int] = {}
+        self.callbacks: Dict[int, Callable[[int], None]] = {}
+
+    def claim_alert(self, gpio: int, callback: Callable[[int], None]):
+        with self.lock:
+            self.levels.setdefault(gpio, 1)
+            self.callbacks[gpio] = callback
+
+    def read(self, gpio: int) -> int:
+        return self.levels.get(gpio, 1)
+
+    def set_level(self, gpio: int, level: int):
+        with self.lock:
+            falling = self.levels.get(gpio, 1) and not level
+            self.levels[gpio] = 1 if level else 0
+            callback = self.callbacks.get(gpio)
+        if falling and callback:
+            callback(gpio)
+
+    def close(self):
+        with self.lock:
+            self.callbacks.clear()
+
+
+# Shared by the node and the fake expanders driving its lines
+fake_backend = FakeGpioBackend()
+
+
+def open_backend(name: str = GPIO_BACKEND):
+    """GPIO backend by name ("lgpio" or "fake"), raises if lgpio or the gpiochip is not available."""
+    if name == "fake":
+        return fake_backend
+    return LgpioBackend()
@@ -1,23 +1,87 @@
+from arduino_protocol import MAX_BATCH_PAIRS, PROBE_LENGTH, encode_batch, encode_legacy, supports_batch
+from bus_monitor import BUS_MONITOR_INTERVAL, BUS_UTILISATION_WARNING, DEFAULT_BUS_FREQUENCY, BusMonitor
+from bus_worker import BACKGROUND, INPUT, OUTPUT, BusWorker
+from device_health import DeviceHealth
+from gpio_interrupts import open_backend
+from input_events import DEFAULT_DEBOUNCE, DEFAULT_DOUBLE_PRESS, DEFAULT_LONG_PRESS, InputGestures
+from metrics import registry as metrics
 from piexpchair import PiExpChair
 from retry_utils import retry_with_context
 
-import board
-import busio
-import digitalio
-import struct
+import json
+import os
+import threading
 import time
-from adafruit_mcp230xx.mcp23017 import MCP23017
+from collections import deque
 
-i2c = busio.I2C(board.SCL, board.SDA)
+# "poll" ignores the configured interrupt lines and polls all inputs
+I2C_INPUT_MODE = os.getenv('I2C_INPUT_MODE', "interrupt")
+# Full input scan in interrupt mode, in case an edge got lost
+INTERRUPT_RESCAN_INTERVAL = float(os.getenv('INTERRUPT_RESCAN_INTERVAL', 1.0))
+
+# "adaptive" scans the polled inputs slower while nothing happens, "fixed" every poll_interval
+I2C_SCAN_MODE = os.getenv('I2C_SCAN_MODE', "adaptive")
+# Scan intervals in seconds after activity, during a scene and in a long idle period
+SCAN_INTERVALS = {
+    "active": float(os.getenv('SCAN_INTERVAL_ACTIVE', 0.01)),
+    "scene": float(os.getenv('SCAN_INTERVAL_SCENE', 0.02)),
+    "idle": float(os.getenv('SCAN_INTERVAL_IDLE', 0.04)),
+}
+# Seconds of fast scanning after activity (input change, scene start, start of the idle animation)
+SCAN_ACTIVE_HOLD = float(os.getenv('SCAN_ACTIVE_HOLD', 10))
+# Seconds without activity in idle until the idle interval is used
+SCAN_IDLE_BACKOFF = float(os.getenv('SCAN_IDLE_BACKOFF', 60))
+
+# MCP23017 IOCON: INTA and INTB both report all 16 pins, open-drain so several expanders can share a GPIO
+IOCON_MIRROR = 0x40
+IOCON_ODR = 0x04
+
+_i2c_bus = None
+
+
+def get_i2c_bus(frequency=DEFAULT_BUS_FREQUENCY):
+    """
+    Open the I2C bus on first use, importing the board support is slow and needs the hardware.
+
+    The frequency only applies when the bus is opened. On Linux (Raspberry Pi) the kernel driver
+    owns the clock, set it with dtparam=i2c_arm_baudrate in config.txt.
+    """
+    global _i2c_bus
+    if _i2c_bus is None:
+        import board
+        import busio
+        _i2c_bus = busio.I2C(board.SCL, board.SDA, frequency=frequency)
+    return _i2c_bus
+
+
+def _merge_port_writes(pending, new):
+    """Arguments of one port write doing a pending (address, mask, value) write and then a new one."""
+    address, mask, value = pending
+    _, new_mask, new_value = new
+    return address, mask | new_mask, (value & ~new_mask) | (new_value & new_mask)
+
+
+def _merge_channel_values(pending, new):
+    """Arguments of one Arduino write doing a pending (address, {pin: value}) write and then a new one."""
+    return pending[0], {**pending[1], **new[1]}
 
 
 class I2cController(PiExpChair):
+    # Inputs are polled
+    poll_interval = 0.01
+    follows_videoplayer = True
+
     def __init__(self):
         super().__init__(identifier="i2c")
 
         if self.terminate:
             return
 
+        # Transactions, bytes and errors per address, utilisation against the bus frequency
+        self.bus_frequency = self.config['i2c'].get('bus_frequency', DEFAULT_BUS_FREQUENCY)
+        self.bus_monitor = BusMonitor(self.bus_frequency)
+        self.next_bus_report = time.monotonic() + BUS_MONITOR_INTERVAL
+
         # find all i2c addresses (MCP23017)
         i2c_addresses = []
         for key in self.config['i2c']['input']:
@@ -34,6 +98,12 @@ class I2cController(PiExpChair):
                 self.arduino_devices[device_name] = device_config
                 self.logger.debug(
                     f"Found Arduino device {device_name} in config at address: {hex(device_config['address'])}")
+        # "batch" or "legacy" frames per Arduino address, probed before the first write
+        self.arduino_protocols = {}
+        # Device names per (address, pin) of the Arduino outputs
+        self.arduino_channels = {}
+        for device_name, device in self.arduino_devices.items():
+            self.arduino_channels.setdefault((device['address'], device['pin']), []).append(device_name)
 
         self.mcp = {}
         self.input_states = {}
@@ -49,130 +119,361 @@ class I2cController(PiExpChair):
                 self.terminate = True
                 return
 
-        self.i2c_inputs = {}
+        # Inputs grouped by MCP23017 address as (input name, pin mask), all pins of a chip are read at once
+        self.input_groups = {}
+        # Last read GPIOA/GPIOB value per address, inputs are pulled up
+        self.input_ports = {}
+        # Debounce and gesture detection per input, command per (input name, gesture)
+        self.input_gestures = {}
+        self.input_commands = {}
+        timing = self.config['i2c'].get('gestures', {})
+        debounce_ms = timing.get('debounce_ms', DEFAULT_DEBOUNCE * 1000)
+        long_press = timing.get('long_press_ms', DEFAULT_LONG_PRESS * 1000) / 1000
+        double_press = timing.get('double_press_ms', DEFAULT_DOUBLE_PRESS * 1000) / 1000
         for input_name in self.config['i2c']['input'].keys():
             self.logger.debug(f"Configure input button for {input_name}")
             input = self.config['i2c']['input'][input_name]
-            self.i2c_inputs[input_name] = self.mcp[input['address']].get_pin(input['pin'])
-            self.i2c_inputs[input_name].direction = digitalio.Direction.INPUT
-            self.i2c_inputs[input_name].direction = digitalio.Direction.INPUT
-            self.i2c_inputs[input_name].pull = digitalio.Pull.UP
             self.input_states[input_name] = True
-
-        self.i2c_outputs = {}
+            self.input_groups.setdefault(input['address'], []).append((input_name, 1 << input['pin']))
+            self.input_ports[input['address']] = 0xFFFF
+            self.input_gestures[input_name] = InputGestures(
+                input_name, debounce=input.get('debounce_ms', debounce_ms) / 1000,
+                long_press=long_press if 'long_press' in input else None,
+                double_press=double_press if 'double_press' in input else None)
+            self.input_commands[(input_name, "press")] = input_name
+            for gesture in ("long_press", "double_press"):
+                if gesture in input:
+                    self.input_commands[(input_name, gesture)] = input[gesture]
+
+        # Address and pin mask per output, the outputs of a chip are written at once
+        self.output_pins = {}
+        # Outputs grouped by MCP23017 address as (output name, pin mask)
+        self.output_groups = {}
+        # Last written GPIOA/GPIOB value per output address (None: unknown, read before the next write)
+        self.output_ports = {}
         for output_name in self.config['i2c']['output'].keys():
             self.logger.debug(f"Configure output {output_name}")
             output = self.config['i2c']['output'][output_name]
-            self.i2c_outputs[output_name] = self.mcp[output['address']].get_pin(output['pin'])
-            self.i2c_outputs[output_name].direction = digitalio.Direction.OUTPUT
+            self.output_pins[output_name] = (output['address'], 1 << output['pin'])
+            self.output_groups.setdefault(output['address'], []).append((output_name, 1 << output['pin']))
+            self.output_ports[output['address']] = None
+
+        for address in set(self.input_groups) | set(self.output_groups):
+            self._configure_pins(address)
+
+        # Devices failing repeatedly are skipped and re-probed in the background
+        self.device_health = DeviceHealth()
+
+        # From here on only the bus worker touches the bus
+        self.bus = BusWorker().start()
+        # (output name, value, written, notify) of the writes done by the bus worker
+        self.completed_writes = deque()
+
+        # Input expanders woken by their interrupt line instead of polling, by Pi GPIO
+        self.interrupt_backend = None
+        self.interrupt_gpios = {}
+        # Interrupt enable mask per expander address, restored when a quarantined expander is back
+        self.interrupt_masks = {}
+        self.polled_addresses = list(self.input_groups)
+        self.interrupt_lock = threading.Lock()
+        # Time of the first unhandled falling edge per GPIO
+        self.pending_interrupts = {}
+        self.next_rescan_time = 0.0
+        self.setup_interrupts()
+
+        # Adaptive scan rate of the polled inputs
+        self.in_scene = False
+        self.last_activity = time.monotonic()
+        self.scan_mode = None
 
         # Disable all outputs at startup
         self.set_idle_outputs()
 
+    def setup_interrupts(self):
+        """Configure interrupt-on-change for the input expanders with a wired interrupt line."""
+        interrupts = self.config['i2c'].get('interrupts', {})
+        if not interrupts or I2C_INPUT_MODE == "poll":
+            return
+        try:
+            backend = open_backend()
+        except Exception as e:
+            self.logger.warning(f"GPIO interrupts not available ({type(e).__name__}: {e}), polling the inputs")
+            return
+
+        for address, inputs in self.input_groups.items():
+            if address not in interrupts:
+                continue
+            mask = 0
+            for input_name, pin_mask in inputs:
+                mask |= pin_mask
+            try:
+                self.bus.call(BACKGROUND, self._configure_interrupts, address, mask)
+            except (OSError, IOError, RuntimeError) as e:
+                self.logger.error(f"Failed to configure interrupts of {hex(address)}, polling its inputs: {e}")
+                continue
+            self.interrupt_gpios.setdefault(interrupts[address], []).append(address)
+            self.interrupt_masks[address] = mask
+
+        try:
+            for gpio in self.interrupt_gpios:
+                backend.claim_alert(gpio, self.on_input_interrupt)
+        except Exception as e:
+            self.logger.warning(f"Failed to claim GPIO interrupts ({type(e).__name__}: {e}), polling the inputs")
+            self.interrupt_gpios = {}
+            return
+
+        self.interrupt_backend = backend
+        self.polled_addresses = [address for address in self.input_groups
+                                 if not any(address in addresses for addresses in self.interrupt_gpios.values())]
+        if not self.polled_addresses:
+            # Only the rescan of the interrupt driven inputs is left to poll
+            self.scheduler.poll_interval = INTERRUPT_RESCAN_INTERVAL
+        self.logger.info(f"Input interrupts on GPIO {', '.join(str(gpio) for gpio in self.interrupt_gpios)}, "
+                         f"polling {len(self.polled_addresses)} input expanders")
+
+    def on_input_interrupt(self, gpio):
+        """Falling edge of an interrupt line (called from the GPIO backend thread)."""
+        metrics.inc("input_interrupts_total", gpio=gpio)
+        with self.interrupt_lock:
+            self.pending_interrupts.setdefault(gpio, time.monotonic())
+        self.scheduler.wake()
+
     @retry_with_context("MCP23017 initialization", max_attempts=5, delay=0.2, exceptions=(OSError, IOError, RuntimeError))
     def _initialize_mcp(self, addr):
         """Initialize MCP23017 device with retry logic."""
-        self.mcp[addr] = MCP23017(i2c, addr)
-
-    @retry_with_context("I2C pin read", max_attempts=3, delay=0.05, exceptions=(OSError, IOError))
-    def _read_pin_value(self, pin):
-        """Read pin value with retry logic."""
-        return pin.value
+        from adafruit_mcp230xx.mcp23017 import MCP23017
+        mcp = MCP23017(get_i2c_bus(self.bus_frequency), addr, reset=False)
+        # The reset of the MCP23017 constructor, with every write counted by the bus monitor
+        metrics.inc("i2c_writes_total", 4, device="mcp23017")
+        with self.bus_monitor.transfer(addr, 3):
+            mcp.iodir = 0xFFFF
+        with self.bus_monitor.transfer(addr, 3):
+            mcp.gppu = 0x0000
+        with self.bus_monitor.transfer(addr, 2):
+            mcp.io_control = IOCON_ODR
+        with self.bus_monitor.transfer(addr, 3):
+            mcp.ipol = 0x0000
+        self.mcp[addr] = mcp
+
+    @retry_with_context("I2C port read", max_attempts=3, delay=0.05, exceptions=(OSError, IOError))
+    def _read_port(self, address):
+        """Read GPIOA and GPIOB of an MCP23017 in one transaction with retry logic."""
+        metrics.inc("i2c_reads_total")
+        # Register address, repeated start, two bytes
+        with self.bus_monitor.transfer(address, 3, segments=2):
+            return self.mcp[address].gpio
+
+    @retry_with_context("I2C interrupt read", max_attempts=3, delay=0.05, exceptions=(OSError, IOError))
+    def _read_captured_port(self, address, check_flags):
+        """
+        Read the port captured at the interrupt (INTCAPA/INTCAPB), which also clears the interrupt.
 
-    @retry_with_context("I2C pin write", max_attempts=3, delay=0.05, exceptions=(OSError, IOError))
-    def _write_pin_value(self, pin, value):
-        """Write pin value with retry logic."""
-        pin.value = value
+        With check_flags (expanders sharing an interrupt line) the interrupt flags are read first,
+        returns None if this expander did not interrupt.
+        """
+        mcp = self.mcp[address]
+        if check_flags:
+            metrics.inc("i2c_reads_total")
+            with self.bus_monitor.transfer(address, 3, segments=2):
+                if not mcp.int_flag:
+                    return None
+        metrics.inc("i2c_reads_total")
+        with self.bus_monitor.transfer(address, 3, segments=2):
+            # adafruit_mcp230xx returns the 16 captured levels as a list of bits
+            captured = mcp.int_cap
+        return sum(bit << pin for pin, bit in enumerate(captured))
+
+    @retry_with_context("MCP23017 interrupt setup", max_attempts=3, delay=0.05, exceptions=(OSError, IOError))
+    def _configure_interrupts(self, address, mask):
+        """Interrupt on every change of the masked pins (compared to their previous value)."""
+        mcp = self.mcp[address]
+        metrics.inc("i2c_writes_total", device="mcp23017")
+        with self.bus_monitor.transfer(address, 2):
+            mcp.io_control = IOCON_MIRROR | IOCON_ODR
+        with self.bus_monitor.transfer(address, 3):
+            mcp.interrupt_configuration = 0x0000
+        with self.bus_monitor.transfer(address, 3):
+            mcp.interrupt_enable = mask
+        with self.bus_monitor.transfer(address, 3, segments=2):
+            mcp.clear_ints()
+
+    def _configure_pins(self, address):
+        """Inputs with pull-up and outputs of an expander, one read-modify-write of IODIR and GPPU each."""
+        mcp = self.mcp[address]
+        input_mask = 0
+        for input_name, pin_mask in self.input_groups.get(address, []):
+            input_mask |= pin_mask
+        output_mask = 0
+        for output_name, pin_mask in self.output_groups.get(address, []):
+            output_mask |= pin_mask
+
+        metrics.inc("i2c_reads_total")
+        with self.bus_monitor.transfer(address, 3, segments=2):
+            iodir = mcp.iodir
+        metrics.inc("i2c_writes_total", device="mcp23017")
+        with self.bus_monitor.transfer(address, 3):
+            mcp.iodir = (iodir | input_mask) & ~output_mask
+        if input_mask:
+            metrics.inc("i2c_reads_total")
+            with self.bus_monitor.transfer(address, 3, segments=2):
+                gppu = mcp.gppu
+            metrics.inc("i2c_writes_total", device="mcp23017")
+            with self.bus_monitor.transfer(address, 3):
+                mcp.gppu = gppu | input_mask
+
+    @retry_with_context("I2C port write", max_attempts=3, delay=0.05, exceptions=(OSError, IOError))
+    def _write_port(self, address, mask, value):
+        """Set the masked pins of an MCP23017 to value in one GPIOA/GPIOB write, with retry logic."""
+        mcp = self.mcp[address]
+        port = self.output_ports[address]
+        if port is None:
+            metrics.inc("i2c_reads_total")
+            with self.bus_monitor.transfer(address, 3, segments=2):
+                port = mcp.gpio
+        # Unknown until the write went through
+        self.output_ports[address] = None
+        port = (port & ~mask) | (value & mask)
+        metrics.inc("i2c_writes_total", device="mcp23017")
+        with self.bus_monitor.transfer(address, 3):
+            mcp.gpio = port
+        self.output_ports[address] = port
+
+    @staticmethod
+    def _lock_bus(i2c, address):
+        # The bus worker is the only user of the bus, so the lock is free
+        if not i2c.try_lock():
+            raise RuntimeError(f"I2C bus locked outside the bus worker, cannot reach the Arduino at {hex(address)}")
 
     @retry_with_context("Arduino I2C write", max_attempts=3, delay=0.1, exceptions=(OSError, IOError, RuntimeError))
     def _arduino_i2c_write(self, address, data):
-        """Write data to Arduino device with retry logic and proper locking."""
-        lock_timeout = time.time() + 2.0  # 2 second timeout for lock acquisition
-
-        while not i2c.try_lock():
-            if time.time() > lock_timeout:
-                raise RuntimeError(f"Failed to acquire I2C lock for Arduino at {hex(address)} within 2 seconds")
-            time.sleep(0.01)
-
+        """Write data to Arduino device with retry logic."""
+        i2c = get_i2c_bus()
+        self._lock_bus(i2c, address)
         try:
-            i2c.writeto(address, data)
+            metrics.inc("i2c_writes_total", device="arduino")
+            with self.bus_monitor.transfer(address, len(data)):
+                i2c.writeto(address, data)
         finally:
             i2c.unlock()
 
-    def on_connect(self, client, userdata, flags, reason_code, properties):
-        super().on_connect(client, userdata, flags, reason_code, properties)
-        self.mqtt_subscribe(client, "videoplayer/#")
-
-    def on_message(self, client, userdata, msg):
-        super().on_message(client, userdata, msg)
-
+    def _arduino_i2c_read(self, address, nbytes):
+        """Read from an Arduino device (no retries, legacy sketches may not answer reads at all)."""
+        i2c = get_i2c_bus()
+        self._lock_bus(i2c, address)
         try:
-            if msg.topic == f"{self.mqtt_config['base_topic']}/videoplayer/scene":
-                payload = msg.payload.decode()
-                if payload == "":
-                    self.logger.info("Received play no scene command")
-                else:
-                    try:
-                        self.current_scene_index = int(payload)
-                        if 0 <= self.current_scene_index < len(self.config['scenes']):
-                            self.logger.info(f"Received scene index {self.current_scene_index} to play")
-                            self.play_scene(True)
-                            self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/scene", self.current_scene_index, qos=1)
-                        else:
-                            self.logger.warning(f"Received out-of-range scene index: {self.current_scene_index} (valid: 0-{len(self.config['scenes'])-1})")
-                    except ValueError as e:
-                        self.logger.error(f"Invalid scene index format: '{payload}': {e}")
-
-            elif msg.topic == f"{self.mqtt_config['base_topic']}/videoplayer/idle":
-                self.logger.info("Received idle scene command")
-                self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/idle", True, qos=1)
-                self.set_idle_outputs()
-
-        except UnicodeDecodeError as e:
-            self.logger.error(f"Failed to decode videoplayer message payload on topic {msg.topic}: {e}")
-        except Exception as e:
-            self.logger.error(f"Error processing videoplayer message on topic {msg.topic}: {type(e).__name__}: {e}", exc_info=True)
+            metrics.inc("i2c_reads_total")
+            buffer = bytearray(nbytes)
+            with self.bus_monitor.transfer(address, nbytes):
+                i2c.readfrom_into(address, buffer)
+            return bytes(buffer)
+        finally:
+            i2c.unlock()
 
-    def play_scene(self, scene_index):
-        # Reset output magic
-        self.check_for_output_change(start=True)
+    def arduino_protocol(self, address):
+        """Frame format ("batch" or "legacy") of an Arduino device, probed on first use."""
+        protocol = self.arduino_protocols.get(address)
+        if protocol is None:
+            try:
+                response = self._arduino_i2c_read(address, PROBE_LENGTH)
+            except (OSError, IOError, RuntimeError) as e:
+                # Not cached, the next write (or the quarantine re-probe) probes again
+                self.logger.debug(f"Arduino at {hex(address)} did not answer the protocol probe: {e}")
+                return "legacy"
+            protocol = "batch" if supports_batch(response) else "legacy"
+            self.logger.info(f"Arduino at {hex(address)} uses {protocol} frames")
+            self.arduino_protocols[address] = protocol
+        return protocol
 
     def apply_scene_outputs(self, current_outputs):
+        writes = []
         if 'i2c_outputs' in current_outputs:
-            for output_name, state in current_outputs['i2c_outputs'].items():
-                self.set_i2c_output(output_name, state)
+            writes += self.set_i2c_outputs({output_name: bool(state) for output_name, state in current_outputs['i2c_outputs'].items()
+                                            if self.output_changed(output_name, bool(state))})
         if 'arduino_outputs' in current_outputs:
-            for device_name, value in current_outputs['arduino_outputs'].items():
-                self.set_arduino_output(device_name, value)
+            writes += self.set_arduino_outputs({device_name: value for device_name, value in current_outputs['arduino_outputs'].items()
+                                                if self.output_changed(device_name, max(0, min(255, int(value))))})
+        # The profile is applied once its writes are done
+        for write in writes:
+            write.result()
+        self.handle_completed_writes()
 
     def set_i2c_output(self, output_name, state):
-        self.logger.debug(f"Setting output {output_name} to state: {state}")
-        if output_name in self.i2c_outputs:
-            try:
-                self._write_pin_value(self.i2c_outputs[output_name], bool(state))
-                self.output_notify(output_name, bool(state))
-            except Exception as e:
-                self.logger.error(f"Failed to set I2C output {output_name} to {state}: {e}")
-        else:
-            self.logger.warning(f"Unknown output: {output_name}")
+        return self.set_i2c_outputs({output_name: bool(state)})
+
+    def set_i2c_outputs(self, states):
+        """
+        Set outputs {name: state}, with one write per MCP23017 so the outputs of a chip switch together
+        :return: Futures of the queued writes, the outputs are confirmed by handle_completed_writes()
+        """
+        ports = {}
+        for output_name, state in states.items():
+            self.logger.debug(f"Setting output {output_name} to state: {state}")
+            if output_name not in self.output_pins:
+                self.logger.warning(f"Unknown output: {output_name}")
+                continue
+            address, pin_mask = self.output_pins[output_name]
+            if not self.device_health.available(address):
+                # Written again with the first profile after the quarantine
+                self.forget_output(output_name)
+                continue
+            mask, value = ports.get(address, (0, 0))
+            ports[address] = (mask | pin_mask, value | pin_mask if state else value & ~pin_mask)
+
+        return [self.bus.submit(OUTPUT, self._write_outputs, address, mask, value,
+                                key=("write", address), merge=_merge_port_writes)
+                for address, (mask, value) in ports.items()]
+
+    def _write_outputs(self, address, mask, value):
+        """Bus worker: write the masked outputs of an MCP23017 and queue their confirmation."""
+        outputs = [(output_name, pin_mask) for output_name, pin_mask in self.output_groups[address] if mask & pin_mask]
+        try:
+            self._write_port(address, mask, value)
+            written = True
+            self.device_health.success(address)
+        except Exception as e:
+            self.logger.error(f"Failed to set I2C outputs {', '.join(name for name, _ in outputs)} on {hex(address)}: {e}")
+            written = False
+            self.device_failed(address, e)
+        for output_name, pin_mask in outputs:
+            self.completed_writes.append((output_name, bool(value & pin_mask), written, written))
+        self.scheduler.wake()
 
     def send_arduino_command(self, address, output_pin, value):
         """
-        Send command to Arduino device using the custom protocol
+        Send command to Arduino device using the legacy two byte protocol
         :param address: i2c Address
         :param output_pin: Output pin number (0-255)
         :param value: Value to set (0-255)
+        :return: True if the command was sent
         """
         try:
-            # Pack two bytes as struct
-            data = struct.pack('BB', output_pin, value)
-
             # Write the data to the I2C bus with retry logic
-            self._arduino_i2c_write(address, data)
+            self._arduino_i2c_write(address, encode_legacy(output_pin, value))
+            metrics.inc("arduino_frames_total", protocol="legacy")
 
             self.logger.debug(f"Sent command to Arduino {hex(address)}: pin={output_pin}, value={value}")
+            return True
         except Exception as e:
             self.logger.error(f"Failed to send command to Arduino at address {hex(address)}: pin={output_pin}, value={value}. Error: {e}")
+            return False
+
+    def send_arduino_batch(self, address, pairs):
+        """
+        Send several commands to an Arduino device, up to MAX_BATCH_PAIRS per batch frame
+        :param address: i2c Address
+        :param pairs: List of (output pin, value)
+        :return: True if all frames were sent
+        """
+        try:
+            for start in range(0, len(pairs), MAX_BATCH_PAIRS):
+                self._arduino_i2c_write(address, encode_batch(pairs[start:start + MAX_BATCH_PAIRS]))
+                metrics.inc("arduino_frames_total", protocol="batch")
+
+            self.logger.debug(f"Sent {len(pairs)} commands to Arduino {hex(address)}: {pairs}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Failed to send {len(pairs)} commands to Arduino at address {hex(address)}. Error: {e}")
+            return False
 
     def set_arduino_output(self, device_name, value):
         """
@@ -180,19 +481,69 @@ class I2cController(PiExpChair):
         :param device_name: Name of the Arduino device from config
         :param value: Value to set (0-255 for PWM, 0 or 1 for digital)
         """
-        if device_name not in self.arduino_devices.keys():
-            self.logger.warning(f"Unknown Arduino device: {device_name}")
-            return
-
-        device = self.arduino_devices[device_name]
+        return self.set_arduino_outputs({device_name: value})
 
-        # Ensure value is in valid range
-        value = max(0, min(255, int(value)))
-
-        self.send_arduino_command(device['address'], device['pin'], value)
-        self.output_notify(device_name, value)
+    def set_arduino_outputs(self, values):
+        """
+        Set Arduino outputs {device name: value}, with one batch frame per Arduino if it supports them
+        :param values: Value per Arduino device name from config (0-255 for PWM, 0 or 1 for digital)
+        :return: Futures of the queued writes, the outputs are confirmed by handle_completed_writes()
+        """
+        addresses = {}
+        for device_name, value in values.items():
+            if device_name not in self.arduino_devices.keys():
+                self.logger.warning(f"Unknown Arduino device: {device_name}")
+                continue
+            device = self.arduino_devices[device_name]
+            if not self.device_health.available(device['address']):
+                self.forget_output(device_name)
+                continue
+            # Ensure value is in valid range
+            addresses.setdefault(device['address'], {})[device['pin']] = max(0, min(255, int(value)))
+
+        return [self.bus.submit(OUTPUT, self._write_arduino_outputs, address, pins,
+                                key=("arduino", address), merge=_merge_channel_values)
+                for address, pins in addresses.items()]
+
+    def _write_arduino_outputs(self, address, pins):
+        """Bus worker: send the {pin: value} of an Arduino and queue the confirmation of its outputs."""
+        pairs = list(pins.items())
+        if self.arduino_protocol(address) == "batch":
+            sent = self.send_arduino_batch(address, pairs)
+            results = {pin: sent for pin in pins}
+        else:
+            results = {pin: False for pin in pins}
+            for pin, value in pairs:
+                # A device that does not take one frame is not tried with the others
+                if not self.send_arduino_command(address, pin, value):
+                    break
+                results[pin] = True
+        if all(results.values()):
+            self.device_health.success(address)
+        else:
+            # The device may have been reset or replaced, probe it again before the next write
+            self.arduino_protocols.pop(address, None)
+            self.device_failed(address, "write failed")
+
+        for pin, value in pairs:
+            for device_name in self.arduino_channels[(address, pin)]:
+                self.completed_writes.append((device_name, value, results[pin], True))
+        self.scheduler.wake()
+
+    def handle_completed_writes(self):
+        """Confirm (or forget) and notify the outputs written by the bus worker (MQTT thread or main loop)."""
+        with self.notify_lock:
+            while self.completed_writes:
+                output_name, value, written, notify = self.completed_writes.popleft()
+                if written:
+                    self.confirm_output(output_name, value)
+                else:
+                    self.forget_output(output_name)
+                if notify:
+                    self.output_notify(output_name, value)
 
     def output_set(self, name, value):
+        """Queue the write of an output (MQTT thread), the main loop confirms it once written."""
         self.logger.info(f"Setting {name} to {value}")
         if name in self.arduino_devices.keys():
             self.logger.debug(f"Found arduino device: {name}")
@@ -202,33 +553,230 @@ class I2cController(PiExpChair):
             self.set_i2c_output(name, value)
 
     def module_run(self):
+        # Writes queued by output/set messages
+        self.handle_completed_writes()
+        self.flush_output_notify()
         self.handle_output_change()
-        for input_name in self.i2c_inputs.keys():
+        self.poll_input_gestures()
+        self.probe_quarantined()
+        self.update_scan_interval()
+        self.report_bus_usage()
+        if self.interrupt_backend is None:
+            self.scan_inputs(self.input_groups)
+            return
+
+        self.scan_inputs(self.polled_addresses)
+        now = time.monotonic()
+        if now >= self.next_rescan_time:
+            self.next_rescan_time = now + INTERRUPT_RESCAN_INTERVAL
+            self.scan_inputs([address for addresses in self.interrupt_gpios.values() for address in addresses])
+            return
+
+        with self.interrupt_lock:
+            gpios, self.pending_interrupts = self.pending_interrupts, {}
+        for gpio, addresses in self.interrupt_gpios.items():
+            # A line still held low has an interrupt nobody read yet
+            if gpio in gpios or not self.interrupt_backend.read(gpio):
+                for address in addresses:
+                    self.scan_interrupt(address, check_flags=len(addresses) > 1, interrupted_at=gpios.get(gpio))
+
+    def on_videoplayer_scene_message(self, payload, msg):
+        super().on_videoplayer_scene_message(payload, msg)
+        if payload != "":
+            self.in_scene = True
+            self.scan_activity()
+
+    def on_videoplayer_idle_message(self, payload, msg):
+        super().on_videoplayer_idle_message(payload, msg)
+        if payload != "":
+            self.in_scene = False
+            self.scan_activity()
+
+    def scan_activity(self, timestamp=None):
+        """Scan the inputs fast for SCAN_ACTIVE_HOLD seconds, a visitor is likely to press a button."""
+        self.last_activity = timestamp or time.monotonic()
+        if self.scan_mode not in (None, "active"):
+            # Shorten the sleep of the loop right away
+            self.scheduler.wake()
+
+    def current_scan_mode(self, now):
+        if now - self.last_activity < SCAN_ACTIVE_HOLD:
+            return "active"
+        if self.in_scene or now - self.last_activity < SCAN_IDLE_BACKOFF:
+            return "scene"
+        return "idle"
+
+    def update_scan_interval(self):
+        """Poll interval of the main loop by scan mode (polled inputs only, interrupts need no polling)."""
+        if I2C_SCAN_MODE != "adaptive" or not self.polled_addresses:
+            return
+        mode = self.current_scan_mode(time.monotonic())
+        if mode == self.scan_mode:
+            return
+        self.logger.debug(f"Scanning the inputs every {SCAN_INTERVALS[mode] * 1000:.0f} ms ({mode})")
+        self.scan_mode = mode
+        self.scheduler.poll_interval = SCAN_INTERVALS[mode]
+        metrics.set("input_scan_interval_seconds", SCAN_INTERVALS[mode])
+
+    def report_bus_usage(self):
+        """Log the bus usage and update its gauges every BUS_MONITOR_INTERVAL seconds."""
+        now = time.monotonic()
+        if not BUS_MONITOR_INTERVAL or now < self.next_bus_report:
+            return
+        self.next_bus_report = now + BUS_MONITOR_INTERVAL
+        report = self.bus_monitor.report()
+        devices = ", ".join(f"{address}: {usage['transactions_per_second']:.0f} tx/s, {usage['bytes_per_second']:.0f} B/s"
+                            + (f", {usage['errors']} errors" if usage['errors'] else "")
+                            for address, usage in report['addresses'].items())
+        message = f"I2C bus {report['utilisation']:.1%} busy at {self.bus_frequency / 1000:.0f} kHz ({devices})"
+        if report['utilisation'] > BUS_UTILISATION_WARNING:
+            self.logger.warning(message)
+        else:
+            self.logger.debug(message)
+
+    def scan_inputs(self, addresses):
+        """Read the inputs of the given expanders and handle the changed ones."""
+        # Queue all reads before waiting, the bus worker runs them back to back
+        reads = [(address, self.bus.submit(INPUT, self._read_port, address, key=("read", address)))
+                 for address in addresses if self.device_health.available(address)]
+        for address, read in reads:
             try:
-                current_value = self._read_pin_value(self.i2c_inputs[input_name])
-                if current_value != self.input_states[input_name]:
-                    self.logger.debug(f"Input {input_name} changed to {current_value}")
-                    self.input_states[input_name] = current_value
-                    if not current_value:
-                        if input_name == "play":
-                            self.logger.debug("Detected play button press")
-                            self.send_play()
-                        elif input_name == "stop":
-                            self.logger.debug("Detected stop button press")
-                            self.send_stop()
-                        elif input_name == "next":
-                            self.logger.debug("Detected next button press")
-                            self.send_next()
-                        elif input_name == "prev":
-                            self.logger.debug("Detected prev button press")
-                            self.send_prev()
-                        elif input_name == "shutdown":
-                            self.logger.debug("Detected shutdown button press")
-                            self.send_shutdown()
-                            with open("tmp/shutdown_computer", "w") as text_file:
-                                text_file.write(f"Force system shutdown from i2c at {time.time()}")
+                port = read.result()
             except (OSError, IOError, RuntimeError) as e:
-                self.logger.error(f"Failed to read I2C input {input_name} after retries: {e}")
+                self.logger.error(f"Failed to read I2C inputs of {hex(address)} after retries: {e}")
+                self.device_failed(address, e)
+                continue
+            self.device_health.success(address)
+            self.handle_input_port(address, port, time.monotonic())
+
+    def scan_interrupt(self, address, check_flags, interrupted_at=None):
+        """
+        Handle the pin levels captured at the interrupt (a short press may be over already), then the current ones.
+
+        The captured levels are timestamped with the interrupt edge if it was seen (interrupted_at).
+        """
+        if not self.device_health.available(address):
+            return
+        try:
+            captured = self.bus.call(INPUT, self._read_captured_port, address, check_flags)
+            if captured is None:
+                return
+            self.handle_input_port(address, captured, interrupted_at or time.monotonic())
+            port = self.bus.call(INPUT, self._read_port, address, key=("read", address))
+            self.handle_input_port(address, port, time.monotonic())
+            self.device_health.success(address)
+        except (OSError, IOError, RuntimeError) as e:
+            self.logger.error(f"Failed to read I2C interrupt of {hex(address)} after retries: {e}")
+            self.device_failed(address, e)
+
+    def device_kind(self, address):
+        return "MCP23017" if address in self.mcp else "Arduino"
+
+    def device_failed(self, address, error):
+        """Count a failed (already retried) operation of a device, quarantines it if it keeps failing."""
+        if not self.device_health.failure(address):
+            return
+        self.logger.error(f"{self.device_kind(address)} at {hex(address)} keeps failing, quarantined "
+                          f"(re-probe in {self.device_health.probe_delay:.1f} s): {error}")
+        metrics.inc("i2c_quarantines_total", address=hex(address))
+        self.publish_device_state(address, "quarantined", error)
+        # Schedule the re-probe
+        self.scheduler.wake()
+
+    def publish_device_state(self, address, state, error=None):
+        metrics.set("i2c_device_quarantined", 1 if state == "quarantined" else 0, address=hex(address))
+        self.publish(f"{self.mqtt_path_identifier}/device/{hex(address)}", json.dumps(
+            {"state": state, "kind": self.device_kind(address), "error": str(error) if error else None}))
+
+    def probe_quarantined(self):
+        """Queue the due re-probes of quarantined devices behind all other bus work."""
+        for address in self.device_health.due_probes():
+            self.bus.submit(BACKGROUND, self._probe_device, address)
+        self.scheduler.schedule(self.device_health.next_probe())
+
+    def _probe_device(self, address):
+        """Bus worker: one read without retries of a quarantined device, set up again if it answers."""
+        try:
+            if address in self.mcp:
+                metrics.inc("i2c_reads_total")
+                with self.bus_monitor.transfer(address, 3, segments=2):
+                    self.mcp[address].gpio
+                self._restore_mcp(address)
+            else:
+                self._arduino_i2c_read(address, PROBE_LENGTH)
+                # May have been replaced by a device speaking the other protocol
+                self.arduino_protocols.pop(address, None)
+        except (OSError, IOError, RuntimeError) as e:
+            delay = self.device_health.probe_done(address, False)
+            self.logger.debug(f"{self.device_kind(address)} at {hex(address)} still not answering ({e}), "
+                              f"next probe in {delay:.1f} s")
+            self.scheduler.wake()
+            return
+        self.device_health.probe_done(address, True)
+        self.logger.info(f"{self.device_kind(address)} at {hex(address)} is back, quarantine ended")
+        self.publish_device_state(address, "ok")
+        self.scheduler.wake()
+
+    def _restore_mcp(self, address):
+        """Configure the pins (and interrupts) of an expander again, it may have lost power."""
+        self._configure_pins(address)
+        if address in self.interrupt_masks:
+            self._configure_interrupts(address, self.interrupt_masks[address])
+        for output_name, pin_mask in self.output_groups.get(address, []):
+            # Written again with the next profile
+            self.forget_output(output_name)
+        if address in self.output_ports:
+            self.output_ports[address] = None
+
+    def handle_input_port(self, address, port, timestamp):
+        """Feed the changed inputs of a port sampled at timestamp to their gesture detection."""
+        changed = port ^ self.input_ports[address]
+        if not changed:
+            return
+        self.input_ports[address] = port
+        self.scan_activity(timestamp)
+        for input_name, mask in self.input_groups[address]:
+            if changed & mask:
+                current_value = bool(port & mask)
+                self.logger.debug(f"Input {input_name} changed to {current_value}")
+                self.input_states[input_name] = current_value
+                # Inputs are pulled up, pressed buttons read low
+                for event in self.input_gestures[input_name].edge(not current_value, timestamp):
+                    self.handle_input_event(event)
+
+    def poll_input_gestures(self):
+        """Handle the gestures completed by time passing and wake up for the next one."""
+        now = time.monotonic()
+        for gestures in self.input_gestures.values():
+            for event in gestures.poll(now):
+                self.handle_input_event(event)
+            self.scheduler.schedule(gestures.next_deadline())
+
+    def handle_input_event(self, event):
+        command = self.input_commands[(event.name, event.gesture)]
+        self.logger.debug(f"Input {event.name}: {event.gesture.replace('_', ' ')}, sending {command}")
+        self.handle_button_press(command)
+        metrics.observe("input_press_latency_seconds", time.monotonic() - event.pressed_at,
+                        input=event.name, gesture=event.gesture)
+
+    def handle_button_press(self, input_name):
+        if input_name == "play":
+            self.logger.debug("Detected play button press")
+            self.send_play()
+        elif input_name == "stop":
+            self.logger.debug("Detected stop button press")
+            self.send_stop()
+        elif input_name == "next":
+            self.logger.debug("Detected next button press")
+            self.send_next()
+        elif input_name == "prev":
+            self.logger.debug("Detected prev button press")
+            self.send_prev()
+        elif input_name == "shutdown":
+            self.logger.debug("Detected shutdown button press")
+            self.send_shutdown()
+            with open("tmp/shutdown_computer", "w") as text_file:
+                text_file.write(f"Force system shutdown from i2c at {time.time()}")
 
     def stop(self):
         self.logger.info("Received stop request. Disabling all outputs.")
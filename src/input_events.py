@@ -0,0 +1,114 @@
+"""
+Button gestures from timestamped input edges.
+
+The i2c node timestamps every level change it samples (input scan or interrupt capture) and feeds
+it to the InputGestures of the input. An edge within the debounce window of the previous accepted
+edge is a bouncing contact and dropped; the level it leaves behind is accepted once the window is
+over. Without gestures a press fires on its edge. With a long press configured, a press held for
+long_press seconds is a long press, with a double press configured two presses within
+double_press seconds are a double press; a single press then fires once it cannot become a
+gesture any more.
+"""
+
+from collections import namedtuple
+from typing import List, Optional
+
+from metrics import registry as metrics
+
+
+# Defaults of the i2c.gestures config, in seconds
+DEFAULT_DEBOUNCE = 0.02
+DEFAULT_LONG_PRESS = 0.8
+DEFAULT_DOUBLE_PRESS = 0.4
+
+# gesture is "press", "long_press" or "double_press", pressed_at the time of the (last) press edge
+InputEvent = namedtuple('InputEvent', ['name', 'gesture', 'pressed_at'])
+
+
+class InputGestures:
+    """
+    Debounce and gesture detection of one input.
+
+    Args:
+        name: Input name
+        debounce: Seconds after an accepted edge in which further edges are bounces
+        long_press: Seconds a press is held for a long press (None: no long press)
+        double_press: Seconds between two presses of a double press (None: no double press)
+    """
+
+    def __init__(self, name: str, debounce: float = DEFAULT_DEBOUNCE, long_press: Optional[float] = None,
+                 double_press: Optional[float] = None):
+        self.name = name
+        self.debounce = debounce
+        self.long_press = long_press
+        self.double_press = double_press
+
+        # Accepted state
+        self.pressed = False
+        self.last_edge = float('-inf')
+        # Last sampled level and when it changed, may differ from the accepted state while bouncing
+        self.level = False
+        self.level_time = float('-inf')
+        # Current press, None once it fired an event
+        self.press_time = None
+        # Released single press waiting for a second press
+        self.pending_press = None
+
+    def edge(self, pressed: bool, timestamp: float) -> List[InputEvent]:
+        """Sampled level change of the input, returns the events it completes."""
+        if pressed == self.level:
+            return []
+        self.level, self.level_time = pressed, timestamp
+        if timestamp - self.last_edge < self.debounce:
+            metrics.inc("input_bounces_total", input=self.name)
+            return []
+        return self._accept(pressed, timestamp)
+
+    def poll(self, now: float) -> List[InputEvent]:
+        """Events completed by time passing: a level settled after bouncing, a held long press, a single press."""
+        events = []
+        if self.level != self.pressed and now - self.last_edge >= self.debounce:
+            events += self._accept(self.level, max(self.level_time, self.last_edge + self.debounce))
+        if self.pressed and self.press_time is not None and self.long_press is not None \
+                and now - self.press_time >= self.long_press:
+            events.append(InputEvent(self.name, "long_press", self.press_time))
+            self.press_time = None
+        if self.pending_press is not None and now - self.pending_press > self.double_press:
+            events.append(InputEvent(self.name, "press", self.pending_press))
+            self.pending_press = None
+        return events
+
+    def next_deadline(self) -> float:
+        """Earliest time poll() may return an event."""
+        deadline = float('inf')
+        if self.level != self.pressed:
+            deadline = self.last_edge + self.debounce
+        if self.pressed and self.press_time is not None and self.long_press is not None:
+            deadline = min(deadline, self.press_time + self.long_press)
+        if self.pending_press is not None:
+            deadline = min(deadline, self.pending_press + self.double_press)
+        return deadline
+
+    def _accept(self, pressed: bool, timestamp: float) -> List[InputEvent]:
+        self.pressed, self.last_edge = pressed, timestamp
+        if pressed:
+            events = []
+            if self.pending_press is not None:
+                if timestamp - self.pending_press <= self.double_press:
+                    self.pending_press = self.press_time = None
+                    return [InputEvent(self.name, "double_press", timestamp)]
+                # Too late for a double press, poll() did not run in between
+                events.append(InputEvent(self.name, "press", self.pending_press))
+                self.pending_press = None
+            if self.long_press is None and self.double_press is None:
+                return events + [InputEvent(self.name, "press", timestamp)]
+            self.press_time = timestamp
+            return events
+
+        press_time, self.press_time = self.press_time, None
+        if press_time is None:
+            return []
+        if self.double_press is not None:
+            self.pending_press = press_time
+            return []
+        return [InputEvent(self.name, "press", press_time)]
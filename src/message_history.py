@@ -0,0 +1,93 @@
+"""
+Bounded history of received MQTT messages.
+
+Keeps the last few messages per topic in ring buffers, with O(1) access to the latest
+message of a topic and a global cap on the memory used by the payloads.
+"""
+
+import threading
+import time
+from collections import deque, namedtuple
+from typing import Dict, List, Optional
+
+
+# Timestamps are unique and increasing, seq orders messages across all topics
+MessageRecord = namedtuple('MessageRecord', ['timestamp', 'seq', 'payload'])
+
+# Smallest step between two timestamps, so messages within the same clock tick stay apart
+TIMESTAMP_STEP = 1e-6
+
+
+class MessageHistory:
+    """
+    Per-topic ring buffers of MessageRecords.
+
+    Args:
+        depth: Messages kept per topic
+        max_bytes: Upper limit for the sum of all stored payloads. When exceeded, the oldest
+            messages across all topics are dropped (the latest message of a topic is always kept).
+    """
+
+    def __init__(self, depth: int = 10, max_bytes: int = 1024 * 1024):
+        self.depth = depth
+        self.max_bytes = max_bytes
+
+        self.lock = threading.Lock()
+        self.buffers: Dict[str, deque] = {}
+        self.total_bytes = 0
+        self.seq = 0
+        self.last_timestamp = 0.0
+
+    def add(self, topic: str, payload: bytes, timestamp: Optional[float] = None) -> MessageRecord:
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self.lock:
+            if timestamp <= self.last_timestamp:
+                timestamp = self.last_timestamp + TIMESTAMP_STEP
+            self.last_timestamp = timestamp
+            self.seq += 1
+            record = MessageRecord(timestamp, self.seq, payload)
+
+            buffer = self.buffers.get(topic)
+            if buffer is None:
+                buffer = self.buffers[topic] = deque()
+            elif len(buffer) >= self.depth:
+                self.total_bytes -= len(buffer.popleft().payload)
+            buffer.append(record)
+            self.total_bytes += len(payload)
+
+            if self.total_bytes > self.max_bytes:
+                self._enforce_memory_cap()
+            return record
+
+    def _enforce_memory_cap(self):
+        while self.total_bytes > self.max_bytes:
+            oldest = None
+            for buffer in self.buffers.values():
+                if len(buffer) > 1 and (oldest is None or buffer[0].seq < oldest[0].seq):
+                    oldest = buffer
+            if oldest is None:
+                return
+            self.total_bytes -= len(oldest.popleft().payload)
+
+    def latest(self, topic: str) -> Optional[MessageRecord]:
+        """Latest message of a topic or None if nothing was received on it."""
+        buffer = self.buffers.get(topic)
+        try:
+            return buffer[-1] if buffer else None
+        except IndexError:
+            return None
+
+    def history(self, topic: str) -> List[MessageRecord]:
+        """Stored messages of a topic, newest first."""
+        with self.lock:
+            return list(reversed(self.buffers.get(topic, ())))
+
+    def snapshot(self) -> Dict[str, List[MessageRecord]]:
+        """All stored messages as {topic: [records, newest first]}."""
+        with self.lock:
+            return {topic: list(reversed(buffer)) for topic, buffer in self.buffers.items()}
+
+    def __contains__(self, topic: str) -> bool:
+        return topic in self.buffers
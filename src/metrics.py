@@ -0,0 +1,110 @@
+"""
+Lightweight metrics for the hot paths of the nodes.
+
+A process wide registry of counters, gauges and histograms. Nodes publish a compact summary of
+it over MQTT, the webui merges the summaries of all nodes and renders them in the Prometheus
+text format on /metrics.
+"""
+
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+
+# Upper bounds (seconds) of the histogram buckets, +Inf is implicit
+HISTOGRAM_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+SUMMARY_VERSION = 1
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, object]) -> Key:
+    if not labels:
+        return name, ()
+    return name, tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Key, float] = {}
+        self.gauges: Dict[Key, float] = {}
+        # Per histogram: non-cumulative bucket counts (last one is +Inf), sum and count
+        self.histograms: Dict[Key, list] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(HISTOGRAM_BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect_left(HISTOGRAM_BUCKETS, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def summary(self) -> dict:
+        """Compact, JSON serializable state of all metrics (published by the nodes)."""
+        with self.lock:
+            return {
+                "v": SUMMARY_VERSION,
+                "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                "gauges": [[name, dict(labels), value] for (name, labels), value in self.gauges.items()],
+                "histograms": [[name, dict(labels), list(buckets), total, count]
+                               for (name, labels), (buckets, total, count) in self.histograms.items()],
+            }
+
+
+registry = MetricsRegistry()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    return "{" + ",".join(f'{label}="{_escape(str(value))}"' for label, value in sorted(labels.items())) + "}"
+
+
+def render_prometheus(summaries: Dict[str, dict]) -> str:
+    """
+    Render the metric summaries of several nodes in the Prometheus text exposition format.
+
+    Args:
+        summaries: {node: summary} as returned by MetricsRegistry.summary(), every sample gets a node label
+    """
+    samples: Dict[Tuple[str, str], List[str]] = {}
+
+    for node, summary in sorted(summaries.items()):
+        if summary.get("v") != SUMMARY_VERSION:
+            continue
+        for name, labels, value in summary["counters"]:
+            samples.setdefault((name, "counter"), []).append(
+                f"piexpchair_{name}{_format_labels({**labels, 'node': node})} {value}")
+        for name, labels, value in summary["gauges"]:
+            samples.setdefault((name, "gauge"), []).append(
+                f"piexpchair_{name}{_format_labels({**labels, 'node': node})} {value}")
+        for name, labels, buckets, total, count in summary["histograms"]:
+            lines = samples.setdefault((name, "histogram"), [])
+            cumulative = 0
+            for bound, bucket in zip(HISTOGRAM_BUCKETS + ("+Inf",), buckets):
+                cumulative += bucket
+                lines.append(f"piexpchair_{name}_bucket"
+                             f"{_format_labels({**labels, 'node': node, 'le': str(bound)})} {cumulative}")
+            lines.append(f"piexpchair_{name}_sum{_format_labels({**labels, 'node': node})} {total}")
+            lines.append(f"piexpchair_{name}_count{_format_labels({**labels, 'node': node})} {count}")
+
+    output = []
+    for (name, metric_type), lines in sorted(samples.items()):
+        output.append(f"# TYPE piexpchair_{name} {metric_type}")
+        output.extend(lines)
+    return "\n".join(output) + "\n"
@@ -1,9 +1,13 @@
+from metrics import registry as metrics
 from piexpchair import PiExpChair
 
 import socket
 import select
+import time
 
 class NovastarController(PiExpChair):
+    follows_videoplayer = True
+
     def __init__(self):
         super().__init__(identifier="novastar")
 
@@ -20,6 +24,7 @@ class NovastarController(PiExpChair):
 
     def send_command(self, command):
         binary_data = bytes.fromhex(command)
+        command_start = time.perf_counter()
 
         try:
             with socket.create_connection((self.config['novastar']['controller_ip'], int(self.config['novastar']['controller_port'])), timeout=1) as s:
@@ -41,18 +46,24 @@ class NovastarController(PiExpChair):
                         break
                     response += chunk
                 self.logger.info(f"Received the response from the Novastar Controller: {response.hex()}")
+                metrics.observe("novastar_command_seconds", time.perf_counter() - command_start)
                 return True
 
         except socket.timeout:
             self.logger.error("Connection timed out!")
+            metrics.inc("novastar_errors_total", error="timeout")
             return False
         except socket.error as e:
             self.logger.error(f"Socket error: {e}")
+            metrics.inc("novastar_errors_total", error="socket")
             return False
 
     def play_video(self, file_index):
-        if not self.send_command(self.build_play_command(file_index)):
+        if self.send_command(self.build_play_command(file_index)):
+            self.confirm_output("video_index", file_index)
+        else:
             self.logger.warning(f"Failed to play video index {file_index}!")
+            self.forget_output("video_index")
         self.output_notify("video_index", file_index)
 
     def output_set(self, name, value):
@@ -61,48 +72,10 @@ class NovastarController(PiExpChair):
             self.play_video(value)
 
     def apply_scene_outputs(self, current_outputs):
-        if 'novastar_output' in current_outputs:
+        if 'novastar_output' in current_outputs and self.output_changed("video_index", current_outputs['novastar_output']):
             self.logger.info(f"Playing novastar video: {current_outputs['novastar_output']}")
             self.play_video(current_outputs['novastar_output'])
 
-    def on_connect(self, client, userdata, flags, reason_code, properties):
-        super().on_connect(client, userdata, flags, reason_code, properties)
-        self.mqtt_subscribe(client, "videoplayer/#")
-
-    def on_message(self, client, userdata, msg):
-        super().on_message(client, userdata, msg)
-
-        try:
-            if msg.topic == f"{self.mqtt_config['base_topic']}/videoplayer/scene":
-                payload = msg.payload.decode()
-                if payload == "":
-                    self.logger.info("Received play no scene command")
-                else:
-                    try:
-                        self.current_scene_index = int(payload)
-                        if 0 <= self.current_scene_index < len(self.config['scenes']):
-                            self.logger.info(f"Received scene index {self.current_scene_index} to play")
-                            self.play_scene(True)
-                            self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/scene", self.current_scene_index, qos=1)
-                        else:
-                            self.logger.warning(f"Received out-of-range scene index: {self.current_scene_index} (valid: 0-{len(self.config['scenes'])-1})")
-                    except ValueError as e:
-                        self.logger.error(f"Invalid scene index format: '{payload}': {e}")
-
-            elif msg.topic == f"{self.mqtt_config['base_topic']}/videoplayer/idle":
-                self.logger.info("Received idle scene command")
-                self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/idle", True, qos=1)
-                self.set_idle_outputs()
-
-        except UnicodeDecodeError as e:
-            self.logger.error(f"Failed to decode videoplayer message payload on topic {msg.topic}: {e}")
-        except Exception as e:
-            self.logger.error(f"Error processing videoplayer message on topic {msg.topic}: {type(e).__name__}: {e}", exc_info=True)
-
-    def play_scene(self, scene_index):
-        # Reset output magic
-        self.check_for_output_change(start=True)
-
     def module_run(self):
         self.handle_output_change()
 
@@ -0,0 +1,69 @@
+"""
+Batched output notifications.
+
+Instead of one QoS 1 message per output on ``output/notify/<node>/<output>``, a node in snapshot
+mode publishes one versioned JSON message on ``output/snapshot/<node>`` whenever a profile or an
+output/set changed outputs. It holds the last value of every output of the node, so the retained
+snapshot is the full state for a webui or node connecting later. OutputStates merges both formats
+for the consumers (webui).
+"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+
+SNAPSHOT_VERSION = 1
+
+
+def encode_snapshot(seq: int, outputs: Dict[str, Any]) -> str:
+    return json.dumps({"v": SNAPSHOT_VERSION, "seq": seq, "outputs": outputs}, separators=(',', ':'))
+
+
+class OutputStates:
+    """Latest known value of every output per node, as {node: {output: (value, timestamp)}}."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nodes: Dict[str, Dict[str, Tuple[Any, float]]] = {}
+        self.last_seq: Dict[str, int] = {}
+
+    def update(self, node: str, outputs: Dict[str, Any], timestamp: Optional[float] = None):
+        """Merge output values, the timestamp of an output only changes with its value."""
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            states = self.nodes.setdefault(node, {})
+            for name, value in outputs.items():
+                if name not in states or states[name][0] != value:
+                    states[name] = (value, timestamp)
+
+    def apply_notify(self, topic_suffix: str, payload: str):
+        """Merge a per-output notify, topic_suffix is "<node>/<output>"."""
+        node, _, name = topic_suffix.partition('/')
+        if name:
+            self.update(node, {name: payload})
+
+    def apply_snapshot(self, node: str, payload: str) -> bool:
+        """
+        Merge a snapshot message, returns False for snapshots of an unknown version.
+
+        A snapshot not newer than the last one of the node (a redelivered or reordered message, or the
+        retained snapshot after a reconnect) is ignored. The seq of a node starts again at 1 when it
+        restarts, so seq 1 is always merged.
+        """
+        snapshot = json.loads(payload)
+        if snapshot.get("v") != SNAPSHOT_VERSION:
+            return False
+        seq = snapshot["seq"]
+        with self.lock:
+            if seq != 1 and seq <= self.last_seq.get(node, 0):
+                return True
+            self.last_seq[node] = seq
+        self.update(node, snapshot["outputs"])
+        return True
+
+    def snapshot(self) -> Dict[str, Dict[str, Tuple[Any, float]]]:
+        with self.lock:
+            return {node: dict(states) for node, states in self.nodes.items()}
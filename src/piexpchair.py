@@ -1,15 +1,64 @@
 import yaml
+import json
 import logging
 import os
 import random
+import threading
 import time
 
-from schema import Schema, And, Use, Optional, SchemaError
+from schema import Schema, And, Or, Use, Optional, SchemaError
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import MQTTProtocolVersion
 
+from clock_sync import ClockOffsetEstimator, master_identity
+from dispatch import TopicDispatcher
+from message_history import MessageHistory
+from metrics import registry as metrics
+from output_snapshot import OutputStates, encode_snapshot
+from scene_plan import PlanCursor, decode_outputs
+from scheduler import DeadlineScheduler, LEGACY_TICK
+from schema_compiler import compiled
+from startup_profile import StartupProfiler
+from timeline import compile_timelines
+from topic_policy import TopicPolicies
+from tracing import TraceCollector, new_trace_id, trace_id_of, with_trace
+
 CONFIG_PATH = os.getenv('CONFIG_PATH', "config/config.yaml")
 
+# "legacy" restores the fixed 10 ms sleep main loop (e.g. to compare the loop stats)
+LOOP_MODE = os.getenv('LOOP_MODE', "deadline")
+# Log wakeups and CPU usage of the main loop every n seconds (0 disables it)
+LOOP_STATS_INTERVAL = float(os.getenv('LOOP_STATS', 0))
+# CONFIG_CACHE=0 parses and validates the config files on every read_config() call again
+CONFIG_CACHE_ENABLED = os.getenv('CONFIG_CACHE', "1") != "0"
+
+# STARTUP_PROFILE=1 logs (and publishes) how long the startup phases of the service took
+startup_profiler = StartupProfiler(enabled=bool(os.getenv('STARTUP_PROFILE', False)))
+
+# Received MQTT messages kept per topic and memory cap for all of them
+MESSAGE_HISTORY_DEPTH = int(os.getenv('MESSAGE_HISTORY_DEPTH', 10))
+MESSAGE_HISTORY_MAX_BYTES = int(os.getenv('MESSAGE_HISTORY_MAX_BYTES', 1024 * 1024))
+
+# Resend all outputs every n seconds even if the shadow state says they are unchanged (0 disables it)
+OUTPUT_RESYNC_INTERVAL = float(os.getenv('OUTPUT_RESYNC_INTERVAL', 0))
+
+# "topics" publishes one message per changed output, "snapshot" one message per profile, "both" does both
+OUTPUT_NOTIFY_MODE = os.getenv('OUTPUT_NOTIFY', "topics")
+
+# Publish a metrics summary every n seconds (0 disables it), the webui serves them on /metrics
+METRICS_INTERVAL = float(os.getenv('METRICS_INTERVAL', 10))
+
+# TRACE=0 disables publishing the hops of traced control and scene messages (see trace_report.py)
+TRACE_ENABLED = os.getenv('TRACE', "1") != "0"
+
+# Seconds between two clock offset measurements against the videoplayer
+CLOCK_SYNC_INTERVAL = float(os.getenv('CLOCK_SYNC_INTERVAL', 10))
+# CLOCK_JITTER_REPORT=1 publishes the shared time every profile is applied at (see benchmarks/bench_scene_sync.py)
+CLOCK_JITTER_REPORT = bool(os.getenv('CLOCK_JITTER_REPORT', False))
+
+# Use the libyaml based loader if PyYAML was built with it
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 log_level = logging.INFO
 if os.getenv('DEBUG', False):
     log_level = logging.DEBUG
@@ -28,6 +77,16 @@ broker_schema = Schema({
     Optional("password"): str
 })
 
+# Command of a button gesture (the same names as the inputs)
+input_command = Or("play", "stop", "next", "prev", "shutdown")
+input_schema = {
+    "address": hex,
+    "pin": int,
+    Optional("debounce_ms"): int,
+    Optional("long_press"): input_command,
+    Optional("double_press"): input_command
+}
+
 config_schema = Schema({
     "videoplayer": {"media_path": str, "rc_socket": str},
     "webui": {
@@ -36,14 +95,24 @@ config_schema = Schema({
     },
     "i2c": {
         "input": {
-            Optional("play"): {"address": hex, "pin": int},
-            Optional("stop"): {"address": hex, "pin": int},
-            Optional("next"): {"address": hex, "pin": int},
-            Optional("prev"): {"address": hex, "pin": int},
-            Optional("shutdown"): {"address": hex, "pin": int}
+            Optional("play"): input_schema,
+            Optional("stop"): input_schema,
+            Optional("next"): input_schema,
+            Optional("prev"): input_schema,
+            Optional("shutdown"): input_schema
+        },
+        # Debounce window and gesture timing of all inputs
+        Optional("gestures"): {
+            Optional("debounce_ms"): int,
+            Optional("long_press_ms"): int,
+            Optional("double_press_ms"): int
         },
         "output": {Optional(str): {"address": hex, "pin": int}},
-        "arduino_devices": {Optional(str): {"address": hex, "pin": int}}
+        "arduino_devices": {Optional(str): {"address": hex, "pin": int}},
+        # Pi GPIO (BCM) wired to the INTA/INTB output of an input expander, by expander address
+        Optional("interrupts"): {Optional(hex): int},
+        # Clock of the bus in Hz (100000 if not set)
+        Optional("bus_frequency"): int
     },
     "wled": {
         "settings": {
@@ -93,45 +162,89 @@ config_schema = Schema({
 })
 
 
-def check_config_for_webui():
-    try:
-        with open('config/config.yaml', 'r') as file:
-            config_data = yaml.safe_load(file)
-    except FileNotFoundError:
-        return False, "Config file 'config/config.yaml' not found."
-    except yaml.YAMLError as e:
-        return False, f"Error reading config file 'config/config.yaml': {e}"
+class ConfigCache:
+    """
+    Process wide cache of parsed and validated config files.
 
-    try:
-        config_schema.validate(config_data)
-        return True, "Config seems to be valid!"
-    except SchemaError as se:
-        return False, se
+    Entries are keyed by path and schema and are only loaded again when the file changes on disk
+    (modification time, size or inode). The returned config data is shared, callers must not modify it.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def load(self, file_path, schema_config):
+        """
+        Returns a tuple (config_data, error). On success error is None, otherwise config_data is None
+        and error contains the message (or SchemaError) describing why the config is invalid.
+        """
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None, f"Config file '{file_path}' not found."
+        file_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        cache_key = (os.path.abspath(file_path), id(schema_config))
+
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if self.enabled and entry and entry[0] == file_key:
+                return entry[1], entry[2]
+
+            config_data, error = self._parse(file_path, schema_config)
+            self.entries[cache_key] = (file_key, config_data, error)
+            return config_data, error
+
+    @staticmethod
+    def _parse(file_path, schema_config):
+        try:
+            with open(file_path, 'r') as file:
+                config_data = yaml.load(file, Loader=YamlLoader)
+        except FileNotFoundError:
+            return None, f"Config file '{file_path}' not found."
+        except yaml.YAMLError as e:
+            return None, f"Error reading config file '{file_path}': {e}"
+
+        try:
+            compiled(schema_config).validate(config_data)
+            return config_data, None
+        except SchemaError as se:
+            return None, se
+
+
+config_cache = ConfigCache(enabled=CONFIG_CACHE_ENABLED)
+
+
+def check_config_for_webui():
+    config_data, error = config_cache.load('config/config.yaml', config_schema)
+    if error:
+        return False, error
+    return True, "Config seems to be valid!"
 
 
 def read_config(file_path, logger, schema_config):
-    try:
-        with open(file_path, 'r') as file:
-            config_data = yaml.safe_load(file)
-    except FileNotFoundError:
-        logger.error(f"Config file '{file_path}' not found.")
-        return None
-    except yaml.YAMLError as e:
-        logger.error(f"Error reading config file '{file_path}': {e}")
+    config_data, error = config_cache.load(file_path, schema_config)
+    if error:
+        logger.error(error)
         return None
 
-    try:
-        schema_config.validate(config_data)
-        logger.debug("Valid config file found")
-        return config_data
-    except SchemaError as se:
-        logger.error(se)
-        return None
+    logger.debug("Valid config file found")
+    return config_data
 
 
 class PiExpChair:
+    # Nodes reading inputs set this to their poll interval in seconds, all others only wake up on deadlines
+    poll_interval = None
+    # Output nodes follow the scenes and idle animation of the videoplayer
+    follows_videoplayer = False
+    # The videoplayer's clock is the shared scene timebase, all other following nodes sync to it
+    clock_master = False
+
     def __init__(self, subscribe_to_everything=False, identifier=None):
         self.logger = logging
+        self.startup_profiler = startup_profiler
+        self.startup_profiler.mark("imports")
 
         self.logger.info(f"Initializing PiExpChair module {self.__class__.__name__}")
 
@@ -140,6 +253,7 @@ class PiExpChair:
         self.mqtt_config = read_config('config/broker.yaml', self.logger, broker_schema)
 
         self.config = read_config('config/config.yaml', self.logger, config_schema)
+        self.startup_profiler.mark("config")
 
         # Initialize MQTT client
         self.mqtt_client_id = f'PiExpChair-{self.__class__.__name__}-{random.randint(0, 1000)}'
@@ -163,6 +277,16 @@ class PiExpChair:
 
         self.mqtt_output_notify_topic = f"output/notify/{self.mqtt_path_identifier}"
         self.mqtt_output_set_topic = f"output/set/{self.mqtt_path_identifier}"
+        self.mqtt_output_snapshot_topic = f"output/snapshot/{self.mqtt_path_identifier}"
+
+        # QoS, retain flag and expiry of the published topics
+        self.topic_policies = TopicPolicies()
+
+        # Handlers of incoming messages, built on connect
+        self.dispatcher = TopicDispatcher()
+
+        # Main loop wakes up on scheduled deadlines or MQTT messages
+        self.scheduler = DeadlineScheduler(poll_interval=self.poll_interval, legacy=LOOP_MODE == "legacy")
 
         # Configure MQTT client callbacks
         self.mqtt_client.on_connect = self.on_connect
@@ -172,27 +296,70 @@ class PiExpChair:
         self.mqtt_client.will_set(f"{self.mqtt_config['base_topic']}/status",
                                   f"{self.mqtt_client_id} offline", 0, False)
         self.mqtt_client.connect(self.mqtt_config['host'], self.mqtt_config['port'])
+        self.startup_profiler.mark("mqtt_connect")
 
-        self.last_messages = {}
+        self.last_messages = MessageHistory(depth=MESSAGE_HISTORY_DEPTH, max_bytes=MESSAGE_HISTORY_MAX_BYTES)
         self.subscribe_to_everything = subscribe_to_everything
 
         self.current_scene_start_time = 0.0
         self.current_output_index = -1
         self.current_scene_index = -1
-        self.output_check_disabled = False
+        # No scene is running until the first scene message or plan
+        self.output_check_disabled = True
+
+        # Elapsed scene time window (lower, upper] in which the current output index stays valid
+        self.output_window = (float('inf'), float('-inf'))
+        # Absolute time at which the next profile of the current scene becomes active
+        self.next_output_deadline = float('inf')
+
+        # Offset of the local clock to the shared scene timebase and the announced start of the next scene
+        self.scene_clock = ClockOffsetEstimator()
+        self.next_clock_ping = 0.0
+        # Identity of the clock a clock master answers pings and stamps scenes with
+        self.clock_identity = master_identity() if self.clock_master else None
+        self.scene_start_anchor = None
+
+        # Scene plan published by the videoplayer, replaces the config timeline of the current scene
+        self.scene_plan = None
+        self.loaded_plan_id = None
+        # Shared minus local time the plan runs at if it arrived before the first clock sync, else None
+        self.plan_offset = None
+        # Retained plan received before the first clock sync, loaded once the shared clock is known
+        self.held_plan = None
+
+        # Last confirmed value per output, so profiles only send what actually changes
+        self.output_shadow = {}
+        self.output_stats = {"written": 0, "skipped": 0}
+        self.last_output_resync = time.monotonic()
+
+        # Output notifications collected for the next snapshot and the outputs reported by all nodes
+        self.pending_notify = {}
+        self.notify_seq = 0
+        # Last notified value of every output of the node, the full state every (retained) snapshot carries
+        self.notified_outputs = {}
+        # Held while notifying and flushing, both run on the MQTT thread and in the main loop
+        self.notify_lock = threading.RLock()
+        self.output_states = OutputStates()
+
+        # Metric summaries published by all nodes (webui)
+        self.node_metrics = {}
+
+        # Trace of the message being handled, the trace waiting for its outputs and the hops of all nodes (webui)
+        self.current_trace = None
+        self.pending_trace = None
+        self.traces = TraceCollector()
+        self.next_metrics_time = time.monotonic() + METRICS_INTERVAL
 
         if self.config:
+            self.scene_timelines = compile_timelines(self.config)
             self.terminate = False
         else:
+            self.scene_timelines = []
             self.terminate = True
 
     # MQTT helper methods
     def log_mqtt_message(self, msg):
-        if msg.topic not in self.last_messages.keys():
-            self.last_messages[msg.topic] = {}
-        self.last_messages[msg.topic][time.time()] = msg.payload
-        if len(self.last_messages[msg.topic]) > 10:
-            self.last_messages[msg.topic].pop(list(self.last_messages[msg.topic].keys())[0], None)
+        self.last_messages.add(msg.topic, msg.payload)
 
     # MQTT callback methods
     def on_connect(self, client, userdata, flags, reason_code, properties):
@@ -201,63 +368,268 @@ class PiExpChair:
             return False
         else:
             self.logger.debug("Successfully connected to MQTT Broker")
+            self.dispatcher = self.build_dispatcher()
+
             self.mqtt_subscribe(client, "control")
             self.mqtt_subscribe(client, f"{self.mqtt_output_set_topic}/#")
 
-            if self.subscribe_to_everything:
+            if self.follows_videoplayer or self.subscribe_to_everything:
                 self.mqtt_subscribe(client, "videoplayer/#")
+            if self.follows_videoplayer:
+                self.mqtt_subscribe(client, f"clock/pong/{self.mqtt_path_identifier}")
+            if self.clock_master:
+                self.mqtt_subscribe(client, "clock/ping/#")
+            if self.subscribe_to_everything:
                 self.mqtt_subscribe(client, "i2c/#")
+                self.mqtt_subscribe(client, "metrics/#")
+                self.mqtt_subscribe(client, "trace/#")
+                self.mqtt_subscribe(client, "output/notify/#")
+                self.mqtt_subscribe(client, "output/snapshot/#")
 
             self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/status",
                                      f"{self.mqtt_client_id} online", qos=1)
+
+            self.startup_profiler.mark("first_ready")
+            startup_summary = self.startup_profiler.report(self.__class__.__name__)
+            if startup_summary:
+                self.publish(f"{self.mqtt_path_identifier}/startup", json.dumps(startup_summary))
             return True
 
+    def build_dispatcher(self):
+        """Map the topics this node handles to their handler methods. Subclasses may add their own."""
+        base_topic = self.mqtt_config['base_topic']
+        self.control_commands = {
+            "quit": self.quit,
+            "play": self.play,
+            "stop": self.stop,
+            "next": self.next,
+            "prev": self.prev,
+            "shutdown": self.shutdown,
+        }
+
+        dispatcher = TopicDispatcher()
+        dispatcher.add(f"{base_topic}/control", self.on_control_message)
+        dispatcher.add_prefix(f"{base_topic}/{self.mqtt_output_set_topic}", self.on_output_set_message)
+        if self.follows_videoplayer:
+            dispatcher.add(f"{base_topic}/videoplayer/scene_start", self.on_videoplayer_scene_start_message)
+            dispatcher.add(f"{base_topic}/videoplayer/scene", self.on_videoplayer_scene_message)
+            dispatcher.add(f"{base_topic}/videoplayer/idle", self.on_videoplayer_idle_message)
+            dispatcher.add(f"{base_topic}/videoplayer/plan/{self.mqtt_path_identifier}", self.on_videoplayer_plan_message)
+            dispatcher.add(f"{base_topic}/clock/pong/{self.mqtt_path_identifier}", self.on_clock_pong_message)
+        if self.clock_master:
+            dispatcher.add_prefix(f"{base_topic}/clock/ping", self.on_clock_ping_message)
+        if self.subscribe_to_everything:
+            dispatcher.add_prefix(f"{base_topic}/output/notify", self.on_output_notify_message)
+            dispatcher.add_prefix(f"{base_topic}/output/snapshot", self.on_output_snapshot_message)
+            dispatcher.add_prefix(f"{base_topic}/metrics", self.on_metrics_message)
+            dispatcher.add_prefix(f"{base_topic}/trace", self.on_trace_message)
+        return dispatcher
+
     def on_message(self, client, userdata, msg):
         try:
             self.logger.debug(f"Received message on topic {msg.topic}: {msg.payload}")
             self.log_mqtt_message(msg)
 
-            # Handle control messages
-            if msg.topic == f"{self.mqtt_config['base_topic']}/control":
-                payload = msg.payload.decode()
-                if payload == "quit":
-                    self.logger.info("Received quit command")
-                    self.quit()
-                elif payload == "play":
-                    self.logger.info("Received play command")
-                    self.play()
-                elif payload == "stop":
-                    self.logger.info("Received stop command")
-                    self.stop()
-                elif payload == "next":
-                    self.logger.info("Received next command")
-                    self.next()
-                elif payload == "prev":
-                    self.logger.info("Received prev command")
-                    self.prev()
-                elif payload == "shutdown":
-                    self.logger.info("Received shutdown command")
-                    self.shutdown()
-                elif "play_single_" in payload:
-                    try:
-                        scene_index = int(payload.replace("play_single_", ""))
-                        self.logger.info(f"Received play_single command for index {scene_index}")
-                        self.play_single(scene_index)
-                    except ValueError as e:
-                        self.logger.error(f"Invalid scene index in play_single command '{payload}': {e}")
-                else:
-                    self.logger.warning(f"Unknown control command: {payload}")
-
-            # Handle set output messages
-            elif msg.topic.startswith(f"{self.mqtt_config['base_topic']}/{self.mqtt_output_set_topic}/"):
-                output_name = msg.topic[len(f"{self.mqtt_config['base_topic']}/{self.mqtt_output_set_topic}/"):]
-                self.logger.info(f"Received output set message for {output_name} to {msg.payload.decode()}")
-                self.output_set(output_name, msg.payload.decode())
+            metrics.inc("mqtt_messages_received_total", topic=msg.topic)
+            handler = self.dispatcher.resolve(msg.topic)
+            if handler:
+                handler_start = time.perf_counter()
+                self.current_trace = trace_id_of(msg)
+                try:
+                    handler(msg.payload.decode(), msg)
+                finally:
+                    self.current_trace = None
+                metrics.observe("mqtt_handler_seconds", time.perf_counter() - handler_start, topic=msg.topic)
 
         except UnicodeDecodeError as e:
             self.logger.error(f"Failed to decode MQTT message payload on topic {msg.topic}: {e}")
         except Exception as e:
             self.logger.error(f"Error processing MQTT message on topic {msg.topic}: {type(e).__name__}: {e}", exc_info=True)
+        finally:
+            # Let the main loop react to state changes right away
+            self.scheduler.wake()
+
+    def on_control_message(self, payload, msg):
+        command = self.control_commands.get(payload)
+        if command:
+            self.logger.info(f"Received {payload} command")
+            command()
+        elif payload.startswith("play_single_"):
+            try:
+                scene_index = int(payload[len("play_single_"):])
+                self.logger.info(f"Received play_single command for index {scene_index}")
+                self.play_single(scene_index)
+            except ValueError as e:
+                self.logger.error(f"Invalid scene index in play_single command '{payload}': {e}")
+        else:
+            self.logger.warning(f"Unknown control command: {payload}")
+
+    def on_output_set_message(self, output_name, payload, msg):
+        self.logger.info(f"Received output set message for {output_name} to {payload}")
+        self.output_set(output_name, payload)
+        self.flush_output_notify()
+
+    def on_output_notify_message(self, output_path, payload, msg):
+        self.output_states.apply_notify(output_path, payload)
+
+    def on_output_snapshot_message(self, node, payload, msg):
+        if not self.output_states.apply_snapshot(node, payload):
+            self.logger.warning(f"Ignoring output snapshot of {node} with unknown version")
+
+    def on_metrics_message(self, node, payload, msg):
+        self.node_metrics[node] = json.loads(payload)
+
+    def on_trace_message(self, node, payload, msg):
+        self.traces.add(node, json.loads(payload))
+
+    def on_videoplayer_scene_message(self, payload, msg):
+        if payload == "":
+            self.logger.info("Received play no scene command")
+            return
+
+        try:
+            scene_index = int(payload)
+        except ValueError as e:
+            self.logger.error(f"Invalid scene index format: '{payload}': {e}")
+            return
+
+        if 0 <= scene_index < len(self.config['scenes']):
+            self.current_scene_index = scene_index
+            self.logger.info(f"Received scene index {self.current_scene_index} to play")
+            self.trace_outputs("scene_received")
+            self.play_scene(scene_index)
+            self.publish_scene_state(self.current_scene_index)
+        else:
+            self.logger.warning(f"Received out-of-range scene index: {scene_index} (valid: 0-{len(self.config['scenes'])-1})")
+
+    def on_videoplayer_scene_start_message(self, payload, msg):
+        scene_start = json.loads(payload)
+        self.scene_clock.follow(scene_start.get('master'))
+        if self.scene_clock.synced:
+            local_start = self.scene_clock.to_local(scene_start['start'])
+            self.logger.debug(f"Scene {scene_start['scene']} started {time.monotonic() - local_start:.4f}s ago "
+                              f"(clock offset {self.scene_clock.offset:.4f}s, rtt {self.scene_clock.rtt:.4f}s)")
+            self.scene_start_anchor = (scene_start['scene'], local_start)
+        else:
+            self.logger.debug("Clock not synced yet, scene starts on arrival of the scene message")
+            self.scene_start_anchor = None
+
+    def on_videoplayer_idle_message(self, payload, msg):
+        if payload == "":
+            # Retained idle state cleared at scene start
+            return
+        self.logger.info("Received idle scene command")
+        self.trace_outputs("idle_received")
+        self.publish_idle_state()
+        self.set_idle_outputs()
+
+    def on_videoplayer_plan_message(self, payload, msg):
+        if payload == "":
+            return
+        plan = json.loads(payload)
+        if plan['id'] == self.loaded_plan_id:
+            # Retained plan delivered again after a reconnect
+            return
+        self.loaded_plan_id = plan['id']
+        self.trace_outputs("plan_received")
+        self.held_plan = None
+        self.scene_clock.follow(plan.get('master'))
+
+        if plan['scene'] < 0:
+            self.logger.debug(f"Loaded idle plan {plan['id']}")
+            self.scene_plan = None
+            self.set_idle_outputs(decode_outputs(plan['outputs']))
+            return
+
+        if msg.retain and not self.scene_clock.synced:
+            # A scene already running (e.g. after a restart), its active keyframe is only known on the shared clock
+            self.logger.debug(f"Holding retained plan {plan['id']} until the clock is synced")
+            self.held_plan = plan
+            return
+        self.load_scene_plan(plan)
+
+    def load_scene_plan(self, plan):
+        self.logger.debug(f"Loaded plan {plan['id']} with {len(plan['keyframes'])} keyframes")
+        self.current_scene_index = plan['scene']
+        self.current_output_index = -1
+        self.output_check_disabled = False
+        self.scene_plan = PlanCursor(plan)
+        if self.scene_clock.synced:
+            self.plan_offset = None
+        else:
+            # No shared clock yet, the scene starts on arrival of its plan
+            self.logger.debug("Clock not synced yet, plan starts on arrival")
+            self.plan_offset = plan['start'] - time.monotonic()
+
+    # Scene clock methods
+    def on_clock_ping_message(self, node, payload, msg):
+        pong = json.dumps({"t0": float(payload), "t1": time.monotonic(), "master": self.clock_identity})
+        self.publish(f"clock/pong/{node}", pong)
+
+    def on_clock_pong_message(self, payload, msg):
+        received = time.monotonic()
+        pong = json.loads(payload)
+        self.scene_clock.add_sample(pong['t0'], pong['t1'], received, master=pong.get('master'))
+        if self.held_plan is not None and self.scene_clock.synced:
+            plan, self.held_plan = self.held_plan, None
+            self.load_scene_plan(plan)
+
+    def sync_clock(self):
+        """Send a clock ping when due, in short intervals until the first samples arrived."""
+        if not self.follows_videoplayer:
+            return
+        now = time.monotonic()
+        if now < self.next_clock_ping:
+            return
+        self.publish(f"clock/ping/{self.mqtt_path_identifier}", repr(now))
+        self.next_clock_ping = now + (CLOCK_SYNC_INTERVAL if len(self.scene_clock.samples) >= 5 else 0.2)
+        self.scheduler.schedule(self.next_clock_ping)
+
+    def shared_time(self):
+        """Current time on the shared scene timebase."""
+        return self.scene_clock.now()
+
+    def publish(self, topic, payload=None, trace_id=None):
+        """
+        Publish on a topic below base_topic with the QoS, retain flag and expiry of its topic policy.
+        A trace_id is passed on in the MQTTv5 user properties.
+        """
+        qos, retain, properties = self.topic_policies.publish_args(topic)
+        if trace_id:
+            properties = with_trace(properties, trace_id)
+        metrics.inc("mqtt_messages_sent_total", topic=topic)
+        return self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{topic}", payload, qos=qos, retain=retain,
+                                        properties=properties)
+
+    def clear_retained(self, topic):
+        """Remove the retained message of a topic below base_topic."""
+        return self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{topic}", None, qos=1, retain=True)
+
+    def publish_scene_state(self, scene_index, trace_id=None):
+        # Only one of the retained scene and idle states may be current
+        self.clear_retained(f"{self.mqtt_path_identifier}/idle")
+        self.publish(f"{self.mqtt_path_identifier}/scene", scene_index, trace_id=trace_id)
+
+    def publish_idle_state(self, trace_id=None):
+        self.clear_retained(f"{self.mqtt_path_identifier}/scene")
+        self.publish(f"{self.mqtt_path_identifier}/idle", True, trace_id=trace_id)
+
+    # Tracing methods
+    def record_trace(self, trace_id, hop):
+        """Publish that a traced message reached the given hop, timed on the shared scene clock."""
+        if not trace_id or not TRACE_ENABLED:
+            return
+        if not (self.clock_master or self.scene_clock.synced):
+            # Without a synced clock the time is not comparable to the other nodes
+            return
+        self.publish(f"trace/{self.mqtt_path_identifier}",
+                     json.dumps({"trace": trace_id, "hop": hop, "t": self.shared_time()}))
+
+    def trace_outputs(self, hop):
+        """Record the hop of the message being handled and trace the next applied outputs for it."""
+        if self.current_trace:
+            self.record_trace(self.current_trace, hop)
+            self.pending_trace = self.current_trace
 
     def mqtt_subscribe(self, client, channel_name):
         channel = f"{self.mqtt_config['base_topic']}/{channel_name}"
@@ -266,7 +638,9 @@ class PiExpChair:
 
     def _send_control_command(self, command):
         self.logger.debug(f"Sending control command: {command}")
-        self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/control", command, qos=1)
+        trace_id = new_trace_id()
+        self.record_trace(trace_id, "control_sent")
+        self.publish("control", command, trace_id=trace_id)
 
     def send_quit(self):
         self.logger.info("Sending quit command")
@@ -319,32 +693,132 @@ class PiExpChair:
     def shutdown(self):
         self.logger.debug("Method shutdown not implemented")
 
+    def play_scene(self, scene_index):
+        if self.scene_plan and self.scene_plan.scene == scene_index:
+            # The plan of this scene arrived before the scene message and is executed already
+            return
+        if self.held_plan and self.held_plan['scene'] == scene_index:
+            # Its plan starts at the active keyframe as soon as the clock is synced
+            return
+        self.scene_plan = None
+        self.held_plan = None
+
+        # Schedule the scene against its announced start if known, otherwise against now
+        start_time = None
+        if self.scene_start_anchor and self.scene_start_anchor[0] == scene_index:
+            start_time = self.scene_start_anchor[1]
+        self.scene_start_anchor = None
+
+        # Reset output magic
+        self.check_for_output_change(start=True, start_time=start_time)
+
     # Output helper methods
     def apply_scene_outputs(self, config):
         self.logger.debug("Method apply_scene_outputs not implemented")
 
+    def apply_outputs(self, current_outputs):
+        """Apply a profile through apply_scene_outputs(), which only writes the outputs that changed."""
+        now = time.monotonic()
+        if OUTPUT_RESYNC_INTERVAL and now - self.last_output_resync >= OUTPUT_RESYNC_INTERVAL:
+            self.logger.debug("Resending all outputs (periodic resync)")
+            self.output_shadow.clear()
+            self.last_output_resync = now
+
+        written, skipped = self.output_stats["written"], self.output_stats["skipped"]
+        self.apply_scene_outputs(current_outputs)
+        self.flush_output_notify()
+        if self.pending_trace:
+            self.record_trace(self.pending_trace, "outputs_applied")
+            self.pending_trace = None
+        self.logger.debug(f"Applied outputs: {self.output_stats['written'] - written} written, "
+                          f"{self.output_stats['skipped'] - skipped} skipped (total: {self.output_stats['written']} "
+                          f"written, {self.output_stats['skipped']} skipped)")
+
     def handle_output_change(self):
+        if self.scene_plan is not None:
+            self.handle_plan_change()
+            return
+
         new_output_index = self.check_for_output_change()
         if new_output_index >= 0:
-            self.logger.debug(f"New output index {new_output_index}")
-            self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/profile", new_output_index, qos=1)
-            self.apply_scene_outputs(self.config['scenes'][self.current_scene_index]['timed_outputs'][new_output_index])
-
-    def set_idle_outputs(self):
+            timed_output = self.config['scenes'][self.current_scene_index]['timed_outputs'][new_output_index]
+            deadline = self.scene_clock.to_shared(self.current_scene_start_time) + timed_output['start_time']
+            self.publish_profile(new_output_index, deadline)
+            self.apply_outputs(timed_output)
+
+    def handle_plan_change(self):
+        """Advance the scene plan to the current shared time and apply the keyframe that became active."""
+        plan = self.scene_plan
+        if self.output_check_disabled:
+            return
+
+        # The plan deadlines are in shared time, anchored at the arrival of the plan until the clock is synced
+        if self.plan_offset is not None and self.scene_clock.synced:
+            self.logger.debug("Clock synced, plan continues on the shared clock")
+            self.plan_offset = None
+        if self.plan_offset is None:
+            keyframe = plan.advance(self.shared_time())
+        else:
+            keyframe = plan.advance(time.monotonic() + self.plan_offset)
+        next_deadline = plan.next_deadline()
+        if next_deadline != float('inf'):
+            if self.plan_offset is None:
+                self.scheduler.schedule(self.scene_clock.to_local(next_deadline))
+            else:
+                self.scheduler.schedule(next_deadline - self.plan_offset)
+
+        if keyframe is not None:
+            output_index, deadline, outputs = keyframe
+            self.current_output_index = output_index
+            self.publish_profile(output_index, deadline)
+            self.apply_outputs(outputs)
+
+    def publish_profile(self, output_index, deadline):
+        self.logger.debug(f"New output index {output_index}")
+        self.publish(f"{self.mqtt_path_identifier}/profile", output_index)
+        if CLOCK_JITTER_REPORT:
+            self.report_keyframe(output_index, deadline)
+
+    def report_keyframe(self, output_index, deadline):
+        """Publish when (in shared time) a profile was applied, to measure the jitter between nodes."""
+        report = {"scene": self.current_scene_index, "profile": output_index, "applied": self.shared_time(),
+                  "deadline": deadline}
+        self.publish(f"clock/keyframe/{self.mqtt_path_identifier}", json.dumps(report))
+
+    def set_idle_outputs(self, outputs=None):
         self.logger.debug("Load idle settings")
         self.check_for_output_change(disable=True)
-        self.apply_scene_outputs(self.config['idle'])
+        self.apply_outputs(self.config['idle'] if outputs is None else outputs)
 
-    def check_for_output_change(self, start = False, disable = False):
+    # Output shadow state
+    def output_changed(self, name, value):
+        """Returns True if the output has to be written, False if it already has this value."""
+        if name in self.output_shadow and self.output_shadow[name] == value:
+            self.output_stats["skipped"] += 1
+            return False
+        self.output_stats["written"] += 1
+        return True
+
+    def confirm_output(self, name, value):
+        """Record a successfully written output value."""
+        self.output_shadow[name] = value
+
+    def forget_output(self, name):
+        """The state of the output is unknown (e.g. after a failed write), it is sent again next time."""
+        self.output_shadow.pop(name, None)
+
+    def check_for_output_change(self, start = False, disable = False, start_time = None):
         """
         Returns the index of outputs to be played
         At the start of a scene, call it with True
+        :param start_time: Local monotonic time the scene started at (defaults to now)
         :return:
         int: output index
         """
 
         if disable:
             self.output_check_disabled = True
+            self.next_output_deadline = float('inf')
             return -1
         if start:
             self.output_check_disabled = False
@@ -352,31 +826,53 @@ class PiExpChair:
         if self.output_check_disabled:
             return -1
 
-        current_scene = self.config['scenes'][self.current_scene_index]
-        current_time = time.time()
+        timeline = self.scene_timelines[self.current_scene_index]
+        current_time = time.monotonic()
 
-        # Start a new scene
+        # Start a new scene, the main loop applies and publishes the profile active at its start
         if start:
             self.current_output_index = -1
-            self.current_scene_start_time = current_time
+            self.current_scene_start_time = current_time if start_time is None else start_time
+            self.output_window = (float('inf'), float('-inf'))
+            self.scheduler.wake()
+            return -1
 
-        loop_output_index = -1
         current_time_delta = current_time - self.current_scene_start_time
-        for timed_output in current_scene['timed_outputs']:
-            if current_time_delta <= timed_output['start_time']:
-                break
-            loop_output_index += 1
-
-        if self.current_output_index != loop_output_index:
-            self.logger.debug(f"Setting output index to {loop_output_index} ({current_time_delta})")
-            self.current_output_index = loop_output_index
-            return loop_output_index
+        lower, upper = self.output_window
+        if lower < current_time_delta <= upper:
+            # Still inside the window of the current profile
+            return -1
+
+        new_output_index, lower, upper = timeline.locate(current_time_delta)
+        self.output_window = (lower, upper)
+        self.next_output_deadline = self.current_scene_start_time + upper
+        self.scheduler.schedule(self.next_output_deadline)
+
+        if self.current_output_index != new_output_index:
+            self.logger.debug(f"Setting output index to {new_output_index} ({current_time_delta})")
+            self.current_output_index = new_output_index
+            return new_output_index
         else:
             return -1
 
     def output_notify(self, name, value):
         self.logger.debug(f"Notify output change of {name} to {value}")
-        self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_output_notify_topic}/{name}", value, qos=1)
+        if OUTPUT_NOTIFY_MODE != "snapshot":
+            self.publish(f"{self.mqtt_output_notify_topic}/{name}", value)
+        if OUTPUT_NOTIFY_MODE != "topics":
+            with self.notify_lock:
+                self.pending_notify[name] = value
+
+    def flush_output_notify(self):
+        """If outputs were notified since the last flush, publish all outputs of the node as one snapshot message (snapshot mode only)."""
+        with self.notify_lock:
+            if not self.pending_notify:
+                return
+            self.notified_outputs.update(self.pending_notify)
+            self.pending_notify = {}
+            self.notify_seq += 1
+            # Published under the lock so the snapshots go out in seq order
+            self.publish(self.mqtt_output_snapshot_topic, encode_snapshot(self.notify_seq, self.notified_outputs))
 
     def output_set(self, name, value):
         self.logger.debug("Method stop not implemented")
@@ -389,18 +885,34 @@ class PiExpChair:
         if self.terminate:
             self.logger.warning("NOT Entering main loop, probably invalid config found. Exiting")
         else:
-            self.logger.info("Entering main loop")
+            self.startup_profiler.mark("hardware_init")
+            self.logger.info(f"Entering main loop ({LOOP_MODE} mode)")
 
             try:
                 self.mqtt_client.loop_start()
 
+                next_stats_time = time.monotonic() + LOOP_STATS_INTERVAL
+                run_budget = self.poll_interval or LEGACY_TICK
                 while not self.terminate:
+                    run_start = time.perf_counter()
                     try:
+                        self.sync_clock()
                         self.module_run()
                     except Exception as e:
                         self.logger.error(f"Error in module_run(): {type(e).__name__}: {e}", exc_info=True)
                         # Continue running even if module_run fails
-                    time.sleep(0.01)
+                    run_duration = time.perf_counter() - run_start
+                    metrics.observe("module_run_seconds", run_duration)
+                    if run_duration > run_budget:
+                        metrics.inc("module_run_overruns_total")
+                    self.publish_metrics()
+                    self.scheduler.wait()
+
+                    if LOOP_STATS_INTERVAL and time.monotonic() >= next_stats_time:
+                        next_stats_time += LOOP_STATS_INTERVAL
+                        stats = self.scheduler.loop_stats()
+                        self.logger.info(f"Main loop stats ({LOOP_MODE} mode): {stats['wakeups']} wakeups "
+                                         f"({stats['wakeups_per_second']:.1f}/s), CPU {stats['cpu_percent']:.2f}%")
 
             except KeyboardInterrupt:
                 self.logger.info("Received keyboard interrupt, shutting down gracefully")
@@ -412,6 +924,19 @@ class PiExpChair:
                 self.logger.info("Main loop ended")
                 self.mqtt_client.disconnect()
 
+    def publish_metrics(self):
+        """Publish the metrics summary of this node every METRICS_INTERVAL seconds."""
+        if not METRICS_INTERVAL:
+            return
+        now = time.monotonic()
+        if now < self.next_metrics_time:
+            return
+        self.next_metrics_time = now + METRICS_INTERVAL
+        self.scheduler.schedule(self.next_metrics_time)
+        metrics.set("loop_wakeups", self.scheduler.wakeups)
+        metrics.set("process_cpu_seconds", time.process_time())
+        self.publish(f"metrics/{self.mqtt_path_identifier}", json.dumps(metrics.summary(), separators=(',', ':')))
+
     def quit(self):
         self.logger.debug("Terminating main loop")
         self.terminate = True
@@ -9,6 +9,8 @@ import logging
 from functools import wraps
 from typing import Callable, Tuple, Type, Any, Optional
 
+from metrics import registry as metrics
+
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +55,7 @@ def retry_operation(
                     last_exception = e
 
                     if attempt < max_attempts:
+                        metrics.inc("retries_total", operation=func.__name__)
                         # Log retry attempt
                         if on_retry:
                             on_retry(e, attempt, max_attempts)
@@ -66,6 +69,7 @@ def retry_operation(
                         time.sleep(current_delay)
                         current_delay *= backoff
                     else:
+                        metrics.inc("retry_failures_total", operation=func.__name__)
                         # All retries exhausted
                         if on_failure:
                             on_failure(e, max_attempts)
@@ -0,0 +1,107 @@
+"""
+Pre-resolved scene plans.
+
+At scene start the videoplayer publishes one plan per output node on a retained topic: all
+keyframes of the scene with their absolute deadlines on the shared clock, reduced to the
+outputs the node owns. Nodes execute the plan by advancing a pointer, and a node that
+restarts mid-scene picks up the retained plan and resumes at the active keyframe.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from timeline import SceneTimeline
+
+
+PLAN_VERSION = 1
+
+# Output keys of a profile each output node is responsible for
+OUTPUT_OWNERS: Dict[str, Tuple[str, ...]] = {
+    "i2c": ("i2c_outputs", "arduino_outputs"),
+    "wled": ("wled_outputs",),
+    "novastar": ("novastar_output",),
+}
+
+
+def _owned_outputs(outputs: dict, output_keys: Iterable[str]) -> dict:
+    return {key: outputs[key] for key in output_keys if key in outputs}
+
+
+def build_scene_plan(config: dict, scene_index: int, start: float, output_keys: Iterable[str],
+                     master: Optional[str] = None) -> dict:
+    """
+    Plan of one scene for a node.
+
+    Args:
+        config: Validated chair config
+        scene_index: Scene to plan
+        start: Start of the scene on the shared clock
+        output_keys: Profile keys the node owns (see OUTPUT_OWNERS)
+        master: Identity of the clock start is on (see clock_sync.master_identity)
+
+    Returns:
+        JSON serializable plan, keyframes are [output_index, deadline, outputs] in playback order
+    """
+    scene = config['scenes'][scene_index]
+    timeline = SceneTimeline(scene['timed_outputs'])
+    keyframes = []
+    for position, (start_time, output_index) in enumerate(zip(timeline.start_times, timeline.output_indexes)):
+        # Of several profiles sharing a start time only the last one is ever active
+        if position + 1 < len(timeline) and timeline.start_times[position + 1] == start_time:
+            continue
+        outputs = _owned_outputs(scene['timed_outputs'][output_index], output_keys)
+        keyframes.append([output_index, start + start_time, outputs])
+    return {"v": PLAN_VERSION, "id": f"{scene_index}@{start:.6f}", "scene": scene_index, "start": start,
+            "duration": scene['duration'], "master": master, "keyframes": keyframes}
+
+
+def build_idle_plan(config: dict, start: float, output_keys: Iterable[str], master: Optional[str] = None) -> dict:
+    """Plan of the idle animation for a node, the outputs apply right away."""
+    return {"v": PLAN_VERSION, "id": f"idle@{start:.6f}", "scene": -1, "start": start, "duration": 0.0,
+            "master": master, "outputs": _owned_outputs(config['idle'], output_keys)}
+
+
+def decode_outputs(outputs: dict) -> dict:
+    """Restore the integer strip keys of wled_outputs, which JSON turned into strings."""
+    if 'wled_outputs' in outputs:
+        outputs = dict(outputs)
+        outputs['wled_outputs'] = {int(strip): macro for strip, macro in outputs['wled_outputs'].items()}
+    return outputs
+
+
+class PlanCursor:
+    """
+    Position of a node in a scene plan.
+
+    Args:
+        plan: Decoded plan as built by build_scene_plan()
+    """
+
+    def __init__(self, plan: dict):
+        self.id = plan['id']
+        self.scene = plan['scene']
+        self.keyframes: List[list] = [[output_index, deadline, decode_outputs(outputs)]
+                                      for output_index, deadline, outputs in plan['keyframes']]
+        self.deadlines = [keyframe[1] for keyframe in self.keyframes]
+        # Index of the next keyframe to become active
+        self.position = 0
+
+    def advance(self, now: float) -> Optional[list]:
+        """
+        Move past all keyframes whose deadline (shared clock) is over.
+
+        Returns:
+            The latest keyframe that became active since the last call, or None
+        """
+        position = self.position
+        while position < len(self.deadlines) and self.deadlines[position] < now:
+            position += 1
+        if position == self.position:
+            return None
+        self.position = position
+        return self.keyframes[position - 1]
+
+    def next_deadline(self) -> float:
+        """Shared time of the next keyframe (inf at the end of the plan)."""
+        if self.position < len(self.deadlines):
+            return self.deadlines[self.position]
+        return float('inf')
@@ -0,0 +1,110 @@
+"""
+Deadline driven main loop scheduling.
+
+Instead of waking up every 10 ms, a node sleeps until the earliest scheduled deadline,
+its input poll interval (if it has one) or until an MQTT callback wakes it up.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Deadlines are scheduled slightly late, so the woken up loop is guaranteed to be past them
+DEADLINE_SLACK = 0.0005
+
+# Tick of the legacy fixed sleep loop
+LEGACY_TICK = 0.01
+
+
+class DeadlineScheduler:
+    """
+    Heap of upcoming deadlines plus a wake event.
+
+    Args:
+        poll_interval: Maximum sleep time for nodes which have to poll (None for event driven nodes)
+        idle_interval: Safety net wakeup interval when nothing is scheduled
+        legacy: Ignore deadlines and sleep a fixed LEGACY_TICK like the old main loop
+        clock: Time source the deadlines are based on
+    """
+
+    def __init__(self, poll_interval: Optional[float] = None, idle_interval: float = 5.0,
+                 legacy: bool = False, clock: Callable[[], float] = time.monotonic):
+        self.poll_interval = poll_interval
+        self.idle_interval = idle_interval
+        self.legacy = legacy
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.deadlines = []
+        self.scheduled = set()
+        self.wake_event = threading.Event()
+
+        self.wakeups = 0
+        self.stats_wakeups = 0
+        self.stats_wall_time = time.monotonic()
+        self.stats_cpu_time = time.process_time()
+
+    def schedule(self, deadline: float):
+        """Wake up the loop at the given absolute time (of self.clock)."""
+        if deadline == float('inf'):
+            return
+        deadline += DEADLINE_SLACK
+        with self.lock:
+            if deadline in self.scheduled:
+                return
+            heapq.heappush(self.deadlines, deadline)
+            self.scheduled.add(deadline)
+            earliest = self.deadlines[0] == deadline
+        if earliest:
+            # Let a sleeping loop recalculate its timeout
+            self.wake_event.set()
+
+    def wake(self):
+        """Wake up the loop immediately, e.g. after an MQTT message changed the state."""
+        self.wake_event.set()
+
+    def next_timeout(self) -> float:
+        if self.legacy:
+            return LEGACY_TICK
+        timeout = self.idle_interval
+        if self.poll_interval is not None:
+            timeout = min(timeout, self.poll_interval)
+        with self.lock:
+            if self.deadlines:
+                timeout = min(timeout, self.deadlines[0] - self.clock())
+        return timeout
+
+    def wait(self):
+        """Block until the next deadline, poll tick or wake() call and drop all expired deadlines."""
+        timeout = self.next_timeout()
+        if self.legacy:
+            time.sleep(timeout)
+        elif timeout > 0:
+            self.wake_event.wait(timeout)
+        self.wake_event.clear()
+        self.wakeups += 1
+
+        now = self.clock()
+        with self.lock:
+            while self.deadlines and self.deadlines[0] <= now:
+                self.scheduled.discard(heapq.heappop(self.deadlines))
+
+    def loop_stats(self) -> dict:
+        """Wakeups per second and CPU usage of this process since the last call."""
+        wall_time = time.monotonic()
+        cpu_time = time.process_time()
+        elapsed = max(wall_time - self.stats_wall_time, 1e-9)
+        stats = {
+            "wakeups": self.wakeups - self.stats_wakeups,
+            "wakeups_per_second": (self.wakeups - self.stats_wakeups) / elapsed,
+            "cpu_percent": (cpu_time - self.stats_cpu_time) / elapsed * 100,
+        }
+        self.stats_wakeups = self.wakeups
+        self.stats_wall_time = wall_time
+        self.stats_cpu_time = cpu_time
+        return stats
@@ -0,0 +1,240 @@
+"""
+Compiled validation for schema definitions.
+
+Walks a ``schema.Schema`` once and turns it into nested checker closures, which only answer
+"valid or not" and skip the per-node Schema object creation of the schema library.
+Invalid data is handed to the schema library itself, so the error messages stay the same.
+
+Supported are dicts (with plain and Optional keys), lists, types, comparable values,
+callables and And/Or of those. Anything else is delegated to the schema library.
+"""
+
+import logging
+from typing import Any, Callable
+
+from schema import Schema, And, Or, Optional, Hook, Literal
+
+
+logger = logging.getLogger(__name__)
+
+Checker = Callable[[Any], bool]
+
+# Same ordering the schema library uses to try dict keys
+COMPARABLE, CALLABLE, VALIDATOR, TYPE, DICT, ITERABLE = range(6)
+
+
+def _priority(s: Any) -> int:
+    if type(s) in (list, tuple, set, frozenset):
+        return ITERABLE
+    if isinstance(s, dict):
+        return DICT
+    if issubclass(type(s), type):
+        return TYPE
+    if isinstance(s, Literal):
+        return COMPARABLE
+    if hasattr(s, "validate"):
+        return VALIDATOR
+    if callable(s):
+        return CALLABLE
+    return COMPARABLE
+
+
+def _delegate(s: Any) -> Checker:
+    """Fallback for constructs without a compiled counterpart."""
+    delegate_schema = Schema(s)
+
+    def check(data):
+        return delegate_schema.is_valid(data)
+    return check
+
+
+def _compile_type(s: type) -> Checker:
+    if s is int:
+        # The schema library does not accept bools as int
+        def check(data):
+            return isinstance(data, int) and not isinstance(data, bool)
+    else:
+        def check(data):
+            return isinstance(data, s)
+    return check
+
+
+def _compile_callable(s: Callable) -> Checker:
+    def check(data):
+        try:
+            return bool(s(data))
+        except Exception:
+            return False
+    return check
+
+
+def _compile_iterable(s, ignore_extra_keys: bool) -> Checker:
+    container = type(s)
+    options = [compile_schema(option, ignore_extra_keys) for option in s]
+
+    if len(options) == 1:
+        option = options[0]
+
+        def check(data):
+            if not isinstance(data, container):
+                return False
+            for item in data:
+                if not option(item):
+                    return False
+            return True
+    else:
+        def check(data):
+            if not isinstance(data, container):
+                return False
+            for item in data:
+                if not any(option(item) for option in options):
+                    return False
+            return True
+    return check
+
+
+def _compile_dict(s: dict, ignore_extra_keys: bool) -> Checker:
+    exact_keys = {}
+    matched_keys = []
+    required = set()
+
+    for position, skey in enumerate(sorted(s, key=Schema._dict_key_priority)):
+        if isinstance(skey, Hook):
+            # Hooks and Forbidden have side effects, let the schema library handle the whole dict
+            return _delegate(Schema(s, ignore_extra_keys=ignore_extra_keys))
+        value_check = compile_schema(s[skey], ignore_extra_keys)
+        if not isinstance(skey, Optional):
+            required.add(position)
+
+        key_schema = skey.schema if isinstance(skey, Optional) else skey
+        if _priority(key_schema) == COMPARABLE and not isinstance(key_schema, Literal):
+            try:
+                # Comparable keys have the lowest priority, so a hit is always the first match
+                exact_keys.setdefault(key_schema, (position, value_check))
+                continue
+            except TypeError:
+                pass  # unhashable, fall through to the generic matching
+        matched_keys.append((position, compile_schema(key_schema), value_check))
+
+    required_count = len(required)
+
+    def check(data):
+        if not isinstance(data, dict):
+            return False
+        covered = set()
+        for key, value in data.items():
+            match = exact_keys.get(key)
+            if match is None:
+                for position, key_check, value_check in matched_keys:
+                    if key_check(key):
+                        match = (position, value_check)
+                        break
+            if match is None:
+                if ignore_extra_keys:
+                    continue
+                return False
+            position, value_check = match
+            if not value_check(value):
+                return False
+            if position in required:
+                covered.add(position)
+        return len(covered) == required_count
+    return check
+
+
+def compile_schema(s: Any, ignore_extra_keys: bool = False) -> Checker:
+    """
+    Compile a schema (or any value the schema library accepts as schema) into a checker function.
+
+    Args:
+        s: Schema to compile
+        ignore_extra_keys: Allow keys in dicts which are not part of the schema
+
+    Returns:
+        Function taking the data and returning True if the schema library would accept it
+    """
+    if type(s) in (Schema, Optional):
+        return compile_schema(s.schema, s.ignore_extra_keys)
+    if type(s) is And:
+        if not all(_is_pure(arg) for arg in s.args):
+            # Validators like Use transform the data for the next argument
+            return _delegate(s)
+        checks = [compile_schema(arg, ignore_extra_keys) for arg in s.args]
+
+        def check_and(data):
+            for check in checks:
+                if not check(data):
+                    return False
+            return True
+        return check_and
+    if type(s) is Or and not s.only_one:
+        checks = [compile_schema(arg, ignore_extra_keys) for arg in s.args]
+
+        def check_or(data):
+            for check in checks:
+                if check(data):
+                    return True
+            return False
+        return check_or
+
+    flavor = _priority(s)
+    if flavor == ITERABLE:
+        return _compile_iterable(s, ignore_extra_keys)
+    if flavor == DICT:
+        return _compile_dict(s, ignore_extra_keys)
+    if flavor == TYPE:
+        return _compile_type(s)
+    if flavor == VALIDATOR:
+        return _delegate(s)
+    if flavor == CALLABLE:
+        return _compile_callable(s)
+
+    def check_comparable(data):
+        return s == data
+    return check_comparable
+
+
+def _is_pure(s: Any) -> bool:
+    """True if validating s does not change the data (all compiled constructs)."""
+    if type(s) in (Schema, Optional):
+        return _is_pure(s.schema)
+    if type(s) in (And, Or):
+        return all(_is_pure(arg) for arg in s.args)
+    return _priority(s) != VALIDATOR
+
+
+class CompiledSchema:
+    """
+    Schema wrapper validating with the compiled checker.
+
+    Only a failing check runs the schema library, to raise its original SchemaError.
+    Unlike Schema.validate(), validate() returns the data itself and not a validated copy.
+    """
+
+    def __init__(self, schema: Schema):
+        self.schema = schema
+        self.check = compile_schema(schema)
+
+    def is_valid(self, data: Any) -> bool:
+        return self.check(data)
+
+    def validate(self, data: Any) -> Any:
+        if self.check(data):
+            return data
+
+        # Let the schema library produce the exact error message
+        self.schema.validate(data)
+        logger.warning("Compiled schema rejected data which the schema library accepts")
+        return data
+
+
+_compiled_schemas = {}
+
+
+def compiled(schema: Schema) -> CompiledSchema:
+    """Returns the compiled version of a schema, compiling it on first use."""
+    compiled_schema = _compiled_schemas.get(id(schema))
+    if compiled_schema is None or compiled_schema.schema is not schema:
+        compiled_schema = CompiledSchema(schema)
+        _compiled_schemas[id(schema)] = compiled_schema
+    return compiled_schema
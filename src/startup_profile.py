@@ -0,0 +1,69 @@
+"""
+Startup instrumentation for the services.
+
+Records how long the startup phases of a node take (imports, config, MQTT connect, hardware
+init, first ready publish), measured from the start of the process.
+"""
+
+import logging
+import os
+import time
+from typing import List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process was started, from /proc (None where that is not available)."""
+    try:
+        with open('/proc/self/stat', 'r') as file:
+            # The command name may contain spaces, the fields after it are fixed
+            fields = file.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', 'r') as file:
+            uptime = float(file.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class StartupProfiler:
+    """
+    Collects the duration of consecutive startup phases.
+
+    Args:
+        enabled: Only an enabled profiler records and reports anything
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.phases: List[Tuple[str, float]] = []
+        self.reported = False
+
+        age = process_age() if enabled else None
+        self.start = time.monotonic() - (age if age is not None else 0.0)
+        self.last = self.start
+
+    def mark(self, phase: str):
+        """End the given phase (it started when the previous one ended)."""
+        if not self.enabled or self.reported:
+            return
+        now = time.monotonic()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def total(self) -> float:
+        return self.last - self.start
+
+    def summary(self) -> dict:
+        return {"phases": {phase: round(duration, 4) for phase, duration in self.phases},
+                "total": round(self.total(), 4)}
+
+    def report(self, service: str) -> Optional[dict]:
+        """Log the recorded phases once and return them as summary dict."""
+        if not self.enabled or self.reported:
+            return None
+        self.reported = True
+        phases = ", ".join(f"{phase} {duration * 1000:.0f} ms" for phase, duration in self.phases)
+        logger.info(f"Startup profile of {service}: {phases} (total {self.total() * 1000:.0f} ms)")
+        return self.summary()
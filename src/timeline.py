@@ -0,0 +1,49 @@
+"""
+Compiled scene timelines.
+
+A scene's ``timed_outputs`` list is compiled once into a sorted array of start times,
+so the active profile can be located with a bisect instead of a linear scan.
+"""
+
+import bisect
+from typing import List, Tuple
+
+
+class SceneTimeline:
+    """
+    Sorted, read-only view on the timed outputs of one scene.
+
+    A profile becomes active as soon as the elapsed scene time is strictly past its
+    ``start_time`` and stays active up to (and including) the start time of the next profile.
+    """
+
+    def __init__(self, timed_outputs: List[dict]):
+        # Stable sort, so profiles sharing a start time keep their config order
+        order = sorted(range(len(timed_outputs)), key=lambda i: timed_outputs[i]['start_time'])
+        self.start_times = [timed_outputs[i]['start_time'] for i in order]
+        self.output_indexes = order
+
+    def __len__(self):
+        return len(self.start_times)
+
+    def locate(self, elapsed: float) -> Tuple[int, float, float]:
+        """
+        Find the profile active at the given elapsed scene time.
+
+        Args:
+            elapsed: Seconds since the scene started
+
+        Returns:
+            Tuple (output_index, lower, upper): the index into ``timed_outputs`` (-1 if no profile
+            is active yet) and the elapsed time window (lower, upper] in which that stays true.
+        """
+        position = bisect.bisect_left(self.start_times, elapsed) - 1
+        lower = self.start_times[position] if position >= 0 else float('-inf')
+        upper = self.start_times[position + 1] if position + 1 < len(self.start_times) else float('inf')
+        output_index = self.output_indexes[position] if position >= 0 else -1
+        return output_index, lower, upper
+
+
+def compile_timelines(config: dict) -> List[SceneTimeline]:
+    """Compile the timelines of all scenes of a (validated) config, in scene order."""
+    return [SceneTimeline(scene['timed_outputs']) for scene in config['scenes']]
@@ -0,0 +1,78 @@
+"""
+Declarative publish policy per MQTT topic.
+
+Current-state topics are retained, so a (re)connecting node or webui converges right away,
+while high frequency ticks are sent fire-and-forget with a short MQTTv5 message expiry.
+"""
+
+from collections import namedtuple
+from typing import List, Optional, Tuple
+
+from paho.mqtt.client import topic_matches_sub
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+
+# expiry is the MQTTv5 message expiry interval in seconds (None keeps messages without expiry)
+TopicPolicy = namedtuple('TopicPolicy', ['qos', 'retain', 'expiry'])
+
+DEFAULT_POLICY = TopicPolicy(qos=1, retain=False, expiry=None)
+STATE = TopicPolicy(qos=1, retain=True, expiry=None)
+TICK = TopicPolicy(qos=0, retain=False, expiry=2)
+
+# Topic filters below base_topic, the first matching filter wins
+TOPIC_POLICY: List[Tuple[str, TopicPolicy]] = [
+    ("+/scene", STATE),
+    ("+/idle", STATE),
+    ("+/profile", STATE),
+    ("+/startup", STATE),
+    ("+/device/#", STATE),
+    ("videoplayer/scene_duration", STATE),
+    ("videoplayer/plan/#", STATE),
+    ("videoplayer/scene_remaining", TICK),
+    ("output/notify/#", STATE),
+    ("output/snapshot/#", STATE),
+    ("clock/#", TICK),
+    ("metrics/#", TopicPolicy(qos=0, retain=True, expiry=None)),
+]
+
+
+class TopicPolicies:
+    """
+    Resolves the publish arguments of a topic, cached per topic.
+
+    Args:
+        rules: (topic filter, TopicPolicy) pairs, the first matching filter wins
+        default: Policy of topics no filter matches
+        cache_size: Resolved topics kept before the cache is reset
+    """
+
+    def __init__(self, rules: List[Tuple[str, TopicPolicy]] = TOPIC_POLICY, default: TopicPolicy = DEFAULT_POLICY,
+                 cache_size: int = 1024):
+        self.rules = rules
+        self.default = default
+        self.cache = {}
+        self.cache_size = cache_size
+
+    def lookup(self, topic: str) -> TopicPolicy:
+        for topic_filter, policy in self.rules:
+            if topic_matches_sub(topic_filter, topic):
+                return policy
+        return self.default
+
+    def publish_args(self, topic: str) -> Tuple[int, bool, Optional[Properties]]:
+        """Returns (qos, retain, properties) for publishing on the topic (relative to base_topic)."""
+        try:
+            return self.cache[topic]
+        except KeyError:
+            pass
+
+        policy = self.lookup(topic)
+        properties = None
+        if policy.expiry is not None:
+            properties = Properties(PacketTypes.PUBLISH)
+            properties.MessageExpiryInterval = policy.expiry
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[topic] = (policy.qos, policy.retain, properties)
+        return self.cache[topic]
@@ -0,0 +1,59 @@
+"""
+Latency report of traced button presses and scene changes.
+
+Collects the hop events the nodes publish on trace/# for a while and prints the p50/p95/p99
+latency of every hop since the start of its trace. With --command it triggers the control
+command (e.g. next) itself in regular intervals.
+
+Usage: python src/trace_report.py [--seconds 60] [--command next --interval 5] (run from the repository root)
+"""
+
+import argparse
+import json
+import time
+
+import paho.mqtt.client as mqtt
+import yaml
+
+from tracing import LATENCY_BUDGET, TraceCollector, format_report, new_trace_id, with_trace
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--broker-config', default="config/broker.yaml", help="broker.yaml of the chair")
+    parser.add_argument('--seconds', type=float, default=60.0, help="how long to collect hop events")
+    parser.add_argument('--command', help="control command to send in intervals, e.g. next")
+    parser.add_argument('--interval', type=float, default=5.0, help="seconds between two commands")
+    parser.add_argument('--budget-ms', type=float, default=LATENCY_BUDGET * 1000, help="mark hops with a higher p95")
+    args = parser.parse_args()
+
+    with open(args.broker_config, 'r') as file:
+        broker = yaml.safe_load(file)
+    base_topic = broker['base_topic']
+    traces = TraceCollector()
+
+    def on_message(client, userdata, msg):
+        traces.add(msg.topic.rsplit('/', 1)[1], json.loads(msg.payload))
+
+    client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                         protocol=mqtt.MQTTProtocolVersion.MQTTv5)
+    if 'user' in broker and 'password' in broker:
+        client.username_pw_set(broker['user'], broker['password'])
+    client.on_message = on_message
+    client.connect(broker['host'], broker['port'])
+    client.subscribe(f"{base_topic}/trace/#")
+    client.loop_start()
+
+    end = time.monotonic() + args.seconds
+    while time.monotonic() < end:
+        if args.command:
+            client.publish(f"{base_topic}/control", args.command, qos=1,
+                           properties=with_trace(None, new_trace_id()))
+        time.sleep(min(args.interval, max(end - time.monotonic(), 0)))
+    client.loop_stop()
+
+    print(format_report(traces.report(), budget=args.budget_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
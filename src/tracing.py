@@ -0,0 +1,102 @@
+"""
+End-to-end latency tracing.
+
+Control, scene and plan messages carry a trace ID in an MQTTv5 user property. Every node that
+handles a traced message publishes the hop and its time on the shared scene clock to
+``trace/<node>``, TraceCollector turns these events into per hop latency percentiles.
+"""
+
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+
+TRACE_PROPERTY = "trace"
+
+# Responsiveness budget from a button press to the applied outputs, in seconds
+LATENCY_BUDGET = 0.1
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def with_trace(properties: Optional[Properties], trace_id: str) -> Properties:
+    """Publish properties carrying the trace ID, keeping the message expiry of the given properties."""
+    traced = Properties(PacketTypes.PUBLISH)
+    if properties is not None and hasattr(properties, 'MessageExpiryInterval'):
+        traced.MessageExpiryInterval = properties.MessageExpiryInterval
+    traced.UserProperty = (TRACE_PROPERTY, trace_id)
+    return traced
+
+
+def trace_id_of(msg) -> Optional[str]:
+    """Trace ID of a received message or None if it is not traced."""
+    properties = getattr(msg, 'properties', None)
+    for name, value in getattr(properties, 'UserProperty', ()):
+        if name == TRACE_PROPERTY:
+            return value
+    return None
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class TraceCollector:
+    """
+    Hop events of the most recent traces.
+
+    Args:
+        max_traces: Traces kept, the oldest ones are dropped first
+    """
+
+    def __init__(self, max_traces: int = 500):
+        self.max_traces = max_traces
+        self.lock = threading.Lock()
+        self.traces: Dict[str, Dict[str, float]] = OrderedDict()
+
+    def add(self, node: str, event: dict):
+        """Add a hop event {"trace": id, "hop": name, "t": shared time} published by a node."""
+        with self.lock:
+            hops = self.traces.get(event['trace'])
+            if hops is None:
+                hops = self.traces[event['trace']] = {}
+                if len(self.traces) > self.max_traces:
+                    self.traces.popitem(last=False)
+            # Only the first occurrence of a hop counts (e.g. the first applied profile)
+            hops.setdefault(f"{node}:{event['hop']}", event['t'])
+
+    def report(self) -> List[dict]:
+        """
+        Latency of every hop since the first event of its trace.
+
+        Returns:
+            Rows {"hop", "count", "p50", "p95", "p99"} in seconds, ordered by their median
+        """
+        latencies: Dict[str, List[float]] = {}
+        with self.lock:
+            for hops in self.traces.values():
+                origin = min(hops.values())
+                for hop, timestamp in hops.items():
+                    latencies.setdefault(hop, []).append(timestamp - origin)
+
+        rows = [{"hop": hop, "count": len(values), "p50": percentile(values, 0.5),
+                 "p95": percentile(values, 0.95), "p99": percentile(values, 0.99)}
+                for hop, values in latencies.items()]
+        return sorted(rows, key=lambda row: row['p50'])
+
+
+def format_report(rows: List[dict], budget: float = LATENCY_BUDGET) -> str:
+    """Plain text table of a TraceCollector report, hops over the budget (p95) are marked."""
+    lines = [f"{'hop':32s} {'count':>6s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}"]
+    for row in rows:
+        marker = "  over budget" if row['p95'] > budget else ""
+        lines.append(f"{row['hop']:32s} {row['count']:6d} {row['p50'] * 1000:9.1f} {row['p95'] * 1000:9.1f} "
+                     f"{row['p99'] * 1000:9.1f}{marker}")
+    return "\n".join(lines)
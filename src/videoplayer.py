@@ -1,12 +1,17 @@
+import json
 import time
 
+from metrics import registry as metrics
 from piexpchair import PiExpChair
+from scene_plan import OUTPUT_OWNERS, build_idle_plan, build_scene_plan
 
 import os
 import socket
 
 
 class VideoPlayer(PiExpChair):
+    clock_master = True
+
     def __init__(self):
         super().__init__(identifier="videoplayer")
 
@@ -78,9 +83,16 @@ class VideoPlayer(PiExpChair):
             if scene_file:
                 current_file = os.path.join(self.config['videoplayer']['media_path'], scene_file)
                 self.send_vlc_command("enqueue " + current_file)
-        self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/idle", True, qos=1)
-        self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/scene_duration", 0, qos=1)
-        self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/scene_remaining", 0, qos=1)
+        self.publish_plans(build_idle_plan, self.config, time.monotonic(), trace_id=self.current_trace)
+        self.publish_idle_state(trace_id=self.current_trace)
+        self.publish(f"{self.mqtt_path_identifier}/scene_duration", 0)
+        self.publish(f"{self.mqtt_path_identifier}/scene_remaining", 0)
+
+    def publish_plans(self, build_plan, *args, trace_id=None):
+        """Publish the (retained) plan of the scene or idle animation to every output node."""
+        for node, output_keys in OUTPUT_OWNERS.items():
+            plan = build_plan(*args, output_keys, master=self.clock_identity)
+            self.publish(f"{self.mqtt_path_identifier}/plan/{node}", json.dumps(plan), trace_id=trace_id)
 
     def stop_videoplayer(self):
         self.logger.info("Stopping video player")
@@ -88,6 +100,7 @@ class VideoPlayer(PiExpChair):
 
     def send_vlc_command(self, command):
         client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        command_start = time.perf_counter()
         try:
             self.logger.debug(f"Send VLC command: {command}")
             client_socket.connect(self.config['videoplayer']['rc_socket'])
@@ -105,6 +118,7 @@ class VideoPlayer(PiExpChair):
                 client_socket.close()
             except Exception:
                 pass  # Ignore errors during socket cleanup
+            metrics.observe("vlc_command_seconds", time.perf_counter() - command_start, command=command.split(' ', 1)[0])
 
     def play_scene(self, scene_index):
         if scene_index >= len(self.config['scenes']):
@@ -129,22 +143,30 @@ class VideoPlayer(PiExpChair):
             self.logger.debug(f"Play python scene: {self.current_scene_index} (vlc playlist index: {playlist_position})")
 
             current_file = os.path.join(self.config['videoplayer']['media_path'], scene_file)
-            self.next_scene_timeout = time.time() + current_scene['duration']
+            scene_start = time.monotonic()
+            self.next_scene_timeout = scene_start + current_scene['duration']
 
             self.logger.debug(f"Publishing scene {current_scene['name']} to MQTT")
-            self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/scene", self.current_scene_index, qos=1)
-            self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/scene_duration", current_scene['duration'], qos=1)
+            trace_id = self.current_trace
+            self.publish_plans(build_scene_plan, self.config, self.current_scene_index, scene_start, trace_id=trace_id)
+            # The start on the shared timebase lets the output nodes compensate their delivery latency
+            self.publish(f"{self.mqtt_path_identifier}/scene_start",
+                         json.dumps({"scene": self.current_scene_index, "start": scene_start,
+                                     "duration": current_scene['duration'], "master": self.clock_identity}))
+            self.publish_scene_state(self.current_scene_index, trace_id=trace_id)
+            self.publish(f"{self.mqtt_path_identifier}/scene_duration", current_scene['duration'])
 
             self.logger.debug(f"Playing video file {os.path.abspath(current_file)} for scene {current_scene['name']}")
             self.send_vlc_command("goto %d" % playlist_position)
             self.send_vlc_command("play")
+            self.record_trace(trace_id, "vlc_started")
 
     def play_single(self, scene_index):
         if 0 <= scene_index < len(self.config['scenes']):
             self.logger.info(f"Playing single scene at index {scene_index}")
             self.play_scene(scene_index)
             # Set a flag to indicate we want to return to idle after this scene
-            self.next_scene_timeout = time.time() + self.config['scenes'][scene_index]['duration']
+            self.next_scene_timeout = time.monotonic() + self.config['scenes'][scene_index]['duration']
             self.return_to_idle = True
 
             # Note: The actual file handling is done in play_scene() above
@@ -189,7 +211,7 @@ class VideoPlayer(PiExpChair):
     def module_run(self):
         # Handle scene transitions
         if self.next_scene_timeout > 0:
-            now = time.time()
+            now = time.monotonic()
             if now >= self.next_scene_timeout:
                 self.logger.debug("Play next video callback")
                 self.next_scene_timeout = 0
@@ -200,7 +222,16 @@ class VideoPlayer(PiExpChair):
             elif now - self.last_remaining_publish_time >= 1.0:
                 self.last_remaining_publish_time = now
                 remaining = int(self.next_scene_timeout - now)
-                self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/scene_remaining", remaining, qos=1)
+                self.publish(f"{self.mqtt_path_identifier}/scene_remaining", remaining)
+
+            # Wake up for the end of the scene and the next remaining tick
+            if self.next_scene_timeout > 0:
+                self.scheduler.schedule(self.next_scene_timeout)
+                self.scheduler.schedule(self.last_remaining_publish_time + 1.0)
+
+    def on_control_message(self, payload, msg):
+        self.record_trace(self.current_trace, "control_received")
+        super().on_control_message(payload, msg)
 
     def on_connect(self, client, userdata, flags, reason_code, properties):
         super().on_connect(client, userdata, flags, reason_code, properties)
@@ -3,6 +3,8 @@ from functools import wraps
 from flask import Flask, request, render_template, redirect, url_for, jsonify, Response, session
 import os
 from piexpchair import PiExpChair, check_config_for_webui, config_schema, read_config
+from metrics import registry as metrics, render_prometheus
+from tracing import LATENCY_BUDGET
 import time
 import datetime
 import secrets
@@ -100,23 +102,25 @@ def index():
     if result:
         current_config_content = read_config('config/config.yaml', pxc.logger, config_schema)
         alert_message = None
-        extracted_scenes = []
         last_idle = 0.0
         last_scene_date = 0.0
         last_scene_index = 0
-        for topic in pxc.last_messages.keys():
-            if topic == f"{pxc.mqtt_config['base_topic']}/videoplayer/scene":
-                for date in pxc.last_messages[topic]:
-                    extracted_scenes.append((date, pxc.last_messages[topic][date]))
-            if topic == f"{pxc.mqtt_config['base_topic']}/videoplayer/idle":
-                for date in pxc.last_messages[topic]:
-                    last_idle = date
-
-        for date, scene_index in reversed(extracted_scenes):
-            last_scenes[date] = current_config_content['scenes'][int(scene_index)]['name']
-            if date > last_scene_date:
-                last_scene_date = date
-                last_scene_index = int(scene_index)
+        scene_topic = f"{pxc.mqtt_config['base_topic']}/videoplayer/scene"
+        idle_topic = f"{pxc.mqtt_config['base_topic']}/videoplayer/idle"
+
+        for record in pxc.last_messages.history(scene_topic):
+            # Empty payloads clear the retained scene when the videoplayer goes idle
+            if not record.payload:
+                continue
+            last_scenes[record.timestamp] = current_config_content['scenes'][int(record.payload)]['name']
+
+        latest_scene = pxc.last_messages.latest(scene_topic)
+        if latest_scene and latest_scene.payload:
+            last_scene_date = latest_scene.timestamp
+            last_scene_index = int(latest_scene.payload)
+        latest_idle = pxc.last_messages.latest(idle_topic)
+        if latest_idle and latest_idle.payload:
+            last_idle = latest_idle.timestamp
 
         if last_idle > last_scene_date:
             current_scene = "Idle"
@@ -147,7 +151,9 @@ def status():
 
     return render_template('status.html',
                            config_content=current_config_content,
-                           mqtt_messages=pxc.last_messages,
+                           mqtt_messages=pxc.last_messages.snapshot(),
+                           mqtt_history_depth=pxc.last_messages.depth,
+                           output_states=pxc.output_states.snapshot(),
                            alert_message=alert_message)
 
 @app.route('/config')
@@ -251,17 +257,15 @@ def get_current_scene():
     idle_topic = f"{mqtt_base_topic}/videoplayer/idle"
 
     # Get last scene info
-    if scene_topic in pxc.last_messages:
-        for date in pxc.last_messages[scene_topic]:
-            if date > last_scene_date:
-                last_scene_date = date
-                last_scene_index = int(pxc.last_messages[scene_topic][date])
+    latest_scene = pxc.last_messages.latest(scene_topic)
+    if latest_scene and latest_scene.payload:
+        last_scene_date = latest_scene.timestamp
+        last_scene_index = int(latest_scene.payload)
 
     # Get last idle info
-    if idle_topic in pxc.last_messages:
-        for date in pxc.last_messages[idle_topic]:
-            if date > last_idle:
-                last_idle = date
+    latest_idle = pxc.last_messages.latest(idle_topic)
+    if latest_idle and latest_idle.payload:
+        last_idle = latest_idle.timestamp
 
     # Determine current state
     if last_idle > last_scene_date:
@@ -354,6 +358,21 @@ def save_config():
         file.write(new_config_content)
     return redirect(url_for("index"))
 
+@app.route('/latency')
+@requires_auth
+def latency():
+    return render_template('latency.html',
+                           rows=pxc.traces.report(),
+                           trace_count=len(pxc.traces.traces),
+                           budget=LATENCY_BUDGET)
+
+# Metrics of all nodes in the Prometheus text format (no auth required, for scrapers)
+@app.route('/metrics')
+def prometheus_metrics():
+    summaries = dict(pxc.node_metrics)
+    summaries[pxc.mqtt_path_identifier] = metrics.summary()
+    return Response(render_prometheus(summaries), mimetype='text/plain; version=0.0.4')
+
 # Filters
 @app.template_filter('strftime')
 def _filter_datetime(timestamp, format=None):
@@ -365,5 +384,7 @@ def _filter_datetime(timestamp, format=None):
 if __name__ == '__main__':
     pxc = PiExpChair()
     pxc.__init__(subscribe_to_everything=True, identifier="webui")
+    # Receive the messages of the other nodes (status page, outputs, metrics)
+    pxc.mqtt_client.loop_start()
     pxc.logger.info(f"Starting flask app in {app.root_path}")
     app.run(debug=os.getenv('DEBUG', False), host="0.0.0.0")
\ No newline at end of file
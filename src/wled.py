@@ -1,8 +1,12 @@
+from metrics import registry as metrics
 from piexpchair import PiExpChair
 import json
+import paho.mqtt.client as mqtt
 
 
 class WLEDController(PiExpChair):
+    follows_videoplayer = True
+
     def __init__(self):
         super().__init__(identifier="wled")
 
@@ -32,7 +36,10 @@ class WLEDController(PiExpChair):
         if 'wled_outputs' in current_outputs:
             for device in self.wled_devices:
                 device_output = {"on": True, "transition": self.wled_transistion, "seg": []}
+                changed_strips = {}
                 for strip, macro_name in current_outputs['wled_outputs'].items():
+                    if not self.output_changed(f"{device}/{strip}", macro_name):
+                        continue
                     macro = self.wled_macros[macro_name]
                     colors = self.wled_colors[macro['color']]
                     strip_output = {"id": strip, "on": macro['strip_on'], "bri": macro['brightness'],
@@ -40,57 +47,33 @@ class WLEDController(PiExpChair):
                                     "tt": self.wled_transistion, "transition": self.wled_transistion,
                                     "col": colors, "pal": 0}
                     device_output['seg'].append(strip_output)
+                    changed_strips[f"{device}/{strip}"] = macro_name
                     self.logger.debug(f"WLED should to set strip {strip} to macro {macro}")
                     self.output_notify(f"{device}/{strip}/bri",  macro['brightness'])
 
+                if not changed_strips:
+                    self.logger.debug(f"All strips of WLED device {device} are already up to date")
+                    continue
+
                 self.logger.debug(f"Sending WLED command over MQTT for {device}")
-                self.mqtt_client.publish(f"wled/{device}/api", json.dumps(device_output))
+                result = self.mqtt_client.publish(f"wled/{device}/api", json.dumps(device_output))
+                metrics.inc("mqtt_messages_sent_total", topic=f"wled/{device}/api")
+                for name, macro_name in changed_strips.items():
+                    if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                        self.confirm_output(name, macro_name)
+                    else:
+                        self.forget_output(name)
 
     def output_set(self, name, value):
         device, strip, element = name.split("/")
         self.logger.info(f"Setting {element} on strip {strip} and device {device} to {value}")
         device_output = {"on": True, "transition": self.wled_transistion, "seg": [{"id": int(strip), element: int(value)}]}
         self.mqtt_client.publish(f"wled/{device}/api", json.dumps(device_output), qos=1)
+        metrics.inc("mqtt_messages_sent_total", topic=f"wled/{device}/api")
+        # The strip no longer matches a macro, the next profile sends it again
+        self.forget_output(f"{device}/{strip}")
         self.output_notify(f"{device}/{strip}/{element}", value)
 
-    def on_connect(self, client, userdata, flags, reason_code, properties):
-        super().on_connect(client, userdata, flags, reason_code, properties)
-        self.mqtt_subscribe(client, "videoplayer/#")
-
-    def on_message(self, client, userdata, msg):
-        super().on_message(client, userdata, msg)
-
-        try:
-            if msg.topic == f"{self.mqtt_config['base_topic']}/videoplayer/scene":
-                payload = msg.payload.decode()
-                if payload == "":
-                    self.logger.info("Received play no scene command")
-                else:
-                    try:
-                        self.current_scene_index = int(payload)
-                        if 0 <= self.current_scene_index < len(self.config['scenes']):
-                            self.logger.info(f"Received scene index {self.current_scene_index} to play")
-                            self.play_scene(True)
-                            self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/scene", self.current_scene_index, qos=1)
-                        else:
-                            self.logger.warning(f"Received out-of-range scene index: {self.current_scene_index} (valid: 0-{len(self.config['scenes'])-1})")
-                    except ValueError as e:
-                        self.logger.error(f"Invalid scene index format: '{payload}': {e}")
-
-            elif msg.topic == f"{self.mqtt_config['base_topic']}/videoplayer/idle":
-                self.logger.info("Received idle scene command")
-                self.mqtt_client.publish(f"{self.mqtt_config['base_topic']}/{self.mqtt_path_identifier}/idle", True, qos=1)
-                self.set_idle_outputs()
-
-        except UnicodeDecodeError as e:
-            self.logger.error(f"Failed to decode videoplayer message payload on topic {msg.topic}: {e}")
-        except Exception as e:
-            self.logger.error(f"Error processing videoplayer message on topic {msg.topic}: {type(e).__name__}: {e}", exc_info=True)
-
-    def play_scene(self, scene_index):
-        # Reset output magic
-        self.check_for_output_change(start=True)
-
     def module_run(self):
         self.handle_output_change()
 